@@ -49,6 +49,7 @@ from setup_app.test_data_loader import TestDataLoader
 from setup_app.utils.properties_utils import propertiesUtils
 from setup_app.utils.setup_utils import SetupUtils
 from setup_app.utils.collect_properties import CollectProperties
+from setup_app.utils.db_utils import dbUtils
 
 from setup_app.installers.jans import JansInstaller
 from setup_app.installers.httpd import HttpdInstaller
@@ -175,7 +176,7 @@ if Config.installed_instance:
     if not argsp.shell:
         propertiesUtils.promptForProperties()
 
-        if not (argsp.t or argsp.x) and not Config.addPostSetupService:
+        if not (argsp.t or argsp.x or argsp.rdbm_roll_partitions) and not Config.addPostSetupService:
             print("No service was selected to install. Exiting ...")
             sys.exit()
 
@@ -201,6 +202,13 @@ if not argsp.t and argsp.x and argsp.load_config_api_test:
     configApiInstaller.load_test_data()
     print_or_log("Test data loaded. Exiting ...")
 
+if argsp.rdbm_roll_partitions:
+    print_or_log("Rolling RDBM partitions forward")
+    rdbmInstaller.dbUtils.bind()
+    rdbmInstaller.roll_partitions()
+    print_or_log("Partitions rolled. Exiting ...")
+    sys.exit()
+
 if argsp.x:
     print("Exiting ...")
     sys.exit()
@@ -353,6 +361,13 @@ def do_installation():
         for m in Config.post_messages:
             print(m)
 
+        import_summary = dbUtils.import_stats.dump()
+        if import_summary:
+            print(import_summary)
+
+        if hasattr(dbUtils, 'entry_cache'):
+            base.logIt("Entry cache statistics: {}".format(dbUtils.entry_cache.stats()))
+
     except:
 
         base.logIt("FATAL", True, True)
@@ -147,6 +147,8 @@ class Config:
         self.rdbm_install = False
         
         self.couchbase_buckets = []
+        self.cb_bulk_upsert = True
+        self.cb_upsert_max_statement_size = 1048576
         
         #rdbm
         self.rdbm_install_type = InstallTypes.NONE
@@ -157,6 +159,35 @@ class Config:
         self.rdbm_user = None
         self.rdbm_password = None
         self.static_rdbm_dir = os.path.join(self.install_dir, 'static/rdbm')
+        self.rdbm_bulk_import = True
+        self.rdbm_import_batch_size = 1000
+        self.import_workers = base.current_number_of_cpu
+        # ldif files are imported with import_workers only when enabled
+        self.parallel_import = False
+        # entries of a table are imported in chunks of this size by parallel import workers
+        self.import_chunk_size = 1000
+        self.compile_ldif = False
+        self.entry_cache_size = 1024
+        self.entry_cache_ttl = 300
+        self.search_page_size = 1000
+        self.index_workers = min(4, self.import_workers)
+        # pool sizes follow import_workers when not set
+        self.rdbm_pool_size = None
+        self.rdbm_pool_max_overflow = 10
+        self.rdbm_pool_pre_ping = True
+        self.rdbm_pool_recycle = 3600
+        self.ldap_pool_size = None
+        self.ldap_pool_active = 2
+        self.ldap_pool_exhaust = 60
+        self.ldap_connect_timeout = 10
+        # range partitioning of high churn tables, see TablePartitioner
+        self.rdbm_partition = False
+        # entries of these tables always have rdbm_partition_column, it is in primary key
+        self.rdbm_partition_tables = ['jansToken', 'jansSessId', 'jansCache']
+        self.rdbm_partition_column = 'exp'
+        self.rdbm_partition_days = 1
+        self.rdbm_partition_ahead = 7
+        self.rdbm_partition_keep_days = 1
 
         #spanner
         self.spanner_project = 'jans-project'
@@ -164,6 +195,10 @@ class Config:
         self.spanner_database = 'jansdb' 
         self.spanner_emulator_host = None
         self.google_application_credentials = None
+        self.spanner_bulk_write = True
+        self.spanner_max_mutations = 20000
+        self.spanner_pool_size = 10
+        self.spanner_ddl_batch_size = 100
 
         # Jans components installation status
         self.loadData = True
@@ -253,6 +288,8 @@ class Config:
         self.ldap_user_home = self.ldapBaseFolder
         self.ldapPassFn = os.path.join(self.ldap_user_home, '.pw')
         self.ldap_backend_type = 'je'
+        self.ldap_bulk_add = True
+        self.ldap_bulk_window = 64
 
         self.jansScriptFiles = [
                             os.path.join(self.install_dir, 'static/scripts/logmanager.sh'),
@@ -109,7 +109,7 @@ class AdminUIInstaller(SetupUtils, BaseInstaller):
         result = self.dbUtils.dn_exists(admin_dn)
         if result and not 'jansAdminUIRole' in result:
             if backend_location == BackendTypes.LDAP:
-                ldap_operation_result = self.dbUtils.ldap_conn.modify(
+                ldap_operation_result = self.dbUtils.ldap_modify(
                     admin_dn,
                     {'jansAdminUIRole': [ldap3.MODIFY_ADD, 'api-admin']})
                 self.dbUtils.log_ldap_result(ldap_operation_result)
@@ -74,14 +74,17 @@ class CouchbaseInstaller(PackageUtils, BaseInstaller):
         couchbase_mappings = self.getMappingType('couchbase')
 
         if Config.mappingLocations['default'] == 'couchbase':
-            self.dbUtils.import_ldif(Config.couchbaseBucketDict['default']['ldif'], Config.couchbase_bucket_prefix)
+            if Config.compile_ldif:
+                self.dbUtils.import_ldif_compiled(Config.couchbaseBucketDict['default']['ldif'], Config.couchbase_bucket_prefix, backend_location=BackendTypes.COUCHBASE)
+            else:
+                self.dbUtils.import_ldif_parallel(Config.couchbaseBucketDict['default']['ldif'], Config.couchbase_bucket_prefix)
         else:
             self.dbUtils.import_ldif([Config.ldif_base], force=BackendTypes.COUCHBASE)
 
         for group in couchbase_mappings:
             bucket = '{}_{}'.format(Config.couchbase_bucket_prefix, group)
             if Config.couchbaseBucketDict[group]['ldif']:
-                self.dbUtils.import_ldif(Config.couchbaseBucketDict[group]['ldif'], bucket)
+                self.dbUtils.import_ldif_parallel(Config.couchbaseBucketDict[group]['ldif'], bucket)
 
         self.couchbaseProperties()
 
@@ -163,12 +166,13 @@ class CouchbaseInstaller(PackageUtils, BaseInstaller):
         #wait 1 second 
         time.sleep(1)
 
-    def exec_n1ql_query(self, query):
-        result = self.dbUtils.cbm.exec_query(query)
+    def exec_n1ql_query(self, query, params=None):
+        # index DDL can't be prepared, exec_prepared() runs it ad hoc
+        result = self.dbUtils.cbm.exec_prepared(query, params)
         if result.ok:
             self.logIt("Query execution was successful: {}".format(query))
         else:
-            self.logIt("Failed to execute query {}, reason:".format(query, result.text), errorLog=True)
+            self.logIt("Failed to execute query {}, reason: {}".format(query, result.text), errorLog=True)
 
     def couchbaseExecQuery(self, queryFile):
         self.logIt("Running Couchbase query from file " + queryFile)
@@ -78,7 +78,7 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
             if not Config.ldif_base in ldif_files:
                 self.dbUtils.import_ldif([Config.ldif_base], force=BackendTypes.LDAP)
 
-            self.dbUtils.import_ldif(ldif_files)
+            self.dbUtils.import_ldif_parallel(ldif_files)
 
             Config.pbar.progress(self.service_name, "OpenDJ post installation", False)
             if Config.wrends_install == InstallTypes.LOCAL:
@@ -235,16 +235,16 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
 
         for dn, attr, val, change_type in opendj_config:
             self.logIt("Changing OpenDJ Configuration for {}".format(dn))
-            self.dbUtils.ldap_conn.modify(
+            self.dbUtils.ldap_modify(
                     dn, 
                      {attr: [change_type, val]}
                     )
         #Create uniqueness for attrbiutes
         for attr, cn in (('mail', 'Unique mail address'), ('uid', 'Unique uid entry')):
             self.logIt("Creating OpenDJ uniqueness for {}".format(attr))
-            self.dbUtils.ldap_conn.add(
+            self.dbUtils.ldap_add(
                 'cn={},cn=Plugins,cn=config'.format(cn),
-                attributes={
+                {
                         'objectClass': ['top', 'ds-cfg-plugin', 'ds-cfg-unique-attribute-plugin'],
                         'ds-cfg-java-class': ['org.opends.server.plugins.UniqueAttributePlugin'],
                         'ds-cfg-enabled': ['true'],
@@ -313,7 +313,7 @@ class OpenDjInstaller(BaseInstaller, SetupUtils):
                             'ds-cfg-index-entry-limit': ['4000']
                             }
                     self.logIt("Creating Index {}".format(dn))
-                    self.dbUtils.ldap_conn.add(dn, attributes=entry)
+                    self.dbUtils.ldap_add(dn, entry)
 
 
     def prepare_opendj_schema(self):
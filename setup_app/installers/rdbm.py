@@ -6,13 +6,17 @@ import sqlalchemy
 import shutil
 
 from string import Template
+from collections import OrderedDict
 
-from setup_app.static import AppType, InstallOption
+from setup_app.static import AppType, InstallOption, BackendTypes
 from setup_app.config import Config
 from setup_app.utils import base
 from setup_app.static import InstallTypes
 from setup_app.installers.base import BaseInstaller
 from setup_app.utils.setup_utils import SetupUtils
+from setup_app.utils.index_builder import IndexBuilder
+from setup_app.utils.schema_diff import SchemaDiff, SchemaPlan
+from setup_app.utils.partitions import TablePartitioner
 
 
 class RDBMInstaller(BaseInstaller, SetupUtils):
@@ -40,7 +44,11 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
 
         self.create_tables(jans_schema_files)
         self.create_subtables()
+        if self.dbUtils.Base:
+            # tables were reflected before they were altered
+            self.dbUtils.rdm_automapper(force=True)
         self.import_ldif()
+        self.dbUtils.backfill_rev_parent_dn()
         self.create_indexes()
         self.rdbmProperties()
 
@@ -104,13 +112,12 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
 
         return data_type
 
-    def create_tables(self, jans_schema_files):
-        qchar = '`' if Config.rdbm_type in ('mysql', 'spanner') else '"'
-        tables = []
-        all_schema = {}
-        all_attribs = {}
-        column_add = 'COLUMN ' if Config.rdbm_type == 'spanner' else ''
-        alter_table_sql_cmd = 'ALTER TABLE %s{}%s ADD %s{};' % (qchar, qchar, column_add)
+    def get_schema_tables(self, jans_schema_files):
+        """Returns tables of schema files as OrderedDict of table: OrderedDict of column: data type"""
+        schema_tables = OrderedDict()
+        all_schema = OrderedDict()
+        all_attribs = OrderedDict()
+        char_type = 'STRING' if Config.rdbm_type == 'spanner' else 'VARCHAR'
 
         sub_tables_fn = os.path.join(Config.static_rdbm_dir, 'sub_tables.json')
         sub_tables = base.readJsonFile(sub_tables_fn)
@@ -129,7 +136,12 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                 continue
 
             sql_tbl_name = obj['names'][0]
-            sql_tbl_cols = []
+            sql_tbl_cols = OrderedDict([
+                    ('doc_id', self.get_sql_col_type('doc_id', sql_tbl_name)),
+                    ('objectClass', '{}(48)'.format(char_type)),
+                    ('dn', '{}(128)'.format(char_type)),
+                    ('rev_parent_dn', '{}(128)'.format(char_type)),
+                    ])
 
             attr_list = obj['may']
             if 'sql' in obj:
@@ -137,63 +149,129 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                 if 'includeObjectClass' in obj['sql']:
                     for incobjcls in obj['sql']['includeObjectClass']:
                         attr_list += all_schema[incobjcls]['may']
-            cols_ =[]
+
             for attrname in attr_list:
-                if attrname in cols_:
+                if attrname in sql_tbl_cols:
                     continue
 
                 if attrname in sub_tables.get(Config.rdbm_type).get(sql_tbl_name, []):
                     continue
 
-                cols_.append(attrname)
-                data_type = self.get_sql_col_type(attrname, sql_tbl_name)
+                sql_tbl_cols[attrname] = self.get_sql_col_type(attrname, sql_tbl_name)
 
-                col_def = '{0}{1}{0} {2}'.format(qchar, attrname, data_type)
-                sql_tbl_cols.append(col_def)
-
-            if self.dbUtils.table_exists(sql_tbl_name):
-                for tbl_col in sql_tbl_cols:
-                    sql_cmd = alter_table_sql_cmd.format(sql_tbl_name, tbl_col)
-                    self.dbUtils.exec_rdbm_query(sql_cmd)
-                    tables.append(sql_cmd)
-            else:
-                doc_id_type = self.get_sql_col_type('doc_id', sql_tbl_name)
-                if Config.rdbm_type == 'pgsql':
-                    sql_cmd = 'CREATE TABLE "{}" (doc_id {} NOT NULL UNIQUE, "objectClass" VARCHAR(48), dn VARCHAR(128), {}, PRIMARY KEY (doc_id));'.format(sql_tbl_name, doc_id_type, ', '.join(sql_tbl_cols))
-                if Config.rdbm_type == 'spanner':
-                    sql_cmd = 'CREATE TABLE `{}` (`doc_id` {} NOT NULL, `objectClass` STRING(48), dn STRING(128), {}) PRIMARY KEY (`doc_id`)'.format(sql_tbl_name, doc_id_type, ', '.join(sql_tbl_cols))
-                else:
-                    sql_cmd = 'CREATE TABLE `{}` (`doc_id` {} NOT NULL UNIQUE, `objectClass` VARCHAR(48), dn VARCHAR(128), {}, PRIMARY KEY (`doc_id`));'.format(sql_tbl_name, doc_id_type, ', '.join(sql_tbl_cols))
-                self.dbUtils.exec_rdbm_query(sql_cmd)
-                tables.append(sql_cmd)
+            schema_tables[sql_tbl_name] = sql_tbl_cols
 
         for attrname in all_attribs:
             attr = all_attribs[attrname]
-            if attr.get('sql', {}).get('add_table'):
-                data_type = self.get_sql_col_type(attrname, sql_tbl_name)
-                col_def = '{0}{1}{0} {2}'.format(qchar, attrname, data_type)
-                sql_cmd = alter_table_sql_cmd.format(attr['sql']['add_table'], col_def)
+            add_table = attr.get('sql', {}).get('add_table')
+            if add_table:
+                schema_tables.setdefault(add_table, OrderedDict())[attrname] = self.get_sql_col_type(attrname, add_table)
 
-                if Config.rdbm_type == 'spanner':
-                    req = self.dbUtils.spanner.create_table(sql_cmd.strip(';'))
-                else:
-                    self.dbUtils.exec_rdbm_query(sql_cmd)
-                tables.append(sql_cmd)
+        return schema_tables
+
+    def create_tables(self, jans_schema_files):
+        schema_tables = self.get_schema_tables(jans_schema_files)
+        self.schema_plan = SchemaDiff(self.dbUtils.table_catalog).compare(schema_tables)
+        self.partitioner = TablePartitioner(self.dbUtils)
+        tables = []
+
+        for sql_tbl_name, columns in self.schema_plan.tables.items():
+            tables.append(self.get_create_table_ddl(sql_tbl_name, columns))
+            if self.partitioner.is_partitioned(sql_tbl_name, columns):
+                tables += self.partitioner.get_partitions_ddl(sql_tbl_name)
+            self.dbUtils.table_catalog.add_table(sql_tbl_name, columns)
+
+        for sql_tbl_name, columns in self.schema_plan.columns.items():
+            tables += self.get_add_columns_ddl(sql_tbl_name, columns)
+            self.dbUtils.table_catalog.add_columns(sql_tbl_name, columns)
+
+        self.schema_plan.ddl += tables
+        self.write_migration_plan()
+
+        self.apply_ddl(tables)
 
         self.writeFile(os.path.join(self.output_dir, 'jans_tables.sql'), '\n'.join(tables))
 
+    def add_indexes_to_plan(self, indexes):
+        if not hasattr(self, 'schema_plan'):
+            self.schema_plan = SchemaPlan()
+        self.schema_plan.indexes += [ (index[0], index[1]) for index in indexes ]
+        self.write_migration_plan()
+
+    def write_migration_plan(self):
+        plan_str = self.schema_plan.format()
+        self.logIt(plan_str)
+        self.writeFile(os.path.join(self.output_dir, 'migration_plan.txt'), plan_str)
+
+    def get_create_table_ddl(self, sql_tbl_name, columns):
+        qchar = '`' if Config.rdbm_type in ('mysql', 'spanner') else '"'
+        partitioned = self.partitioner.is_partitioned(sql_tbl_name, columns)
+        # partition column of MySQL and PostgreSQL tables must be in primary key
+        primary_key = ['doc_id']
+        if partitioned and Config.rdbm_type != 'spanner':
+            primary_key.append(self.partitioner.column)
+
+        col_defs = []
+        for col_name, data_type in columns.items():
+            col_def = '{0}{1}{0} {2}'.format(qchar, col_name, data_type)
+            if col_name in primary_key:
+                col_def += ' NOT NULL' if Config.rdbm_type == 'spanner' or partitioned else ' NOT NULL UNIQUE'
+            col_defs.append(col_def)
+
+        partition_clause = self.partitioner.get_table_clause(sql_tbl_name) if partitioned else ''
+
+        if Config.rdbm_type == 'spanner':
+            return 'CREATE TABLE `{}` ({}) PRIMARY KEY (`doc_id`){}'.format(sql_tbl_name, ', '.join(col_defs), ', ' + partition_clause if partition_clause else '')
+
+        return 'CREATE TABLE {0}{1}{0} ({2}, PRIMARY KEY ({3})){4};'.format(
+                qchar,
+                sql_tbl_name,
+                ', '.join(col_defs),
+                ', '.join([ '{0}{1}{0}'.format(qchar, col_name) for col_name in primary_key ]),
+                ' ' + partition_clause if partition_clause else ''
+                )
+
+    def roll_partitions(self):
+        return TablePartitioner(self.dbUtils).roll_forward()
+
     def create_subtables(self):
 
         sub_tables_fn = os.path.join(Config.static_rdbm_dir, 'sub_tables.json')
         sub_tables = base.readJsonFile(sub_tables_fn)
+        ddl = []
 
         for subtable in sub_tables.get(Config.rdbm_type, {}):
             subtable_columns = []
             attrname, data_type = sub_tables['spanner'][subtable]
+            if self.dbUtils.table_exists('{}_{}'.format(subtable, attrname)):
+                continue
             sql_cmd = 'CREATE TABLE `{0}_{1}` (`doc_id` STRING(64) NOT NULL, `dict_doc_id` INT64, `{1}` {2}) PRIMARY KEY (`doc_id`, `dict_doc_id`), INTERLEAVE IN PARENT `{0}` ON DELETE CASCADE'.format(subtable, attrname, data_type)
-            self.dbUtils.spanner.create_table(sql_cmd)
             sql_cmd_index = 'CREATE INDEX `{0}_{1}Idx` ON `{0}_{1}` (`{1}`)'.format(subtable, attrname)
-            self.dbUtils.spanner.create_table(sql_cmd_index)
+            ddl += [sql_cmd, sql_cmd_index]
+            self.dbUtils.table_catalog.add_table('{}_{}'.format(subtable, attrname), ['doc_id', 'dict_doc_id', attrname])
+
+        self.apply_ddl(ddl)
+
+    def get_add_columns_ddl(self, sql_tbl_name, columns):
+        # columns is OrderedDict of column: data type, they are added with a single statement
+        qchar = '`' if Config.rdbm_type in ('mysql', 'spanner') else '"'
+        col_defs = [ '{0}{1}{0} {2}'.format(qchar, col_name, data_type) for col_name, data_type in columns.items() ]
+
+        if Config.rdbm_type == 'spanner':
+            # spanner allows one column per ALTER TABLE, they are applied in one update_ddl() call
+            return [ 'ALTER TABLE `{}` ADD COLUMN {}'.format(sql_tbl_name, col_def) for col_def in col_defs ]
+
+        return [ 'ALTER TABLE {0}{1}{0} {2};'.format(qchar, sql_tbl_name, ', '.join([ 'ADD COLUMN ' + col_def for col_def in col_defs ])) ]
+
+    def apply_ddl(self, ddl):
+        if not ddl:
+            return
+
+        if Config.rdbm_type == 'spanner':
+            self.dbUtils.spanner.update_ddl(ddl)
+        else:
+            for sql_cmd in ddl:
+                self.dbUtils.exec_rdbm_query(sql_cmd)
 
 
     def get_index_name(self, attrname):
@@ -231,7 +309,7 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                                     tblCls,
                                     attr_name
                                 )
-                        self.dbUtils.spanner.create_table(sql_cmd)
+                        indexes.append((tblCls, '{}_{}Idx'.format(tblCls, ind_name), sql_cmd))
 
                 for i, custom_index in enumerate(sql_indexes['__common__'].get(tblCls, {}).get('custom', [])):
                     sql_cmd = 'CREATE INDEX `{0}_custom_Idx{1}` ON `{0}` (`{2}`)'.format(
@@ -239,13 +317,26 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                                 i,
                                 custom_index
                                 )
-                    self.dbUtils.spanner.create_table(sql_cmd)
+                    indexes.append((tblCls, '{}_custom_Idx{}'.format(tblCls, i), sql_cmd))
 
+            existing = self.dbUtils.spanner.exec_sql("SELECT TABLE_NAME, INDEX_NAME FROM information_schema.indexes WHERE TABLE_SCHEMA = ''")
+            existing_indexes = set([ tuple(row) for row in existing.get('rows', []) ])
+            indexes = [ index for index in indexes if not index[:2] in existing_indexes ]
+
+            self.add_indexes_to_plan(indexes)
+
+            # all indexes are built with one schema change
+            self.apply_ddl([ sql_cmd for _, _, sql_cmd in indexes ])
 
         else:
+            index_builder = IndexBuilder(self.dbUtils)
+            qchar = '`' if Config.rdbm_type == 'mysql' else '"'
+
             for tblCls in self.dbUtils.Base.classes.keys():
                 tblObj = self.dbUtils.Base.classes[tblCls]()
                 tbl_fields = sql_indexes.get(tblCls, {}).get('fields', []) +  sql_indexes['__common__']['fields']
+                # index names are unique per schema in PostgreSQL, per table in MySQL
+                name_prefix = tblCls + '_' if Config.rdbm_type == 'pgsql' else ''
 
                 for attr in tblObj.__table__.columns:
                     if attr.name == 'doc_id':
@@ -259,55 +350,35 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
                         if attr.name in tbl_fields:
                             for i, ind_str in enumerate(sql_indexes['__common__']['JSON']):
                                 tmp_str = Template(ind_str)
-                                if Config.rdbm_type == 'mysql':
-                                    sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{2}_json_{3}`(({4}));'.format(
-                                            Config.rdbm_db,
-                                            tblCls,
-                                            ind_name,
-                                            i+1,
-                                            tmp_str.safe_substitute({'field':attr.name, 'data_type': data_type})
-                                            )
-                                    self.dbUtils.exec_rdbm_query(sql_cmd)
-                                elif Config.rdbm_type == 'pgsql':
-                                    sql_cmd ='CREATE INDEX ON "{}" (({}));'.format(
-                                            tblCls,
-                                            tmp_str.safe_substitute({'field':attr.name, 'data_type': data_type})
-                                            )
-                                    self.dbUtils.exec_rdbm_query(sql_cmd)
-
+                                index_builder.add(
+                                        tblCls,
+                                        '{}{}_json_{}'.format(name_prefix, ind_name, i+1),
+                                        '({})'.format(tmp_str.safe_substitute({'field':attr.name, 'data_type': data_type}))
+                                        )
 
                     elif attr.name in tbl_fields:
-                        if Config.rdbm_type == 'mysql':
-                            sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{1}_{2}` (`{3}`);'.format(
-                                        Config.rdbm_db,
-                                        tblCls,
-                                        ind_name,
-                                        attr.name
-                                    )
-                            self.dbUtils.exec_rdbm_query(sql_cmd)
-                        elif Config.rdbm_type == 'pgsql':
-                            sql_cmd = 'CREATE INDEX ON "{}" ("{}");'.format(
-                                        tblCls,
-                                        attr.name
+                        index_builder.add(
+                                tblCls,
+                                # PostgreSQL default name, indexes of former setups are found
+                                '{0}_{1}_idx'.format(tblCls, attr.name) if Config.rdbm_type == 'pgsql' else '{}_{}'.format(tblCls, ind_name),
+                                '{0}{1}{0}{2}'.format(
+                                    qchar,
+                                    attr.name,
+                                    # LIKE prefix lookups of subtree searches can't use default collation index
+                                    ' varchar_pattern_ops' if attr.name == 'rev_parent_dn' and Config.rdbm_type == 'pgsql' else ''
                                     )
-                            self.dbUtils.exec_rdbm_query(sql_cmd)
-
+                                )
 
                 for i, custom_index in enumerate(sql_indexes['__common__'].get(tblCls, {}).get('custom', [])):
-                    if Config.rdbm_type == 'mysql':
-                        sql_cmd = 'ALTER TABLE {0}.{1} ADD INDEX `{2}` (({3}));'.format(
-                                        Config.rdbm_db,
-                                        tblCls,
-                                        'custom_{}'.format(i+1),
-                                        custom_index
-                                    )
-                        self.dbUtils.exec_rdbm_query(sql_cmd)
-                    elif Config.rdbm_type == 'pgsql':
-                        sql_cmd = 'CREATE INDEX ON "{}" ("{}");'.format(
-                                    tblCls,
-                                    custom_index
-                                    )
-                        self.dbUtils.exec_rdbm_query(sql_cmd)
+                    index_builder.add(
+                            tblCls,
+                            '{}custom_{}'.format(name_prefix, i+1),
+                            '({})'.format(custom_index) if Config.rdbm_type == 'mysql' else '"{}"'.format(custom_index)
+                            )
+
+            indexes = index_builder.get_missing_indexes()
+            self.add_indexes_to_plan(indexes)
+            index_builder.build(indexes)
 
     def import_ldif(self):
         ldif_files = []
@@ -327,17 +398,20 @@ class RDBMInstaller(BaseInstaller, SetupUtils):
             ldif_files.remove(Config.ldif_site)
 
         Config.pbar.progress(self.service_name, "Importing ldif files to {}".format(Config.rdbm_type), False)
+        if Config.rdbm_type == 'mysql':
+            force = BackendTypes.MYSQL
+        elif Config.rdbm_type == 'pgsql':
+            force = BackendTypes.PGSQL
+        elif Config.rdbm_type == 'spanner':
+            force = BackendTypes.SPANNER
+
         if not Config.ldif_base in ldif_files:
-            if Config.rdbm_type == 'mysql':
-                force = BackendTypes.MYSQL
-            elif Config.rdbm_type == 'pgsql':
-                force = BackendTypes.PGSQL
-            elif Config.rdbm_type == 'spanner':
-                force = BackendTypes.SPANNER
             self.dbUtils.import_ldif([Config.ldif_base], force=force)
 
-
-        self.dbUtils.import_ldif(ldif_files)
+        if Config.compile_ldif:
+            self.dbUtils.import_ldif_compiled(ldif_files, backend_location=force)
+        else:
+            self.dbUtils.import_ldif_parallel(ldif_files)
 
     def server_time_zone(self):
         my_time_zone = str(datetime.datetime.now(datetime.timezone(datetime.timedelta(0))).astimezone().tzinfo)
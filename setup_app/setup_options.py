@@ -61,6 +61,8 @@ def get_setup_options():
             setupOptions['rdbm_user'] = base.argsp.rdbm_user
         if base.argsp.rdbm_password:
             setupOptions['rdbm_password'] = base.argsp.rdbm_password
+        if base.argsp.rdbm_partition:
+            setupOptions['rdbm_partition'] = True
 
         if base.argsp.spanner_project:
             setupOptions['spanner_project'] = base.argsp.spanner_project
@@ -160,6 +162,13 @@ def get_setup_options():
     if base.argsp.no_data:
         setupOptions['loadData'] = False
 
+    if base.argsp.import_workers:
+        setupOptions['import_workers'] = base.argsp.import_workers
+        setupOptions['parallel_import'] = base.argsp.import_workers > 1
+
+    if base.argsp.compile_ldif:
+        setupOptions['compile_ldif'] = True
+
     if base.argsp.remote_ldap:
         setupOptions['listenAllInterfaces'] = True
 
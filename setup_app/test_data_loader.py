@@ -152,7 +152,8 @@ class TestDataLoader(BaseInstaller, SetupUtils):
 
             base.current_app.RDBMInstaller.create_tables(jans_schema_json_files)
             if Config.rdbm_type != 'spanner': 
-                self.dbUtils.rdm_automapper()
+                # test data tables were created after reflection setup
+                self.dbUtils.rdm_automapper(force=True)
 
         self.writeFile(
             os.path.join(Config.outputFolder, 'test/jans-auth/server/config-oxauth-test.properties'),
@@ -287,7 +288,7 @@ class TestDataLoader(BaseInstaller, SetupUtils):
             self.copyFile(tmp_fn, openDjSchemaFolder)
             
             self.logIt("Making opndj listen all interfaces")
-            ldap_operation_result = self.dbUtils.ldap_conn.modify(
+            ldap_operation_result = self.dbUtils.ldap_modify(
                     'cn=LDAPS Connection Handler,cn=Connection Handlers,cn=config', 
                      {'ds-cfg-listen-address': [ldap3.MODIFY_REPLACE, '0.0.0.0']}
                     )
@@ -325,7 +326,7 @@ class TestDataLoader(BaseInstaller, SetupUtils):
                             'ds-cfg-index-entry-limit': ['4000']
                             }
                 self.logIt("Creating Index {}".format(dn))
-                ldap_operation_result = self.dbUtils.ldap_conn.add(dn, attributes=entry)
+                ldap_operation_result = self.dbUtils.ldap_add(dn, entry)
                 if not ldap_operation_result:
                     self.logIt("Ldap modify operation failed {}".format(str(self.dbUtils.ldap_conn.result)))
                     self.logIt("Ldap modify operation failed {}".format(str(self.dbUtils.ldap_conn.result)), True)
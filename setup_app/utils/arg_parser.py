@@ -36,6 +36,8 @@ def arg_parser():
     parser.add_argument('-rdbm-port', help="RDBM port")
     parser.add_argument('-rdbm-db', help="RDBM database")
     parser.add_argument('-rdbm-host', help="RDBM host")
+    parser.add_argument('--rdbm-partition', help="Create token, session and cache tables range partitioned by expiration", action='store_true')
+    parser.add_argument('--rdbm-roll-partitions', help="Create upcoming and drop expired partitions of RDBM tables and exit", action='store_true')
 
     parser.add_argument('--remote-couchbase', help="Enables using remote couchbase server", action='store_true')
     parser.add_argument('--local-couchbase', help="Enables installing couchbase server", action='store_true')
@@ -44,6 +46,8 @@ def arg_parser():
     parser.add_argument('-couchbase-bucket-prefix', help="Set prefix for couchbase buckets", default='jans')
 
     parser.add_argument('--no-data', help="Do not import any data to database backend, used for clustering", action='store_true')
+    parser.add_argument('-import-workers', help="Number of parallel workers used for importing ldif files, enables parallel import when greater than 1", type=int)
+    parser.add_argument('--compile-ldif', help="Compile ldif files to backend native bulk files and load them", action='store_true')
     parser.add_argument('--no-jsauth', help="Do not install OAuth2 Authorization Server", action='store_true')
     parser.add_argument('-ip-address', help="Used primarily by Apache httpd for the Listen directive")
     parser.add_argument('-host-name', help="Internet-facing FQDN that is used to generate certificates and metadata.")
@@ -1,6 +1,8 @@
 import os
 import datetime
 import zipfile
+
+from collections import namedtuple
 from setup_app import paths
 from setup_app.utils import base
 
@@ -16,9 +18,46 @@ syntaxType = {
 # collected types were dumped to opendj_types.json
 
 
+AttribInfo = namedtuple('AttribInfo', ['type', 'multivalued', 'converter'])
+
+
+def to_integer(val):
+    try:
+        return int(val)
+    except:
+        return val
+
+def to_datetime(val):
+    if not isinstance(val, datetime.datetime):
+
+        if '.' in val:
+            date_format = '%Y%m%d%H%M%S.%fZ'
+        else:
+            date_format = '%Y%m%d%H%M%SZ'
+
+        if not val.lower().endswith('z'):
+            val += 'Z'
+
+        val = datetime.datetime.strptime(val, date_format)
+
+    return val.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+def to_boolean(val):
+    if isinstance(val, bool):
+        return val
+    return val.lower() in ('true', 'yes', '1', 'on')
+
+# json values are kept as strings, callers decode them
+converters = {
+    'integer': to_integer,
+    'datetime': to_datetime,
+    'boolean': to_boolean,
+    }
+
+
 class AttribDataTypes:
 
-    listAttributes = ['member']
+    listAttributes = frozenset(['member'])
     attribTypes = {}
 
     def __init__(self):
@@ -33,6 +72,7 @@ class AttribDataTypes:
             self.attribTypes['json'] = []
 
         self.processJansSchema()
+        self.buildRegistry()
 
     def processJansSchema(self):
 
@@ -51,57 +91,43 @@ class AttribDataTypes:
             for name in attrib['names']:
                 self.attribTypes[atype].append(name)
 
+        listAttributes = set(self.listAttributes)
         for obj_type in ['objectClasses', 'attributeTypes']:
             for obj in jansSchema[obj_type]:
                 if obj.get('multivalued'):
-                    for name in obj['names']:
-                        if not name in self.listAttributes:
-                            self.listAttributes.append(name)
+                    listAttributes.update(obj['names'])
 
+        self.listAttributes = frozenset(listAttributes)
 
-    def getAttribDataType(self, attrib):
+    def buildRegistry(self):
+        # an attribute listed under several types gets the first one, as linear search did before
+        self.attribTypeIndex = {}
         for atype in self.attribTypes:
-            if attrib in self.attribTypes[atype]:
-                return atype
+            for name in self.attribTypes[atype]:
+                self.attribTypeIndex.setdefault(name, atype)
 
-        return 'string'
+        self.registry = {}
+        for name in set(self.attribTypeIndex).union(self.listAttributes):
+            self.registry[name] = self.makeAttribInfo(name)
 
-    def getTypedValue(self, dtype, val):
-        retVal = val
-        
-        if dtype == 'json':
-            try:
-                retVal = json.loads(val)
-            except Exception as e:
-                pass
-
-        if dtype == 'integer':
-            try:
-                retVal = int(retVal)
-            except:
-                pass
-        elif dtype == 'datetime':
-            if not isinstance(val, datetime.datetime):
-
-                if '.' in val:
-                    date_format = '%Y%m%d%H%M%S.%fZ'
-                else:
-                    date_format = '%Y%m%d%H%M%SZ'
-
-                if not val.lower().endswith('z'):
-                    val += 'Z'
-                
-                val = datetime.datetime.strptime(val, date_format)
+    def makeAttribInfo(self, attrib):
+        dtype = self.attribTypeIndex.get(attrib, 'string')
+        return AttribInfo(dtype, attrib in self.listAttributes, converters.get(dtype))
 
-            retVal = val.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    def getAttribInfo(self, attrib):
+        info = self.registry.get(attrib)
+        if info is None:
+            # attributes not in schema are strings, remember them too
+            info = self.registry[attrib] = self.makeAttribInfo(attrib)
+        return info
 
-        elif dtype == 'boolean':
-            if not isinstance(retVal, bool):
-                if retVal.lower() in ('true', 'yes', '1', 'on'):
-                    retVal = True
-                else:
-                    retVal = False
+    def getAttribDataType(self, attrib):
+        return self.getAttribInfo(attrib).type
 
-        return retVal
+    def getTypedValue(self, dtype, val):
+        converter = converters.get(dtype)
+        if converter:
+            return converter(val)
+        return val
 
 attribDataTypes = AttribDataTypes()
@@ -1,4 +1,9 @@
 import os
+import json
+import hashlib
+import threading
+import concurrent.futures
+from collections import deque
 import requests
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -20,11 +25,19 @@ class FakeResult:
 
 class CBM:
 
+    # only DML statements can be prepared
+    preparable_statements = ('SELECT', 'UPDATE', 'UPSERT', 'INSERT', 'DELETE', 'MERGE')
+    # prepared statement is not found on query node or its plan needs to be rebuilt
+    prepared_error_codes = (4040, 4050, 4060, 4070, 4080, 4090)
+
     def __init__(self, host, admin, password, port=18091, n1qlport=18093):
         self.host = host
         self.port = port
         self.n1qlport = n1qlport
         self.auth = HTTPBasicAuth(admin, password)
+        self.local = threading.local()
+        self.prepared = {}
+        self.prepared_lock = threading.Lock()
         self.set_api_root()
 
     def set_api_root(self):
@@ -96,11 +109,79 @@ class CBM:
         return ''
 
 
-    def exec_query(self, query):
-        logIt("Executing n1ql {}".format(query))
+    def get_session(self):
+        # one keep-alive session per thread, so TLS connections are reused
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+            self.local.session.auth = self.auth
+            self.local.session.verify = False
+        return self.local.session
+
+    def exec_query(self, query, log_query=True, params=None):
+        if log_query:
+            logIt("Executing n1ql {} {}".format(query, params or ''))
         data = {'statement': query}
-        result = requests.post(self.n1ql_api, data=data, auth=self.auth, verify=False)
-        self.logIfError(result)
+        if params:
+            # named parameters are referenced as $name in statement
+            for name, value in params.items():
+                data['$' + name] = json.dumps(value)
+        result = self.get_session().post(self.n1ql_api, data=data)
+        self.logIfError(result, log_query)
+        return result
+
+    def get_error_codes(self, result):
+        try:
+            return [ err.get('code') for err in result.json().get('errors', []) ]
+        except:
+            return []
+
+    def prepare(self, query):
+        with self.prepared_lock:
+            name = self.prepared.get(query)
+
+        if name:
+            return name
+
+        # name is derived from statement text, so the same template gets the same plan name
+        name = 'jans_{}'.format(hashlib.sha256(query.encode()).hexdigest()[:24])
+        result = self.exec_query('PREPARE `{}` FROM {}'.format(name, query))
+
+        if not result.ok and not 'already exists' in result.text:
+            return
+
+        with self.prepared_lock:
+            self.prepared[query] = name
+
+        return name
+
+    def exec_prepared(self, query, params=None, log_query=True):
+        """Executes query as a named prepared statement with $named parameters. Statement
+        is prepared once per template, statements that can't be prepared are executed ad hoc"""
+
+        if not query.lstrip().split(None, 1)[0].upper() in self.preparable_statements:
+            return self.exec_query(query, log_query, params)
+
+        for _ in range(2):
+            name = self.prepare(query)
+            if not name:
+                return self.exec_query(query, log_query, params)
+
+            if log_query:
+                logIt("Executing prepared n1ql {} ({}) {}".format(name, query, params or ''))
+
+            data = {'prepared': json.dumps(name)}
+            for pname, value in (params or {}).items():
+                data['$' + pname] = json.dumps(value)
+
+            result = self.get_session().post(self.n1ql_api, data=data)
+            if result.ok or not set(self.get_error_codes(result)).intersection(self.prepared_error_codes):
+                break
+
+            # query node lost the plan, prepare again
+            with self.prepared_lock:
+                self.prepared.pop(query, None)
+
+        self.logIfError(result, log_query)
         return result
 
     def test_connection(self):
@@ -177,17 +258,88 @@ class CBM:
         result = self._get('whoami')
         return result.json()
 
-    def logIfError(self, result):
+    def logIfError(self, result, log_result=True):
         try:
             js = result.json()
             if 'errors' in js:
                 msg = "Error executing query: {}".format(', '.join([err['msg'] for err in js['errors']]))
                 logIt(msg)
                 logIt(msg, True)
-            else:
+            elif log_result:
                 logIt("Query Result: {}".format(str(js)))
         except:
             pass
+
+
+class BulkUpserter:
+    """Packs documents into multi-value UPSERT statements and executes them concurrently.
+
+    At most max_pending statements are queued or running, submit() waits on the
+    oldest one before queuing more, so memory stays bounded on large imports.
+    Upserters of parallel import workers share the executor given by caller.
+    """
+
+    def __init__(self, cbm, max_statement_size=1048576, workers=4, max_pending=None, executor=None):
+        self.cbm = cbm
+        self.max_statement_size = max_statement_size
+        self.own_executor = executor is None
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending or workers * 2
+        self.pending = {}
+        self.futures = deque()
+        self.document_count = 0
+        self.statement_count = 0
+        self.errors = []
+
+    def upsert(self, bucket, key, document):
+        value = '({}, {})'.format(json.dumps(key), json.dumps(document))
+        values, size = self.pending.get(bucket, ([], 0))
+
+        if values and size + len(value) > self.max_statement_size:
+            self.submit(bucket)
+            values, size = [], 0
+
+        values.append(value)
+        self.pending[bucket] = (values, size + len(value) + 9)
+
+    def submit(self, bucket):
+        values, size = self.pending.pop(bucket, ([], 0))
+        if not values:
+            return
+
+        while len(self.futures) >= self.max_pending:
+            self.wait(*self.futures.popleft())
+
+        n1ql = 'UPSERT INTO `{}` (KEY, VALUE) VALUES {}'.format(bucket, ', VALUES '.join(values))
+        logIt("Upserting {} documents to bucket {}".format(len(values), bucket))
+        self.futures.append((self.executor.submit(self.cbm.exec_query, n1ql, False), bucket, len(values)))
+        self.document_count += len(values)
+        self.statement_count += 1
+
+    def wait(self, future, bucket, n):
+        try:
+            result = future.result()
+            if not result.ok:
+                self.errors.append("Upserting {} documents to {} failed: {}".format(n, bucket, result.text))
+        except Exception as e:
+            self.errors.append("Upserting {} documents to {} failed: {}".format(n, bucket, e))
+
+    def flush(self):
+        for bucket in list(self.pending.keys()):
+            self.submit(bucket)
+
+        while self.futures:
+            self.wait(*self.futures.popleft())
+
+        for error in self.errors:
+            logIt(error, True)
+        self.errors = []
+
+    def close(self):
+        if self.own_executor:
+            self.executor.shutdown()
+
+
 if __name__ == '__main__':
     hostname = raw_input('hostname: ')
     admin = raw_input('admin: ')
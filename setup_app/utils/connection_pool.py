@@ -0,0 +1,61 @@
+import queue
+import threading
+import contextlib
+
+from setup_app.utils import base
+
+
+class LdapConnectionPool:
+    """Bounded pool of bound ldap3 connections shared by import and indexing workers.
+
+    At most size connections are handed out at a time, acquire() blocks until
+    one is released. Released connections are kept open and reused, a connection
+    that was closed by the server is opened and bound again on next acquire.
+    """
+
+    def __init__(self, connect, size=4):
+        self.connect = connect
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections = []
+
+    def acquire(self, timeout=None):
+        if not self.slots.acquire(timeout=timeout):
+            raise TimeoutError("No LDAP connection was released in {} seconds".format(timeout))
+
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self.connect()
+            with self.lock:
+                self.connections.append(conn)
+        else:
+            if conn.closed or not conn.bound:
+                base.logIt("Rebinding pooled LDAP connection")
+                conn.bind()
+
+        return conn
+
+    def release(self, conn):
+        self.idle.put(conn)
+        self.slots.release()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections:
+                try:
+                    conn.unbind()
+                except Exception:
+                    pass
+            self.connections = []
+        self.idle = queue.LifoQueue()
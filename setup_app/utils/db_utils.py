@@ -1,11 +1,15 @@
 import warnings
 import sys
 import os
-import re
 import json
+import time
 import logging
 import copy
 import ldap3
+import concurrent.futures
+import contextlib
+import hashlib
+from collections import deque, OrderedDict
 import pymysql
 from ldap3.utils import dn as dnutils
 from pathlib import PurePath
@@ -17,8 +21,17 @@ from setup_app import static
 from setup_app.config import Config
 from setup_app.static import InstallTypes, BackendTypes, colors
 from setup_app.utils import base
-from setup_app.utils.cbm import CBM
+from setup_app.utils.cbm import CBM, BulkUpserter
+from setup_app.utils.ldif_compiler import LdifCompiler
+from setup_app.utils.import_stats import ImportStats
+from setup_app.utils.entry_cache import EntryCache
+from setup_app.utils.connection_pool import LdapConnectionPool
+from setup_app.utils.schema_index import SchemaIndex
+from setup_app.utils.table_reflector import TableReflector
+from setup_app.utils.table_catalog import TableCatalog
+from setup_app.utils.partitions import TablePartitioner
 from setup_app.utils import ldif_utils
+from setup_app.utils import ldap_filter
 from setup_app.utils.attributes import attribDataTypes
 from setup_app.utils.spanner import Spanner
 
@@ -28,7 +41,6 @@ sys.path.append(my_path.parent.joinpath('pylib/sqlalchemy'))
 
 import sqlalchemy
 import sqlalchemy.orm
-import sqlalchemy.ext.automap
 
 
 class DBUtils:
@@ -37,6 +49,19 @@ class DBUtils:
     Base = None
     session = None
     cbm = None
+    cb_upserter = None
+    ldap_bulk_conn = None
+    spanner_writer = None
+    write_executor = None
+    ldap_pool = None
+    engine = None
+
+    def __init__(self):
+        # mutable state is per instance, import workers are copies that share
+        # dn index and stats but collect their own bulk rows
+        self.rdbm_bulk_rows = {}
+        self.dn_index = {}
+        self.import_stats = ImportStats()
 
     def bind(self, use_ssl=True, force=False):
 
@@ -44,6 +69,15 @@ class DBUtils:
 
         base.logIt("Bind to database")
 
+        self.filter_compiler = ldap_filter.FilterCompiler(self)
+        self.table_partitioner = TablePartitioner(self)
+
+        if not hasattr(self, 'table_catalog') or force:
+            self.table_catalog = TableCatalog(self)
+
+        if not hasattr(self, 'entry_cache') or force:
+            self.entry_cache = EntryCache(int(Config.entry_cache_size), int(Config.entry_cache_ttl))
+
         if Config.mappingLocations['default'] == 'ldap':
             self.moddb = BackendTypes.LDAP
         elif Config.mappingLocations['default'] == 'rdbm':
@@ -62,14 +96,11 @@ class DBUtils:
             for group in Config.mappingLocations:
                 if Config.mappingLocations[group] == 'ldap':
                     base.logIt("Making LDAP Conncetion")
-                    ldap_server = ldap3.Server(Config.ldap_hostname, port=int(Config.ldaps_port), use_ssl=use_ssl)
-                    self.ldap_conn = ldap3.Connection(
-                                ldap_server,
-                                user=Config.ldap_binddn,
-                                password=Config.ldapPass,
-                                )
-                    base.logIt("Making LDAP Connection to host {}:{} with user {}".format(Config.ldap_hostname, Config.ldaps_port, Config.ldap_binddn))
-                    self.ldap_conn.bind()
+                    self.close_ldap_connections()
+                    self.use_ssl = use_ssl
+                    self.ldap_server_pool = self.get_ldap_server_pool()
+                    self.ldap_pool = LdapConnectionPool(self.get_ldap_connection, int(Config.ldap_pool_size or Config.import_workers))
+                    self.ldap_conn = self.get_ldap_connection()
                     break
 
         if not self.session or force:
@@ -85,6 +116,57 @@ class DBUtils:
         self.set_cbm()
         self.default_bucket = Config.couchbase_bucket_prefix
 
+    def get_ldap_server_pool(self):
+        # ldap_hostname may list several servers as host[:port],host[:port]
+        servers = []
+        for host in Config.ldap_hostname.split(','):
+            hostname, _, port = host.strip().partition(':')
+            servers.append(ldap3.Server(hostname, port=int(port or Config.ldaps_port), use_ssl=self.use_ssl, connect_timeout=int(Config.ldap_connect_timeout)))
+
+        # unreachable servers are skipped for ldap_pool_exhaust seconds
+        return ldap3.ServerPool(servers, ldap3.ROUND_ROBIN, active=int(Config.ldap_pool_active), exhaust=int(Config.ldap_pool_exhaust))
+
+    def get_ldap_connection(self, client_strategy=ldap3.SYNC):
+        if not getattr(self, 'ldap_server_pool', None):
+            self.ldap_server_pool = self.get_ldap_server_pool()
+
+        ldap_conn = ldap3.Connection(
+                    self.ldap_server_pool,
+                    user=Config.ldap_binddn,
+                    password=Config.ldapPass,
+                    client_strategy=client_strategy,
+                    )
+        base.logIt("Making LDAP Connection to host(s) {} with user {}".format(Config.ldap_hostname, Config.ldap_binddn))
+        ldap_conn.bind()
+        return ldap_conn
+
+    def close_ldap_connections(self):
+        if self.ldap_pool:
+            self.ldap_pool.close()
+            self.ldap_pool = None
+
+        if getattr(self, 'ldap_conn', None):
+            try:
+                self.ldap_conn.unbind()
+            except Exception:
+                pass
+
+    def get_session(self):
+        # sessions are not thread safe, every thread takes its own one and
+        # returns its connection to the engine pool with close()
+        return self.Session()
+
+    @contextlib.contextmanager
+    def session_scope(self):
+        session = self.get_session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
     def sqlconnection(self, log=True):
         base.logIt("Making {} Connection to {}:{}/{} with user {}".format(Config.rdbm_type.upper(), Config.rdbm_host, Config.rdbm_port, Config.rdbm_db, Config.rdbm_user))
@@ -103,13 +185,27 @@ class DBUtils:
         if Config.rdbm_type == 'mysql':
             bind_uri += '?charset=utf8mb4'
 
+        if self.engine:
+            # connections of previous bind are not reused
+            if self.session:
+                self.session.close()
+            self.engine.dispose()
+
         try:
-            self.engine = sqlalchemy.create_engine(bind_uri)
+            self.engine = sqlalchemy.create_engine(
+                            bind_uri,
+                            # one connection for the main session and one for each import worker
+                            pool_size=int(Config.rdbm_pool_size or int(Config.import_workers) + 1),
+                            max_overflow=int(Config.rdbm_pool_max_overflow),
+                            pool_pre_ping=Config.rdbm_pool_pre_ping,
+                            pool_recycle=int(Config.rdbm_pool_recycle),
+                            )
             logging.basicConfig(filename=os.path.join(Config.install_dir, 'logs/sqlalchemy.log'))
             logging.getLogger('sqlalchemy.engine').setLevel(logging.INFO)
-            Session = sqlalchemy.orm.sessionmaker(bind=self.engine)
-            self.session = Session()
+            self.Session = sqlalchemy.orm.sessionmaker(bind=self.engine)
+            self.session = self.Session()
             self.metadata = sqlalchemy.MetaData()
+            self.Base = None
             self.session.connection()
             base.logIt("{} Connection was successful".format(Config.rdbm_type.upper()))
             return True, self.session
@@ -127,17 +223,34 @@ class DBUtils:
         return self.sqlconnection(log)
 
     def read_jans_schema(self, others=[]):
-        self.jans_attributes = []
-
+        schema_files = []
         for schema_fn_ in ['jans_schema.json', 'custom_schema.json'] + others:
-            schema_fn = schema_fn_ if schema_fn_.startswith('/') else os.path.join(Config.install_dir, 'schema', schema_fn_)
-            schema = base.readJsonFile(schema_fn)
-            self.jans_attributes += schema['attributeTypes']
+            schema_files.append(schema_fn_ if schema_fn_.startswith('/') else os.path.join(Config.install_dir, 'schema', schema_fn_))
 
-        self.ldap_sql_data_type_mapping = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'ldap_sql_data_type_mapping.json'))
-        self.sql_data_types = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'sql_data_types.json'))
-        self.opendj_attributes_syntax = base.readJsonFile(os.path.join(Config.static_rdbm_dir, 'opendj_attributes_syntax.json'))
+        # each set of schema files has its own cache, test data schema does not invalidate the default one
+        files_key = hashlib.sha256('\n'.join(schema_files).encode()).hexdigest()[:12]
+        cache_fn = os.path.join(Config.outputFolder, 'schema_index_{}.json'.format(files_key))
+        self.schema_index = SchemaIndex(schema_files, Config.static_rdbm_dir, cache_fn)
 
+    @property
+    def jans_attributes(self):
+        return self.schema_index['jans_attributes']
+
+    @property
+    def objectclass_tables(self):
+        return self.schema_index['objectclass_tables']
+
+    @property
+    def ldap_sql_data_type_mapping(self):
+        return self.schema_index['ldap_sql_data_type_mapping']
+
+    @property
+    def sql_data_types(self):
+        return self.schema_index['sql_data_types']
+
+    @property
+    def opendj_attributes_syntax(self):
+        return self.schema_index['opendj_attributes_syntax']
 
     def exec_rdbm_query(self, query, getresult=False):
         base.logIt("Executing {} Query: {}".format(Config.rdbm_type, query))
@@ -161,6 +274,11 @@ class DBUtils:
         self.cbm = CBM(Config.get('cb_query_node'), Config.get('couchebaseClusterAdmin'), Config.get('cb_password'))
 
     def get_oxAuthConfDynamic(self):
+        cache_key = ('dn', 'ou=jans-auth,ou=configuration,o=jans', 'jansConfDyn')
+        cached_conf = self.entry_cache.get(cache_key)
+        if cached_conf:
+            return cached_conf
+
         if self.moddb == BackendTypes.LDAP:
             self.ldap_conn.search(
                         search_base='ou=jans-auth,ou=configuration,o=jans',
@@ -178,12 +296,14 @@ class DBUtils:
             oxAuthConfDynamic = json.loads(result['jansConfDyn'])
 
         elif self.moddb == BackendTypes.COUCHBASE:
-            n1ql = 'SELECT * FROM `{}` USE KEYS "configuration_jans-auth"'.format(self.default_bucket)
-            result = self.cbm.exec_query(n1ql)
+            n1ql = 'SELECT * FROM `{}` USE KEYS $key'.format(self.default_bucket)
+            result = self.cbm.exec_prepared(n1ql, {'key': 'configuration_jans-auth'})
             js = result.json()
             dn = js['results'][0][self.default_bucket]['dn']
             oxAuthConfDynamic = js['results'][0][self.default_bucket]['jansConfDyn']
 
+        self.entry_cache.put(cache_key, (dn, oxAuthConfDynamic))
+
         return dn, oxAuthConfDynamic
 
 
@@ -214,8 +334,15 @@ class DBUtils:
 
         elif self.moddb == BackendTypes.COUCHBASE:
             for k in entries:
-                n1ql = 'UPDATE `{}` USE KEYS "configuration_jans-auth" SET jansConfDyn.{}={}'.format(self.default_bucket, k, json.dumps(entries[k]))
-                self.cbm.exec_query(n1ql)
+                n1ql = 'UPDATE `{}` USE KEYS $key SET jansConfDyn.`{}`=$value'.format(self.default_bucket, k)
+                self.cbm.exec_prepared(n1ql, {'key': 'configuration_jans-auth', 'value': entries[k]})
+
+            self.entry_cache.invalidate('ou=jans-auth,ou=configuration,o=jans')
+            return
+
+        # write through, so that next get_oxAuthConfDynamic() is served from cache
+        self.entry_cache.invalidate(dn)
+        self.entry_cache.put(('dn', 'ou=jans-auth,ou=configuration,o=jans', 'jansConfDyn'), (dn, oxAuthConfDynamic))
 
 
     def enable_script(self, inum):
@@ -239,8 +366,10 @@ class DBUtils:
                 self.spanner.update_data(table=table, columns=['doc_id', 'jansEnabled'], values=[[inum, True]])
 
         elif self.moddb == BackendTypes.COUCHBASE:
-            n1ql = 'UPDATE `{}` USE KEYS "scripts_{}" SET jansEnabled=true'.format(self.default_bucket, inum)
-            self.cbm.exec_query(n1ql)
+            n1ql = 'UPDATE `{}` USE KEYS $key SET jansEnabled=true'.format(self.default_bucket)
+            self.cbm.exec_prepared(n1ql, {'key': 'scripts_{}'.format(inum)})
+
+        self.entry_cache.invalidate('inum={},ou=scripts,o=jans'.format(inum))
 
     def enable_service(self, service):
         if self.moddb == BackendTypes.LDAP:
@@ -259,8 +388,10 @@ class DBUtils:
             self.spanner.update_data(table='jansAppConf', columns=['doc_id', service], values=[["jans-auth", True]])
 
         elif self.moddb == BackendTypes.COUCHBASE:
-            n1ql = 'UPDATE `{}` USE KEYS "configuration" SET {}=true'.format(self.default_bucket, service)
-            self.cbm.exec_query(n1ql)
+            n1ql = 'UPDATE `{}` USE KEYS $key SET `{}`=true'.format(self.default_bucket, service)
+            self.cbm.exec_prepared(n1ql, {'key': 'configuration'})
+
+        self.entry_cache.invalidate('ou=configuration,o=jans')
 
     def set_configuration(self, component, value):
         if self.moddb == BackendTypes.LDAP:
@@ -284,11 +415,28 @@ class DBUtils:
 
 
         elif self.moddb == BackendTypes.COUCHBASE:
-            n1ql = 'UPDATE `{}` USE KEYS "configuration" SET {}={}'.format(self.default_bucket, component, value)
-            self.cbm.exec_query(n1ql)
+            # value was written as n1ql literal before, keep json values as they are
+            try:
+                value = json.loads(value)
+            except:
+                pass
+            n1ql = 'UPDATE `{}` USE KEYS $key SET `{}`=$value'.format(self.default_bucket, component)
+            self.cbm.exec_prepared(n1ql, {'key': 'configuration', 'value': value})
+
+        self.entry_cache.invalidate('ou=configuration,o=jans')
 
 
     def dn_exists(self, dn):
+        cache_key = ('dn', dn.lower())
+        document = self.entry_cache.get(cache_key)
+        if document:
+            return document
+
+        document = self.read_entry(dn)
+        self.entry_cache.put(cache_key, document)
+        return document
+
+    def read_entry(self, dn):
         mapping_location = self.get_backend_location_for_dn(dn)
 
         if mapping_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
@@ -308,8 +456,8 @@ class DBUtils:
         else:
             bucket = self.get_bucket_for_dn(dn)
             key = ldif_utils.get_key_from(dn)
-            n1ql = 'SELECT * FROM `{}` USE KEYS "{}"'.format(bucket, key)
-            result = self.cbm.exec_query(n1ql)
+            n1ql = 'SELECT * FROM `{}` USE KEYS $key'.format(bucket)
+            result = self.cbm.exec_prepared(n1ql, {'key': key})
             if result.ok:
                 data = result.json()
                 if data.get('results'):
@@ -330,168 +478,185 @@ class DBUtils:
         return self.session.query(sqlalchemy_table).filter(sqlalchemy_table).filter(sqlalchemy_table.columns.dn == dn).first()
 
     def search(self, search_base, search_filter='(objectClass=*)', search_scope=ldap3.LEVEL, fetchmany=False):
+        template, values = ldap_filter.extract_values(search_filter)
+        cache_key = ('search', search_base.lower(), search_scope, fetchmany, template.lower(), tuple(values))
+        result = self.entry_cache.get(cache_key)
+        if result:
+            return result
+
+        result = self.search_backend(search_base, search_filter, search_scope, fetchmany)
+        self.entry_cache.put(cache_key, result)
+        return result
+
+    def search_backend(self, search_base, search_filter='(objectClass=*)', search_scope=ldap3.LEVEL, fetchmany=False):
+        if fetchmany:
+            return list(self.search_iter(search_base, search_filter, search_scope))
+
         base.logIt("Searching database for dn {} with filter {}".format(search_base, search_filter))
         backend_location = self.get_backend_location_for_dn(search_base)
 
         if backend_location == BackendTypes.LDAP:
             if self.ldap_conn.search(search_base=search_base, search_filter=search_filter, search_scope=search_scope, attributes=['*']):
-                if not fetchmany:
-                    key, document = ldif_utils.get_document_from_entry(self.ldap_conn.response[0]['dn'], self.ldap_conn.response[0]['attributes'])
-                    return document
-
-                documents = []
-                for result in self.ldap_conn.response:
-                    key, document = ldif_utils.get_document_from_entry(result['dn'], result['attributes'])
-                    documents.append((key, document))
-                return documents
+                key, document = ldif_utils.get_document_from_entry(self.ldap_conn.response[0]['dn'], self.ldap_conn.response[0]['attributes'])
+                return document
 
         if backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
-            if backend_location != BackendTypes.SPANNER and self.Base is None:
-                self.rdm_automapper()
-
-            s_table = None
-            where_clause = ''
-            search_list = []
-
-            if '&' in search_filter:
-                re_match = re.match('\(&\((.*?)=(.*?)\)\((.*?)=(.*?)\)', search_filter)
-                if re_match:
-                    re_list = re_match.groups()
-                    search_list.append((re_list[0], re_list[1]))
-                    search_list.append((re_list[2], re_list[3]))
-            else:
-                re_match = re.match('\((.*?)=(.*?)\)', search_filter)
-
-                if re_match:
-                    re_list = re_match.groups()
-                    search_list.append((re_list[0], re_list[1]))
-
-
-            for col, val in search_list:
-                if col.lower() == 'objectclass':
-                    s_table = val
-                    break
+            parsed_filter = ldap_filter.SearchFilter(search_filter)
+            s_table = self.get_search_table(backend_location, parsed_filter, search_base, search_scope)
 
             if not s_table:
                 return
 
             if backend_location == BackendTypes.SPANNER:
+                sql_cmd, params = self.get_spanner_search_query(s_table, parsed_filter, search_base, search_scope)
+                data = self.spanner.exec_sql(sql_cmd + ' LIMIT 1', params)
 
-                if fetchmany:
-                    retVal = []
-                else:
-                    retVal = {}
-
-                for col, val in search_list:
-                    if val == '*':
-                        continue
-                    
-                    if col.lower() == 'objectclass':
-                        s_table = val
-                    else:
-                        val = val.replace('*', '%')
-                        q_operator = 'LIKE' if '%' in val else '='
-                        where_clause = 'AND {} {} "{}"'.format(col, q_operator, val)
+                if not data.get('rows'):
+                    return {}
 
-                if not s_table:
-                    return retVal
+                return self.get_spanner_row_dict(data['fields'], data['rows'][0])
 
-                if search_scope == ldap3.BASE:
-                    dn_clause = 'dn = "{}"'.format(search_base)
-                else:
-                    dn_clause = 'dn LIKE "%{}"'.format(search_base)
+            result = self.get_rdbm_search_query(self.session, s_table, parsed_filter, search_base, search_scope).first()
+            if result:
+                return result.__dict__
 
-                sql_cmd = 'SELECT * FROM {} WHERE ({}) {}'.format(s_table, dn_clause, where_clause)
 
-                data = self.spanner.exec_sql(sql_cmd)
-    
-                if not data.get('rows'):
-                    return retVal
-
-                n = len(data['rows']) if fetchmany else 1
-                for j in range(n):
-                    row = data['rows'][j]
-                    row_dict = {}
-
-                    for i, field in enumerate(data['fields']):
-                        val = row[i]
-                        if val:
-                            if field['type'] == 'INT64':
-                                val = int(val)
-                            row_dict[field['name']] = val
-                    if fetchmany:
-                        retVal.append(row_dict)
-                    else:
-                        retVal = row_dict
-                        break
+        if backend_location == BackendTypes.COUCHBASE:
+            key = ldif_utils.get_key_from(search_base)
+            bucket = self.get_bucket_for_key(key)
 
-                return retVal
+            if search_scope == ldap3.BASE:
+                n1ql = 'SELECT * FROM `{}` USE KEYS $key'.format(bucket)
+                params = {'key': key}
+            else:
+                where_clause, params = self.filter_compiler.n1ql_filter(ldap_filter.SearchFilter(search_filter))
+                params['search_base'] = '%' + search_base
+                n1ql = 'SELECT * FROM `{}` WHERE {} AND dn LIKE $search_base LIMIT 1'.format(bucket, where_clause)
 
-            sqlalchemy_table = self.Base.classes[s_table]
-            sqlalchemyQueryObject = self.session.query(sqlalchemy_table)
+            result = self.cbm.exec_prepared(n1ql, params)
+            if result.ok:
+                data = result.json()
+                if data.get('results'):
+                    return data['results'][0][bucket]
 
-            for col, val in search_list:
-                if val == '*':
-                    continue
+    def search_iter(self, search_base, search_filter='(objectClass=*)', search_scope=ldap3.LEVEL, page_size=None):
+        """Yields search results page by page with constant memory.
 
-                if col.lower() != 'objectclass':
-                    val = val.replace('*', '%')
-                    sqlalchemyCol = getattr(sqlalchemy_table, col)
-                    if '%' in val:
-                        sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol.like(val))
-                    else:
-                        sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemyCol == val)
+        Items are the same as search(..., fetchmany=True) returns: (key, document)
+        for LDAP, row dicts for RDBM backends and documents for Couchbase. Results
+        are not cached.
+        """
+        page_size = int(page_size or Config.search_page_size)
+        base.logIt("Searching database for dn {} with filter {} in pages of {}".format(search_base, search_filter, page_size))
+        backend_location = self.get_backend_location_for_dn(search_base)
 
-            if search_scope == ldap3.BASE:
-                sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn == search_base)
-            else:
-                sqlalchemyQueryObject = sqlalchemyQueryObject.filter(sqlalchemy_table.dn.like('%'+search_base))
+        if backend_location == BackendTypes.LDAP:
+            # simple paged results control, the next page is requested when the current one is consumed
+            entries = self.ldap_conn.extend.standard.paged_search(
+                            search_base=search_base,
+                            search_filter=search_filter,
+                            search_scope=search_scope,
+                            attributes=['*'],
+                            paged_size=page_size,
+                            generator=True
+                            )
+            for entry in entries:
+                if entry.get('type') == 'searchResEntry':
+                    yield ldif_utils.get_document_from_entry(entry['dn'], entry['attributes'])
+
+        elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
+            parsed_filter = ldap_filter.SearchFilter(search_filter)
+            s_table = self.get_search_table(backend_location, parsed_filter, search_base, search_scope)
 
-            if fetchmany:
-                result = sqlalchemyQueryObject.all()
-                return [ item.__dict__ for item in result ]
+            if not s_table:
+                return
 
-            else:
-                result = sqlalchemyQueryObject.first()
-                if result:
-                    return result.__dict__
+            if backend_location == BackendTypes.SPANNER:
+                sql_cmd, params = self.get_spanner_search_query(s_table, parsed_filter, search_base, search_scope)
+                for fields, row in self.spanner.iter_sql(sql_cmd, params):
+                    yield self.get_spanner_row_dict(fields, row)
+                return
 
+            # own session, server side cursor keeps its connection busy until iteration ends
+            session = self.get_session()
+            try:
+                for item in self.get_rdbm_search_query(session, s_table, parsed_filter, search_base, search_scope).yield_per(page_size):
+                    yield item.__dict__
+            finally:
+                session.close()
 
-        if backend_location == BackendTypes.COUCHBASE:
+        elif backend_location == BackendTypes.COUCHBASE:
             key = ldif_utils.get_key_from(search_base)
             bucket = self.get_bucket_for_key(key)
 
             if search_scope == ldap3.BASE:
-                n1ql = 'SELECT * FROM `{}` USE KEYS "{}"'.format(bucket, key)
-            else:
+                n1ql = 'SELECT * FROM `{}` USE KEYS $key'.format(bucket)
+                result = self.cbm.exec_prepared(n1ql, {'key': key})
+                if result.ok:
+                    for item in result.json().get('results', []):
+                        yield item[bucket]
+                return
 
-                if '&' in search_filter:
-                    re_match = re.match('\(&\((.*?)\)\((.*?)\)\)', search_filter)
-                    if re_match:
-                        re_list = re_match.groups()
-                        dn_to_parse = re_list[0] if 'objectclass' in re_list[1].lower() else re_list[1]
-                else:
-                    dn_to_parse = search_filter.strip('(').strip(')')
+            where_clause, params = self.filter_compiler.n1ql_filter(ldap_filter.SearchFilter(search_filter))
+            params['search_base'] = '%' + search_base
+            params['page_size'] = page_size
+            params['last_key'] = ''
 
-                parsed_dn = dnutils.parse_dn(dn_to_parse)
-                attr = parsed_dn[0][0]
-                val = parsed_dn[0][1]
-                if '*' in val:
-                    search_clause = 'LIKE "{}"'.format(val.replace('*', '%'))
-                else:
-                    search_clause = '="{}"'.format(val.replace('*', '%'))
+            # keyset pagination, OFFSET would rescan skipped documents for every page
+            n1ql = 'SELECT META().id AS `_key`, * FROM `{0}` WHERE {1} AND dn LIKE $search_base AND META().id > $last_key ORDER BY META().id LIMIT $page_size'.format(bucket, where_clause)
 
-                n1ql = 'SELECT * FROM `{}` WHERE `{}` {}'.format(bucket, attr, search_clause)
+            while True:
+                result = self.cbm.exec_prepared(n1ql, params)
+                if not result.ok:
+                    base.logIt("Couchbase paged search failed: {}".format(result.text), True)
+                    return
 
-            result = self.cbm.exec_query(n1ql)
-            if result.ok:
-                data = result.json()
-                if data.get('results'):
-                    if fetchmany:
-                        return [ item[bucket] for item in data['results'] ]
-                    else:
-                        return data['results'][0][bucket]
+                results = result.json().get('results', [])
+                for item in results:
+                    yield item[bucket]
+
+                if len(results) < page_size:
+                    return
 
+                params['last_key'] = results[-1]['_key']
+
+    def get_search_table(self, backend_location, parsed_filter, search_base, search_scope):
+        if backend_location != BackendTypes.SPANNER and self.Base is None:
+            self.rdm_automapper()
+
+        s_table = parsed_filter.object_class
+
+        if not s_table and search_scope == ldap3.BASE:
+            # objectClass is not given, table is found from dn
+            if backend_location == BackendTypes.SPANNER:
+                s_table = self.get_spanner_table_for_dn(search_base)
+            else:
+                s_table = self.get_rdbm_table_for_dn(search_base)
+
+        return s_table
+
+    def get_rdbm_search_query(self, session, s_table, parsed_filter, search_base, search_scope):
+        sqlalchemy_table = self.Base.classes[s_table]
+        where_clause, params = self.filter_compiler.sqlalchemy_filter(parsed_filter, sqlalchemy_table.__table__, self.engine.dialect.name)
+        sqlalchemyQueryObject = session.query(sqlalchemy_table).filter(where_clause).params(**params)
+        return sqlalchemyQueryObject.filter(self.get_rdbm_scope_clause(sqlalchemy_table.__table__, search_base, search_scope))
+
+    def get_spanner_search_query(self, s_table, parsed_filter, search_base, search_scope):
+        where_clause, params = self.filter_compiler.spanner_filter(parsed_filter, s_table)
+        table = self.get_objectclass_table(s_table)
+        dn_clause = self.get_spanner_scope_clause(search_base, search_scope, params, table)
+        sql_cmd = 'SELECT * FROM `{}` WHERE {} AND {}'.format(table, dn_clause, where_clause)
+        return sql_cmd, params
+
+    def get_spanner_row_dict(self, fields, row):
+        row_dict = {}
+        for i, field in enumerate(fields):
+            val = row[i]
+            if val:
+                if field['type'] == 'INT64':
+                    val = int(val)
+                row_dict[field['name']] = val
+        return row_dict
 
     def add2strlist(self, client_id, strlist):
         value2 = []
@@ -508,7 +673,8 @@ class DBUtils:
         backend_location = self.get_backend_location_for_dn(dn)
 
         if backend_location == BackendTypes.LDAP:
-            if self.dn_exists(dn):
+            # current values are read from ldap connection response, so entry cache is bypassed
+            if self.read_entry(dn):
                 for e in self.ldap_conn.response[0]['attributes'].get('jansConfProperty', []):
                     try:
                         jansConfProperty = json.loads(e)
@@ -569,8 +735,8 @@ class DBUtils:
 
         elif backend_location == BackendTypes.COUCHBASE:
             bucket = self.get_bucket_for_dn(dn)
-            n1ql = 'SELECT jansConfProperty FROM `{}` USE KEYS "scripts_{}"'.format(bucket, script_inum)
-            result = self.cbm.exec_query(n1ql)
+            n1ql = 'SELECT jansConfProperty FROM `{}` USE KEYS $key'.format(bucket)
+            result = self.cbm.exec_prepared(n1ql, {'key': 'scripts_{}'.format(script_inum)})
             js = result.json()
 
             oxConfigurationProperties = js['results'][0]['jansConfProperty']
@@ -583,8 +749,10 @@ class DBUtils:
             else:
                 return
 
-            n1ql = 'UPDATE `{}` USE KEYS "scripts_{}" SET `jansConfProperty`={}'.format(bucket, script_inum, json.dumps(oxConfigurationProperties))
-            self.cbm.exec_query(n1ql)
+            n1ql = 'UPDATE `{}` USE KEYS $key SET `jansConfProperty`=$value'.format(bucket)
+            self.cbm.exec_prepared(n1ql, {'key': 'scripts_{}'.format(script_inum), 'value': oxConfigurationProperties})
+
+        self.entry_cache.invalidate(dn)
 
     def get_key_prefix(self, key):
         n = key.find('_')
@@ -592,8 +760,8 @@ class DBUtils:
 
     def check_attribute_exists(self, key, attribute):
         bucket = self.get_bucket_for_key(key)
-        n1ql = 'SELECT `{}` FROM `{}` USE KEYS "{}"'.format(attribute, bucket, key)
-        result = self.cbm.exec_query(n1ql)
+        n1ql = 'SELECT `{}` FROM `{}` USE KEYS $key'.format(attribute, bucket)
+        result = self.cbm.exec_prepared(n1ql, {'key': key})
         if result.ok:
             data = result.json()
             r = data.get('results', [])
@@ -606,19 +774,21 @@ class DBUtils:
             base.logIt("Ldap modify operation failed {}".format(str(self.ldap_conn.result)))
             base.logIt("Ldap modify operation failed {}".format(str(self.ldap_conn.result)), True)
 
+    def ldap_modify(self, dn, changes):
+        """Modifies dn with ldap connection and drops cached reads of it"""
+        ldap_operation_result = self.ldap_conn.modify(dn, changes)
+        self.entry_cache.invalidate(dn)
+        return ldap_operation_result
+
+    def ldap_add(self, dn, attributes):
+        """Adds dn with ldap connection and drops cached searches that may contain it"""
+        ldap_operation_result = self.ldap_conn.add(dn, attributes=attributes)
+        self.entry_cache.invalidate(dn)
+        return ldap_operation_result
 
-    def get_attr_syntax(self, attrname):
-        for jans_attr in self.jans_attributes:
-            if attrname in jans_attr['names']:
-                if jans_attr.get('multivalued'):
-                    return 'JSON'
-                return jans_attr['syntax']
-        else:
-            opendj_syntax = self.opendj_attributes_syntax.get(attrname)
-            if opendj_syntax is None:
-                opendj_syntax = '1.3.6.1.4.1.1466.115.121.1.15'
 
-            return opendj_syntax
+    def get_attr_syntax(self, attrname):
+        return self.schema_index.get_attr_syntax(attrname)
 
     def get_rootdn(self, dn):
         dn_parsed = dnutils.parse_dn(dn)
@@ -635,48 +805,175 @@ class DBUtils:
         if not force and self.Base:
             return
 
-        base.logIt("Reflecting ORM tables")
+        base.logIt("Setting up ORM table reflection")
+
+        if force:
+            # tables may have been altered since last reflection
+            if self.Base:
+                self.Base.save_cache()
+            self.metadata.clear()
+
+        # tables are reflected when they are first used, see TableReflector
+        cache_fn = os.path.join(Config.outputFolder, 'rdbm_tables_{}_{}.pickle'.format(Config.rdbm_type, Config.rdbm_db))
+        self.Base = TableReflector(self.engine, self.metadata, cache_fn, self.table_catalog)
+
+    def index_dn(self, dn, table, doc_id=None):
+        self.dn_index[dn] = (table, doc_id or self.get_doc_id_from_dn(dn))
+
+    def get_catalog_tables(self, *required_columns):
+        # lightweight table clauses built from table_catalog, querying them doesn't reflect tables
+        tables = []
+        for table in sorted(self.table_catalog.get_tables()):
+            columns = self.table_catalog.get_columns(table)
+            if all(column in columns for column in required_columns):
+                tables.append(sqlalchemy.table(table, *[ sqlalchemy.column(column) for column in columns ]))
+        return tables
+
+    def rdbm_union_lookup(self, where_clause):
+        # single UNION ALL round trip instead of one query per table,
+        # callers reflect only the table of the result
+        queries = []
+        for sqlalchemy_table in self.get_catalog_tables('doc_id', 'dn'):
+            queries.append(
+                sqlalchemy.select([
+                    sqlalchemy.literal(sqlalchemy_table.name, type_=sqlalchemy.String).label('tbl'),
+                    sqlalchemy_table.columns.doc_id,
+                    sqlalchemy_table.columns.dn
+                    ]).where(where_clause(sqlalchemy_table)).limit(1)
+                )
 
-        self.metadata.reflect(self.engine)
-        self.Base = sqlalchemy.ext.automap.automap_base(metadata=self.metadata)
-        self.Base.prepare()
+        if queries:
+            return self.session.execute(sqlalchemy.union_all(*queries)).first()
 
-        base.logIt("Reflected tables {}".format(list(self.metadata.tables.keys())))
+    def get_rev_dn(self, dn, parent=False):
+        # rdns in reverse order, entries of a subtree then share reversed dn of its base as prefix
+        rdns = [ '{}={}'.format(rdn[0], rdn[1]) for rdn in dnutils.parse_dn(dn.lower()) ]
+        if parent:
+            rdns = rdns[1:]
+        return ','.join(reversed(rdns))
 
-    def get_sqlalchObj_for_dn(self, dn):
+    def get_rev_parent_dn(self, dn):
+        return self.get_rev_dn(dn, parent=True)
 
-        for tbl in self.Base.classes:
-            result = self.session.query(tbl).filter(tbl.dn == dn).first()
-            if result:
-                return result
+    def get_rdbm_scope_clause(self, sqlalchemy_table, search_base, search_scope):
+        columns = sqlalchemy_table.columns
 
-        for tbl in self.Base.classes:
-            result = self.session.query(tbl).filter(tbl.dn.like('%'+dn)).first()
-            if result:
-                return result
+        if search_scope == ldap3.BASE:
+            return columns.dn == search_base
+
+        if not 'rev_parent_dn' in columns:
+            # table was not migrated yet
+            return columns.dn.like('%' + search_base)
+
+        rev_base = self.get_rev_dn(search_base)
+        # rows written without rev_parent_dn, before backfill or by servers unaware of it, are matched by dn
+        unfilled_clause = sqlalchemy.and_(columns.rev_parent_dn == None, columns.dn.like('%,' + ldap_filter.escape_like(search_base), escape='\\'))
+
+        if search_scope == ldap3.LEVEL:
+            return sqlalchemy.or_(columns.rev_parent_dn == rev_base, unfilled_clause)
+
+        return sqlalchemy.or_(
+                    columns.dn == search_base,
+                    columns.rev_parent_dn == rev_base,
+                    columns.rev_parent_dn.like(ldap_filter.escape_like(rev_base) + ',%', escape='\\'),
+                    unfilled_clause
+                    )
+
+    def get_spanner_scope_clause(self, search_base, search_scope, params, table=None):
+        if search_scope == ldap3.BASE:
+            params['search_base'] = search_base
+            return 'dn = @search_base'
+
+        if table and not self.table_catalog.column_exists(table, 'rev_parent_dn'):
+            # table was not migrated yet
+            params['search_base'] = '%' + search_base
+            return 'dn LIKE @search_base'
+
+        params['rev_base'] = self.get_rev_dn(search_base)
+        params['search_base_suffix'] = ',' + search_base
+        unfilled_clause = '(rev_parent_dn IS NULL AND ENDS_WITH(dn, @search_base_suffix))'
+
+        if search_scope == ldap3.LEVEL:
+            return '(rev_parent_dn = @rev_base OR {})'.format(unfilled_clause)
+
+        params['search_base'] = search_base
+        params['rev_base_prefix'] = params['rev_base'] + ','
+        return '(dn = @search_base OR rev_parent_dn = @rev_base OR STARTS_WITH(rev_parent_dn, @rev_base_prefix) OR {})'.format(unfilled_clause)
+
+    def backfill_rev_parent_dn(self):
+        """Fills rev_parent_dn of entries written before the column was added"""
 
-    def table_exists(self, table):
         if Config.rdbm_type == 'spanner':
-            return table in self.spanner.get_tables()
-        else:
-            metadata = sqlalchemy.MetaData()
-            try:
-                metadata.reflect(self.engine, only=[table])
-            except:
-                pass
+            schema_tables = set(self.objectclass_tables.values())
+            for table in self.table_catalog.get_tables():
+                if not table in schema_tables or not self.column_exists(table, 'rev_parent_dn'):
+                    continue
+                data = self.spanner.exec_sql('SELECT doc_id, dn FROM `{}` WHERE rev_parent_dn IS NULL AND dn IS NOT NULL'.format(table))
+                if data.get('rows'):
+                    base.logIt("Filling rev_parent_dn of {} rows in {}".format(len(data['rows']), table))
+                    writer = self.spanner.get_bulk_writer()
+                    writer.update(table=table, columns=['doc_id', 'rev_parent_dn'], values=[ [doc_id, self.get_rev_parent_dn(dn)] for doc_id, dn in data['rows'] ])
+                    writer.flush()
+            return
 
-            return table in metadata
+        for sqlalchemy_table in self.get_catalog_tables('doc_id', 'dn', 'rev_parent_dn'):
+            columns = sqlalchemy_table.columns
+            rows = self.session.execute(
+                    sqlalchemy.select([columns.doc_id, columns.dn]).where(sqlalchemy.and_(columns.rev_parent_dn == None, columns.dn != None))
+                    ).fetchall()
+
+            if rows:
+                base.logIt("Filling rev_parent_dn of {} rows in {}".format(len(rows), sqlalchemy_table.name))
+                self.session.execute(
+                        sqlalchemy_table.update().where(columns.doc_id == sqlalchemy.bindparam('b_doc_id')).values(rev_parent_dn=sqlalchemy.bindparam('b_rev_parent_dn')),
+                        [ {'b_doc_id': doc_id, 'b_rev_parent_dn': self.get_rev_parent_dn(dn)} for doc_id, dn in rows ]
+                        )
+                self.session.commit()
 
-    def get_attr_sql_data_type(self, key):
-        if key in self.sql_data_types:
-            data_type = self.sql_data_types[key]
-        else:
-            attr_syntax = self.get_attr_syntax(key)
-            data_type = self.ldap_sql_data_type_mapping[attr_syntax]
+    def get_rdbm_table_for_dn(self, dn):
+        if not dn in self.dn_index:
+            doc_id = self.get_doc_id_from_dn(dn)
+            result = self.rdbm_union_lookup(lambda tbl: sqlalchemy.and_(tbl.columns.doc_id == doc_id, tbl.columns.dn == dn))
+            if not result:
+                return
+            self.index_dn(dn, result[0], result[1])
 
-        data_type = (data_type.get(Config.rdbm_type) or data_type['mysql'])['type']
+        return self.dn_index[dn][0]
 
-        return data_type
+    def get_sqlalchObj_for_dn(self, dn):
+
+        for i in range(2):
+            table_name = self.get_rdbm_table_for_dn(dn)
+            if not table_name or not table_name in self.Base.classes:
+                break
+            sqlalchemy_table = self.Base.classes[table_name]
+            result = self.session.query(sqlalchemy_table).filter(sqlalchemy_table.doc_id == self.dn_index[dn][1]).first()
+            if result and result.dn == dn:
+                return result
+            # stale index entry, resolve once more from database
+            self.dn_index.pop(dn, None)
+
+        # dn may be stored with different case or spacing, compare normalized parent and rdn value
+        doc_id = self.get_doc_id_from_dn(dn)
+        rev_parent_dn = self.get_rev_parent_dn(dn)
+        result = self.rdbm_union_lookup(
+                lambda tbl: sqlalchemy.or_(
+                            sqlalchemy.and_(tbl.columns.doc_id == doc_id, tbl.columns.rev_parent_dn == rev_parent_dn),
+                            sqlalchemy.and_(tbl.columns.rev_parent_dn == None, tbl.columns.dn.like('%'+dn))
+                            ) if 'rev_parent_dn' in tbl.columns else tbl.columns.dn.like('%'+dn)
+                )
+        if result:
+            sqlalchemy_table = self.Base.classes[result[0]]
+            return self.session.query(sqlalchemy_table).filter(sqlalchemy_table.doc_id == result[1]).first()
+
+    def table_exists(self, table):
+        return self.table_catalog.table_exists(table)
+
+    def column_exists(self, table, column):
+        return self.table_catalog.column_exists(table, column)
+
+    def get_attr_sql_data_type(self, key):
+        return self.schema_index.get_sql_data_type(key, Config.rdbm_type)
 
     def get_rdbm_val(self, key, val, rdbm_type=None):
 
@@ -723,227 +1020,603 @@ class DBUtils:
         dn_parsed = dnutils.parse_dn(dn)
         return dn_parsed[0][1]
 
+    def get_objectclass_table(self, objectClass):
+        return self.objectclass_tables.get(objectClass.lower(), objectClass)
+
     def get_spanner_table_for_dn(self, dn):
-        tables = self.spanner.get_tables()
+        if dn in self.dn_index:
+            return self.dn_index[dn][0]
 
-        for table in tables:
-            sql_cmd = 'SELECT doc_id FROM {} WHERE dn="{}"'.format(table, dn)
-            result = self.spanner.exec_sql(sql_cmd)
-            if result and 'rows' in result and result['rows']:
-                return table
+        # only tables of schema objectClasses have dn column, sub tables are excluded
+        schema_tables = set(self.objectclass_tables.values())
+        tables = [ table for table in self.spanner.get_tables() if table in schema_tables ]
+        if not tables:
+            return
+
+        sql_cmd = ' UNION ALL '.join([ 'SELECT "{0}" AS tbl FROM `{0}` WHERE doc_id=@doc_id AND dn=@dn'.format(table) for table in tables ])
+        doc_id = self.get_doc_id_from_dn(dn)
+        result = self.spanner.exec_sql(sql_cmd, params={'doc_id': doc_id, 'dn': dn})
+
+        if result and 'rows' in result and result['rows']:
+            table = result['rows'][0][0]
+            self.index_dn(dn, table, doc_id)
+            return table
 
     def import_ldif(self, ldif_files, bucket=None, force=None):
 
         base.logIt("Importing ldif file(s): {} ".format(', '.join(ldif_files)))
 
-        sql_data_fn = os.path.join(Config.outputFolder, Config.rdbm_type, 'jans_data.sql')
-
         for ldif_fn in ldif_files:
             base.logIt("Importing entries from " + ldif_fn)
-            parser = ldif_utils.myLdifParser(ldif_fn)
-            parser.parse()
-
-            for dn, entry in parser.entries:
-                backend_location = force if force else self.get_backend_location_for_dn(dn)
-                if backend_location == BackendTypes.LDAP:
-                    if 'add' in  entry and 'changetype' in entry:
-                        base.logIt("LDAP modify add dn:{} entry:{}".format(dn, dict(entry)))
-                        change_attr = entry['add'][0]
-                        ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_ADD, entry[change_attr])]})
-                        self.log_ldap_result(ldap_operation_result)
+            start_time = time.perf_counter()
+            self.import_entries(self.import_stats.count_file_entries(ldif_fn, ldif_utils.myLdifParser(ldif_fn)), bucket, force)
+            self.import_stats.add_entries('file', ldif_fn, 0, time.perf_counter() - start_time)
+
+    def compile_ldif(self, ldif_files, bucket=None, backend_location=None):
+        compiler = LdifCompiler(self, backend_location or self.moddb)
+        compiler.compile(ldif_files, bucket)
+        return compiler
+
+    def import_ldif_compiled(self, ldif_files, bucket=None, backend_location=None):
+        compiler = self.compile_ldif(ldif_files, bucket, backend_location)
+        compiler.load()
+
+    def import_entries(self, entries, bucket=None, force=None):
+
+        for dn, entry in entries:
+            start_time = time.perf_counter()
+            backend_location, table = self.get_import_group(dn, entry, bucket, force)
+            self.import_entry(dn, entry, bucket, force, location=(backend_location, table))
+            self.import_stats.add_entry(backend_location, 'modify' if 'changetype' in entry else table, time.perf_counter() - start_time)
+
+        # rows left in buffers were counted when added, time spent writing them is added to their tables
+        for table in list(self.rdbm_bulk_rows):
+            start_time = time.perf_counter()
+            self.rdbm_bulk_flush(table)
+            self.import_stats.add_entry(Config.rdbm_type, table, time.perf_counter() - start_time, count=0)
+
+        self.cb_bulk_flush()
+        self.ldap_bulk_flush()
+        self.spanner_bulk_flush()
+
+        # imported entries may be in cached search results
+        self.entry_cache.invalidate()
+
+    def import_entry(self, dn, entry, bucket=None, force=None, location=None):
+        # location is (backend_location, group) of get_import_group() when caller resolved it
+        if location:
+            backend_location, group = location
+        else:
+            backend_location, group = force if force else self.get_backend_location_for_dn(dn), None
 
-                    elif 'replace' in  entry and 'changetype' in entry:
-                        base.logIt("LDAP modify replace dn:{} entry:{}".format(dn, dict(entry)))
-                        change_attr = entry['replace'][0]
-                        ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_REPLACE, [entry[change_attr][0]])]})
-                        self.log_ldap_result(ldap_operation_result)
+        if backend_location == BackendTypes.LDAP:
+            if 'changetype' in entry:
+                # outstanding additions may be targets of modifications
+                self.ldap_bulk_flush()
+
+            if 'add' in  entry and 'changetype' in entry:
+                base.logIt("LDAP modify add dn:{} entry:{}".format(dn, dict(entry)))
+                change_attr = entry['add'][0]
+                with self.import_stats.round_trip(backend_location):
+                    ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_ADD, entry[change_attr])]})
+                self.log_ldap_result(ldap_operation_result)
+
+            elif 'replace' in  entry and 'changetype' in entry:
+                base.logIt("LDAP modify replace dn:{} entry:{}".format(dn, dict(entry)))
+                change_attr = entry['replace'][0]
+                with self.import_stats.round_trip(backend_location):
+                    ldap_operation_result = self.ldap_conn.modify(dn, {change_attr: [(ldap3.MODIFY_REPLACE, [entry[change_attr][0]])]})
+                self.log_ldap_result(ldap_operation_result)
+
+            elif Config.ldap_bulk_add:
+                self.ldap_bulk_add(dn, entry)
+
+            else:
+                with self.import_stats.timer('existence check'):
+                    dn_exists = self.dn_exists(dn)
 
-                    elif not self.dn_exists(dn):
-                        base.logIt("Adding LDAP dn:{} entry:{}".format(dn, dict(entry)))
+                if not dn_exists:
+                    base.logIt("Adding LDAP dn:{} entry:{}".format(dn, dict(entry)))
+                    with self.import_stats.round_trip(backend_location):
                         ldap_operation_result = self.ldap_conn.add(dn, attributes=entry)
-                        self.log_ldap_result(ldap_operation_result)
+                    self.log_ldap_result(ldap_operation_result)
+
+        elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+            if self.Base is None:
+                self.rdm_automapper()
 
-                elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
-                    if self.Base is None:
-                        self.rdm_automapper()
+            if 'changetype' in entry:
+                # modify records may target entries still waiting in bulk buffers
+                self.rdbm_bulk_flush()
+
+            if 'add' in  entry and 'changetype' in entry:
+                attribute = entry['add'][0]
+                new_val = entry[attribute]
+                sqlalchObj = self.get_sqlalchObj_for_dn(dn)
+
+                if sqlalchObj:
+                    if isinstance(sqlalchObj.__table__.columns[attribute].type, self.json_dialects_instance):
+                        cur_val = copy.deepcopy(getattr(sqlalchObj, attribute))
+                        for val_ in new_val:
+                            cur_val['v'].append(val_)
+                        setattr(sqlalchObj, attribute, cur_val)
+                    else:
+                        setattr(sqlalchObj, attribute, new_val[0])
 
-                    if 'add' in  entry and 'changetype' in entry:
-                        attribute = entry['add'][0]
-                        new_val = entry[attribute]
-                        sqlalchObj = self.get_sqlalchObj_for_dn(dn)
+                    self.session.commit()
 
-                        if sqlalchObj:
-                            if isinstance(sqlalchObj.__table__.columns[attribute].type, self.json_dialects_instance):
-                                cur_val = copy.deepcopy(getattr(sqlalchObj, attribute))
-                                for val_ in new_val:
-                                    cur_val['v'].append(val_)
-                                setattr(sqlalchObj, attribute, cur_val)
-                            else:
-                                setattr(sqlalchObj, attribute, new_val[0])
+                else:
+                    base.logIt("Can't find current value for repmacement of {}".replace(str(entry)), True)
+                    return
 
-                            self.session.commit()
+            elif 'replace' in entry and 'changetype' in entry:
+                attribute = entry['replace'][0]
+                new_val = self.get_rdbm_val(attribute, entry[attribute])
+                sqlalchObj = self.get_sqlalchObj_for_dn(dn)
 
-                        else:
-                            base.logIt("Can't find current value for repmacement of {}".replace(str(entry)), True)
-                            continue
+                if sqlalchObj:
+                    setattr(sqlalchObj, attribute, new_val)
+                    self.session.commit()
+                else:
+                    base.logIt("Can't find current value for repmacement of {}".replace(str(entry)), True)
+                    return
 
-                    elif 'replace' in entry and 'changetype' in entry:
-                        attribute = entry['replace'][0]
-                        new_val = self.get_rdbm_val(attribute, entry[attribute])
-                        sqlalchObj = self.get_sqlalchObj_for_dn(dn)
+            else:
+                vals = {}
+                dn_parsed = dnutils.parse_dn(dn)
+                rdn_name = dn_parsed[0][0]
+                objectClass = self.get_clean_objcet_class(entry)
+                if objectClass.lower() == 'organizationalunit':
+                    return
+
+                vals['doc_id'] = dn_parsed[0][1]
+                vals['dn'] = dn
+                vals['rev_parent_dn'] = self.get_rev_parent_dn(dn)
+                vals['objectClass'] = objectClass
+
+                #entry.pop(rdn_name)
+                if 'objectClass' in entry:
+                    entry.pop('objectClass')
+                elif 'objectclass' in entry:
+                    entry.pop('objectclass')
+
+                table_name = group or objectClass
+
+                if not self.table_partitioner.check_row(table_name, dn, entry):
+                    return
+
+                # dn is indexed once its row is in the table, bulk rows when they are flushed
+                if Config.rdbm_bulk_import:
+                    with self.import_stats.timer('type conversion'):
+                        for lkey in entry:
+                            vals[lkey] = self.get_rdbm_val(lkey, entry[lkey])
+                    self.rdbm_bulk_add(table_name, vals)
+                    return
 
-                        if sqlalchObj:
-                            setattr(sqlalchObj, attribute, new_val)
-                            self.session.commit()
-                        else:
-                            base.logIt("Can't find current value for repmacement of {}".replace(str(entry)), True)
-                            continue
+                with self.import_stats.timer('existence check'):
+                    dn_exists = self.dn_exists_rdbm(dn, table_name)
 
-                    else:
-                        vals = {}
-                        dn_parsed = dnutils.parse_dn(dn)
-                        rdn_name = dn_parsed[0][0]
-                        objectClass = self.get_clean_objcet_class(entry)
-                        if objectClass.lower() == 'organizationalunit':
-                            continue
+                if dn_exists:
+                    base.logIt("DN {} exsits in {} skipping".format(dn, Config.rdbm_type))
+                    self.index_dn(dn, table_name, dn_exists.doc_id)
+                    return
 
-                        vals['doc_id'] = dn_parsed[0][1]
-                        vals['dn'] = dn
-                        vals['objectClass'] = objectClass
+                with self.import_stats.timer('type conversion'):
+                    for lkey in entry:
+                        vals[lkey] = self.get_rdbm_val(lkey, entry[lkey])
 
-                        #entry.pop(rdn_name)
-                        if 'objectClass' in entry:
-                            entry.pop('objectClass')
-                        elif 'objectclass' in entry:
-                            entry.pop('objectclass')
+                sqlalchCls = self.Base.classes[table_name]
 
-                        table_name = objectClass
+                for col in sqlalchCls.__table__.columns:
+                    if isinstance(col.type, self.json_dialects_instance) and not col.name in vals:
+                        vals[col.name] = {'v': []}
 
-                        if self.dn_exists_rdbm(dn, table_name):
-                            base.logIt("DN {} exsits in {} skipping".format(dn, Config.rdbm_type))
-                            continue
+                sqlalchObj = sqlalchCls()
 
-                        for lkey in entry:
-                            vals[lkey] = self.get_rdbm_val(lkey, entry[lkey])
+                for v in vals:
+                    setattr(sqlalchObj, v, vals[v])
 
-                        sqlalchCls = self.Base.classes[table_name]
+                base.logIt("Adding {}".format(sqlalchObj.doc_id))
+                self.session.add(sqlalchObj)
+                with self.import_stats.round_trip(backend_location):
+                    self.session.commit()
+                self.index_dn(dn, table_name, vals['doc_id'])
 
-                        for col in sqlalchCls.__table__.columns:
-                            if isinstance(col.type, self.json_dialects_instance) and not col.name in vals:
-                                vals[col.name] = {'v': []}
 
-                        sqlalchObj = sqlalchCls()
+        elif backend_location == BackendTypes.SPANNER:
 
-                        for v in vals:
-                            setattr(sqlalchObj, v, vals[v])
+            if 'changetype' in entry:
+                self.spanner_bulk_flush()
+
+            if 'add' in  entry and 'changetype' in entry:
+                table = self.get_spanner_table_for_dn(dn)
+                doc_id = self.get_doc_id_from_dn(dn)
+                change_attr = entry['add'][0]
+                if table:
+                    doc_id = self.get_doc_id_from_dn(dn)
+                    data = self.spanner.exec_sql('SELECT {} FROM {} WHERE doc_id="{}"'.format(entry['add'][0], table, doc_id))
+                    if data.get('rows'):
+                        cur_data = []
+
+                        if 'rows' in data and data['rows'] and data['rows'][0] and data['rows'][0][0]:
+                            cur_data = data['rows'][0][0]
+                            
+                        for cur_val in entry[change_attr]:
+                            typed_val = self.get_rdbm_val(change_attr, cur_val, rdbm_type='spanner')
+                            cur_data.append(typed_val)
+    
+                    self.spanner.update_data(table=table, columns=['doc_id', change_attr], values=[[doc_id, cur_data]])
 
-                        base.logIt("Adding {}".format(sqlalchObj.doc_id))
-                        self.session.add(sqlalchObj)
-                        self.session.commit()
+            elif 'replace' in entry and 'changetype' in entry:
+                table = self.get_spanner_table_for_dn(dn)
+                doc_id = self.get_doc_id_from_dn(dn)
+                replace_attr = entry['replace'][0]
+                typed_val = self.get_rdbm_val(replace_attr, entry[replace_attr], rdbm_type='spanner')
+                self.spanner.update_data(table=table, columns=['doc_id', replace_attr], values=[[doc_id, typed_val]])
 
+            else:
+                vals = {}
+                dn_parsed = dnutils.parse_dn(dn)
+                rdn_name = dn_parsed[0][0]
+                objectClass = objectClass = self.get_clean_objcet_class(entry)
+                if objectClass.lower() == 'organizationalunit':
+                    return
+
+                vals['doc_id'] = dn_parsed[0][1]
+                vals['dn'] = dn
+                vals['rev_parent_dn'] = self.get_rev_parent_dn(dn)
+                vals['objectClass'] = objectClass
+
+                if 'objectClass' in entry:
+                    entry.pop('objectClass')
+                elif 'objectclass' in entry:
+                    entry.pop('objectclass')
+
+                table_name = self.get_objectclass_table(objectClass)
+
+                with self.import_stats.timer('type conversion'):
+                    for lkey in entry:
+                        vals[lkey] = self.get_rdbm_val(lkey, entry[lkey], rdbm_type='spanner')
+
+                columns = [ *vals.keys() ]
+                values = [ vals[lkey] for lkey in columns ]
+
+                # dn is indexed once its row is written, bulk rows when their group commits
+                if Config.spanner_bulk_write:
+                    if not self.spanner_writer:
+                        self.spanner_writer = self.spanner.get_bulk_writer(on_commit=self.index_spanner_rows, executor=self.write_executor)
+                    self.spanner_writer.insert(table=table_name, columns=columns, values=[values])
+                else:
+                    with self.import_stats.round_trip(backend_location):
+                        self.spanner.insert_data(table=table_name, columns=columns, values=[values])
+                    self.index_dn(dn, table_name, vals['doc_id'])
 
-                elif backend_location == BackendTypes.SPANNER:
+        elif backend_location == BackendTypes.COUCHBASE:
+            if len(entry) < 3:
+                return
+            with self.import_stats.timer('type conversion'):
+                key, document = ldif_utils.get_document_from_entry(dn, entry)
+            cur_bucket = group or bucket or self.get_bucket_for_dn(dn)
+            base.logIt("Addnig document {} to Couchebase bucket {}".format(key, cur_bucket))
+
+            n1ql_list = []
+
+            if 'changetype' in document:
+                # modifications need the documents queued for upsert to be written first
+                self.cb_bulk_flush()
+                if 'replace' in document:
+                    attribute = document['replace']
+                    n1ql_list.append(('UPDATE `%s` USE KEYS $key SET `%s`=$value' % (cur_bucket, attribute), document[attribute]))
+                elif 'add' in document:
+                    attribute = document['add']
+                    with self.import_stats.timer('existence check'):
+                        result = self.check_attribute_exists(key, attribute)
+                    data = document[attribute]
+                    if result:
+                        if isinstance(data, list):
+                            for d in data:
+                                n1ql_list.append(('UPDATE `%s` USE KEYS $key SET `%s`=ARRAY_APPEND(`%s`, $value)' % (cur_bucket, attribute, attribute), d))
+                        else:
+                            n1ql_list.append(('UPDATE `%s` USE KEYS $key SET `%s`=ARRAY_APPEND(`%s`, $value)' % (cur_bucket, attribute, attribute), data))
+                    else:
+                        if attribute in attribDataTypes.listAttributes and not isinstance(data, list):
+                            data = [data]
+                        n1ql_list.append(('UPDATE `%s` USE KEYS $key SET `%s`=$value' % (cur_bucket, attribute), data))
+            else:
+                for k in document:
+                    try:
+                        kdata = json.loads(document[k])
+                        if isinstance(kdata, dict):
+                            document[k] = kdata
+                    except:
+                        pass
 
-                    if 'add' in  entry and 'changetype' in entry:
-                        table = self.get_spanner_table_for_dn(dn)
-                        doc_id = self.get_doc_id_from_dn(dn)
-                        change_attr = entry['add'][0]
-                        if table:
-                            doc_id = self.get_doc_id_from_dn(dn)
-                            data = self.spanner.exec_sql('SELECT {} FROM {} WHERE doc_id="{}"'.format(entry['add'][0], table, doc_id))
-                            if data.get('rows'):
-                                cur_data = []
+                if Config.cb_bulk_upsert:
+                    self.cb_bulk_upsert(cur_bucket, key, document)
+                else:
+                    n1ql_list.append(('UPSERT INTO `%s` (KEY, VALUE) VALUES ($key, $value)' % cur_bucket, document))
+
+            for q, value in n1ql_list:
+                with self.import_stats.round_trip(backend_location):
+                    self.cbm.exec_prepared(q, {'key': key, 'value': value})
+
+    def index_spanner_rows(self, table, columns, values):
+        if 'dn' in columns and 'doc_id' in columns:
+            dn_i, doc_id_i = columns.index('dn'), columns.index('doc_id')
+            for row in values:
+                self.index_dn(row[dn_i], table, row[doc_id_i])
+
+    def spanner_bulk_flush(self):
+        if self.spanner_writer:
+            # writer commits in background, waiting for it is the round trip time left
+            with self.import_stats.round_trip(BackendTypes.SPANNER):
+                self.spanner_writer.flush()
+            self.spanner_writer = None
+
+    def ldap_bulk_add(self, dn, entry):
+        if not self.ldap_bulk_conn:
+            self.ldap_bulk_conn = self.get_ldap_connection(client_strategy=ldap3.ASYNC)
+            self.ldap_bulk_pending = deque()
+            self.ldap_bulk_pending_dns = set()
+            self.ldap_bulk_result = {'added': 0, 'skipped': 0, 'failed': []}
+
+        # server may process outstanding requests in any order, parent must be added before its children
+        parent_dn = self.get_rev_dn(dn, parent=True)
+        while parent_dn in self.ldap_bulk_pending_dns:
+            self.ldap_bulk_collect()
+
+        base.logIt("Adding LDAP dn:{} entry:{}".format(dn, dict(entry)))
+        message_id = self.ldap_bulk_conn.add(dn, attributes=entry)
+        self.ldap_bulk_pending.append((message_id, dn))
+        self.ldap_bulk_pending_dns.add(self.get_rev_dn(dn))
+
+        # keep a bounded window of outstanding operations
+        while len(self.ldap_bulk_pending) >= int(Config.ldap_bulk_window):
+            self.ldap_bulk_collect()
+
+    def ldap_bulk_collect(self):
+        message_id, dn = self.ldap_bulk_pending.popleft()
+        self.ldap_bulk_pending_dns.discard(self.get_rev_dn(dn))
+        try:
+            with self.import_stats.round_trip(BackendTypes.LDAP):
+                response, result = self.ldap_bulk_conn.get_response(message_id)
+        except Exception as e:
+            result = {'result': None, 'description': str(e), 'message': ''}
+
+        if result['result'] == 0:
+            self.ldap_bulk_result['added'] += 1
+        elif result['result'] == 68:
+            # entryAlreadyExists, same as checking with dn_exists() before adding
+            base.logIt("DN {} exists in LDAP skipping".format(dn))
+            self.ldap_bulk_result['skipped'] += 1
+        else:
+            self.ldap_bulk_result['failed'].append((dn, result['description'], result['message']))
 
-                                if 'rows' in data and data['rows'] and data['rows'][0] and data['rows'][0][0]:
-                                    cur_data = data['rows'][0][0]
-                                
-                                for cur_val in entry[change_attr]:
-                                    typed_val = self.get_rdbm_val(change_attr, cur_val, rdbm_type='spanner')
-                                    cur_data.append(typed_val)
-    
-                            self.spanner.update_data(table=table, columns=['doc_id', change_attr], values=[[doc_id, cur_data]])
+    def ldap_bulk_flush(self):
+        if not self.ldap_bulk_conn:
+            return
 
-                    elif 'replace' in entry and 'changetype' in entry:
-                        table = self.get_spanner_table_for_dn(dn)
-                        doc_id = self.get_doc_id_from_dn(dn)
-                        replace_attr = entry['replace'][0]
-                        typed_val = self.get_rdbm_val(replace_attr, entry[replace_attr], rdbm_type='spanner')
-                        self.spanner.update_data(table=table, columns=['doc_id', replace_attr], values=[[doc_id, typed_val]])
+        while self.ldap_bulk_pending:
+            self.ldap_bulk_collect()
 
-                    else:
-                        vals = {}
-                        dn_parsed = dnutils.parse_dn(dn)
-                        rdn_name = dn_parsed[0][0]
-                        objectClass = objectClass = self.get_clean_objcet_class(entry)
-                        if objectClass.lower() == 'organizationalunit':
-                            continue
+        base.logIt("LDAP bulk add result: {} added, {} skipped, {} failed".format(
+                    self.ldap_bulk_result['added'],
+                    self.ldap_bulk_result['skipped'],
+                    len(self.ldap_bulk_result['failed'])
+                    ))
 
-                        vals['doc_id'] = dn_parsed[0][1]
-                        vals['dn'] = dn
-                        vals['objectClass'] = objectClass
+        for dn, description, message in self.ldap_bulk_result['failed']:
+            base.logIt("Adding LDAP dn:{} failed: {} {}".format(dn, description, message), True)
 
-                        if 'objectClass' in entry:
-                            entry.pop('objectClass')
-                        elif 'objectclass' in entry:
-                            entry.pop('objectclass')
+        self.ldap_bulk_conn.unbind()
+        self.ldap_bulk_conn = None
 
-                        table_name = objectClass
+    def cb_bulk_upsert(self, bucket, key, document):
+        if not self.cb_upserter:
+            self.cb_upserter = BulkUpserter(self.cbm, int(Config.cb_upsert_max_statement_size), int(Config.import_workers), executor=self.write_executor)
+        self.cb_upserter.upsert(bucket, key, document)
 
-                        for lkey in entry:
-                            vals[lkey] = self.get_rdbm_val(lkey, entry[lkey], rdbm_type='spanner')
+    def cb_bulk_flush(self):
+        if self.cb_upserter:
+            with self.import_stats.round_trip(BackendTypes.COUCHBASE):
+                self.cb_upserter.flush()
+            base.logIt("Upserted {} documents to Couchbase with {} queries".format(self.cb_upserter.document_count, self.cb_upserter.statement_count))
+            self.cb_upserter.close()
+            self.cb_upserter = None
 
-                        columns = [ *vals.keys() ]
-                        values = [ vals[lkey] for lkey in columns ]
+    def get_import_group(self, dn, entry, bucket=None, force=None):
+        backend_location = force if force else self.get_backend_location_for_dn(dn)
 
-                        self.spanner.insert_data(table=table_name, columns=columns, values=[values])
+        if backend_location == BackendTypes.LDAP:
+            # children of the same top level ou go to the same LDAP connection
+            return backend_location, ldif_utils.get_key_from(dn).split('_')[0]
 
-                elif backend_location == BackendTypes.COUCHBASE:
-                    if len(entry) < 3:
-                        continue
-                    key, document = ldif_utils.get_document_from_entry(dn, entry)
-                    cur_bucket = bucket if bucket else self.get_bucket_for_dn(dn)
-                    base.logIt("Addnig document {} to Couchebase bucket {}".format(key, cur_bucket))
-
-                    n1ql_list = []
-
-                    if 'changetype' in document:
-                        if 'replace' in document:
-                            attribute = document['replace']
-                            n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=%s' % (cur_bucket, key, attribute, json.dumps(document[attribute])))
-                        elif 'add' in document:
-                            attribute = document['add']
-                            result = self.check_attribute_exists(key, attribute)
-                            data = document[attribute]
-                            if result:
-                                if isinstance(data, list):
-                                    for d in data:
-                                        n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=ARRAY_APPEND(`%s`, %s)' % (cur_bucket, key, attribute, attribute, json.dumps(d)))
-                                else:
-                                    n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=ARRAY_APPEND(`%s`, %s)' % (cur_bucket, key, attribute, attribute, json.dumps(data)))
-                            else:
-                                if attribute in attribDataTypes.listAttributes and not isinstance(data, list):
-                                    data = [data]
-                                n1ql_list.append('UPDATE `%s` USE KEYS "%s" SET `%s`=%s' % (cur_bucket, key, attribute, json.dumps(data)))
-                    else:
-                        for k in document:
-                            try:
-                                kdata = json.loads(document[k])
-                                if isinstance(kdata, dict):
-                                    document[k] = kdata
-                            except:
-                                pass
+        if backend_location == BackendTypes.COUCHBASE:
+            return backend_location, bucket if bucket else self.get_bucket_for_dn(dn)
+
+        objectClass = [ oc for oc in entry.get('objectClass') or entry.get('objectclass') or [] if oc != 'top' ]
+        return backend_location, objectClass[-1] if objectClass else None
+
+    def get_import_worker(self, backend_location, write_executor=None):
+        # shallow copy shares schema, reflected classes and dn index but gets its own connection
+        worker = copy.copy(self)
+        worker.rdbm_bulk_rows = {}
+        worker.cb_upserter = None
+        worker.ldap_bulk_conn = None
+        worker.spanner_writer = None
+        # bulk writers of all workers share one executor instead of a pool each
+        worker.write_executor = write_executor
+
+        if backend_location == BackendTypes.LDAP:
+            worker.ldap_conn = self.ldap_pool.acquire()
+        elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+            worker.session = self.get_session()
+
+        return worker
+
+    def import_group_worker(self, group, entries, bucket=None, force=None, write_executor=None):
+        backend_location = group[0]
+        worker = self.get_import_worker(backend_location, write_executor)
+        try:
+            worker.import_entries(entries, bucket, force)
+        finally:
+            if backend_location == BackendTypes.LDAP:
+                self.ldap_pool.release(worker.ldap_conn)
+            elif backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+                worker.session.close()
+
+    def import_ldif_parallel(self, ldif_files, bucket=None, force=None, workers=None):
+        """Imports entries of ldif files while they are read. Additions are buffered
+        per dn depth and import group, a buffer of Config.import_chunk_size entries
+        becomes a job of the workers, so large tables are split into chunks. Jobs of
+        a depth start after jobs of lower depths are done, parents are written before
+        their children. As for import_ldif, entries must follow their parents in the
+        files. Modify records run after the additions they follow and before the ones
+        after them, as in the files.
+        """
+        workers = int(workers or Config.import_workers)
+
+        if not Config.parallel_import or workers < 2:
+            return self.import_ldif(ldif_files, bucket, force)
+
+        base.logIt("Importing ldif file(s) with {} workers: {} ".format(workers, ', '.join(ldif_files)))
+
+        if self.session and self.Base is None:
+            # workers share reflected classes, reflect before spawning them
+            self.rdm_automapper()
+
+        start_time = time.perf_counter()
+        chunk_size = int(Config.import_chunk_size)
+        buffers = OrderedDict()
+        running = deque()
+        modifications = []
+
+        def read_entries():
+            for ldif_fn in ldif_files:
+                base.logIt("Reading entries from " + ldif_fn)
+                for dn, entry in self.import_stats.count_file_entries(ldif_fn, ldif_utils.myLdifParser(ldif_fn)):
+                    yield dn, entry
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=workers) as write_executor:
+
+            def wait(future, depth, group):
+                try:
+                    future.result()
+                except Exception as e:
+                    # children of entries that were not written can't be imported
+                    base.logIt("Importing entries for {} failed: {}".format(group, e), True)
+                    raise
+
+            def drain(depth=None):
+                # submits buffers and waits for jobs of lower depths, all if depth is not given
+                for key in [ key for key in buffers if depth is None or key[0] < depth ]:
+                    submit(key)
+                for job in [ job for job in running if depth is None or job[1] < depth ]:
+                    running.remove(job)
+                    wait(*job)
+
+            def submit(key):
+                entries = buffers.pop(key)
+                drain(key[0])
+                while len(running) >= workers * 2:
+                    wait(*running.popleft())
+                running.append((executor.submit(self.import_group_worker, key[1], entries, bucket, force, write_executor), key[0], key[1]))
+
+            for dn, entry in read_entries():
+                if 'changetype' in entry:
+                    modifications.append((dn, entry))
+                    continue
 
-                        n1ql_list.append('UPSERT INTO `%s` (KEY, VALUE) VALUES ("%s", %s)' % (cur_bucket, key, json.dumps(document)))
+                if modifications:
+                    drain()
+                    self.import_entries(modifications, bucket, force)
+                    modifications = []
 
-                    for q in n1ql_list:
-                        self.cbm.exec_query(q)
+                key = (len(dnutils.parse_dn(dn)), self.get_import_group(dn, entry, bucket, force))
+                buffers.setdefault(key, []).append((dn, entry))
+                if len(buffers[key]) >= chunk_size:
+                    submit(key)
+
+            drain()
+            if modifications:
+                self.import_entries(modifications, bucket, force)
+
+        # files are imported together, each of them is given the elapsed time of the whole run
+        for ldif_fn in ldif_files:
+            self.import_stats.add_entries('file', ldif_fn, 0, time.perf_counter() - start_time)
+
+    def rdbm_bulk_add(self, table_name, vals):
+        self.rdbm_bulk_rows.setdefault(table_name, []).append(vals)
+        if len(self.rdbm_bulk_rows[table_name]) >= int(Config.rdbm_import_batch_size):
+            self.rdbm_bulk_flush(table_name)
+
+    def rdbm_bulk_flush(self, table_name=None):
+        for tbl in [table_name] if table_name else list(self.rdbm_bulk_rows.keys()):
+            rows = self.rdbm_bulk_rows.pop(tbl, [])
+            if not rows:
+                continue
+
+            sqlalchemy_table = self.Base.classes[tbl].__table__
+
+            # single existence check for the whole chunk instead of one query per entry
+            existing_dns = set()
+            dn_list = [ row['dn'] for row in rows ]
+            with self.import_stats.timer('existence check'):
+                for result in self.session.query(sqlalchemy_table.columns.dn, sqlalchemy_table.columns.doc_id).filter(sqlalchemy_table.columns.dn.in_(dn_list)):
+                    existing_dns.add(result[0])
+                    self.index_dn(result[0], tbl, result[1])
+
+            for insert_rows in self.get_rdbm_insert_groups(sqlalchemy_table, rows, existing_dns):
+                self.rdbm_insert_rows(sqlalchemy_table, insert_rows)
+
+    def get_rdbm_insert_groups(self, sqlalchemy_table, rows, existing_dns):
+        """Groups rows to be inserted by their columns, executemany requires identical keys for every row"""
+        groups = OrderedDict()
+        for row in rows:
+            if row['dn'] in existing_dns:
+                base.logIt("DN {} exsits in {} skipping".format(row['dn'], Config.rdbm_type))
+                continue
+            existing_dns.add(row['dn'])
+
+            # absent columns are omitted so database defaults apply, as in row by row import
+            insert_row = {}
+            for col in sqlalchemy_table.columns:
+                if col.name in row:
+                    insert_row[col.name] = row[col.name]
+                elif isinstance(col.type, self.json_dialects_instance):
+                    insert_row[col.name] = {'v': []}
+            groups.setdefault(tuple(insert_row), []).append(insert_row)
+
+        return list(groups.values())
+
+    def rdbm_insert_rows(self, sqlalchemy_table, insert_rows):
+        tbl = sqlalchemy_table.name
+        base.logIt("Adding {} rows to {}".format(len(insert_rows), tbl))
+        try:
+            with self.import_stats.round_trip(Config.rdbm_type):
+                self.session.execute(sqlalchemy_table.insert(), insert_rows)
+                self.session.commit()
+        except Exception as e:
+            self.session.rollback()
+            base.logIt("Bulk insert to {} failed, retrying row by row: {}".format(tbl, e))
+            for insert_row in insert_rows[:]:
+                try:
+                    self.session.execute(sqlalchemy_table.insert(), insert_row)
+                    self.session.commit()
+                except Exception as e:
+                    self.session.rollback()
+                    insert_rows.remove(insert_row)
+                    base.logIt("ERROR adding {} to {}: {}".format(insert_row['dn'], tbl, e), True)
+
+        # only committed rows are indexed
+        for insert_row in insert_rows:
+            self.index_dn(insert_row['dn'], tbl, insert_row['doc_id'])
 
     def import_schema(self, schema_file):
         if self.moddb == BackendTypes.LDAP:
             base.logIt("Importing schema {}".format(schema_file))
-            parser = ldif_utils.myLdifParser(schema_file)
-            parser.parse()
-            for dn, entry in parser.entries:
+            for dn, entry in ldif_utils.myLdifParser(schema_file):
                 if 'changetype' in entry:
                     entry.pop('changetype')
                 if 'add' in entry:
@@ -1032,7 +1705,7 @@ class DBUtils:
 
     def __del__(self):
         try:
-            self.ldap_conn.unbind()
+            self.close_ldap_connections()
             self.ready = False
         except:
             pass
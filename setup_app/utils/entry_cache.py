@@ -0,0 +1,77 @@
+import time
+import copy
+import threading
+
+from collections import OrderedDict
+
+
+class EntryCache:
+    """Process local LRU cache of entries and search results read through DBUtils.
+
+    Keys are tuples starting with kind and lowercased dn, ('dn', dn, ...) for
+    entries and ('search', search_base, ...) for search results. Cached values are
+    copied on both put and get, so callers can modify what they receive. Writes
+    through DBUtils, including ldap_modify() and ldap_add() used by installers,
+    invalidate the dn. Entries expire after ttl seconds, which limits staleness
+    caused by changes made outside of DBUtils.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def copy_value(self, value):
+        # search results of rdbm backends are __dict__ of mapped objects, drop their sqlalchemy state
+        if isinstance(value, dict):
+            return { k: copy.deepcopy(v) for k, v in value.items() if k != '_sa_instance_state' }
+        if isinstance(value, (list, tuple)):
+            return type(value)([ self.copy_value(v) for v in value ])
+        return copy.deepcopy(value)
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or item[0] < time.time():
+                if item:
+                    self.entries.pop(key)
+                self.misses += 1
+                return
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return self.copy_value(item[1])
+
+    def put(self, key, value):
+        if not value or not self.max_size:
+            return
+
+        value = self.copy_value(value)
+
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, dn=None):
+        """Removes entries of dn and search results that may contain it, all entries if dn is not given"""
+
+        with self.lock:
+            self.invalidations += 1
+            if dn is None:
+                self.entries.clear()
+                return
+
+            dn = dn.lower()
+            for key in list(self.entries):
+                if (key[0] == 'dn' and key[1] == dn) or (key[0] == 'search' and dn.endswith(key[1])):
+                    self.entries.pop(key)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import threading
+import contextlib
+
+from setup_app import paths
+from setup_app.static import BackendTypes
+from setup_app.utils import base
+
+backend_names = {
+        BackendTypes.LDAP: 'ldap',
+        BackendTypes.COUCHBASE: 'couchbase',
+        BackendTypes.MYSQL: 'mysql',
+        BackendTypes.PGSQL: 'pgsql',
+        BackendTypes.SPANNER: 'spanner',
+        }
+
+
+class ImportStats:
+    """Collects entry counters and timers of ldif imports.
+
+    Parallel import workers share one instance, so every update holds a lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.start_time = time.time()
+        self.entries = {'file': {}, 'backend': {}, 'table': {}}
+        self.timers = {}
+
+    def add_entries(self, scope, name, count=1, elapsed=0):
+        with self.lock:
+            counter = self.entries[scope].setdefault(str(name), [0, 0.0])
+            counter[0] += count
+            counter[1] += elapsed
+
+    def add_entry(self, backend_location, table, elapsed, count=1):
+        backend = backend_names.get(backend_location, str(backend_location))
+        self.add_entries('backend', backend, count, elapsed)
+        self.add_entries('table', '{}:{}'.format(backend, table), count, elapsed)
+
+    def add_time(self, name, elapsed, calls=1):
+        with self.lock:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += calls
+            timer[1] += elapsed
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start_time)
+
+    def count_file_entries(self, ldif_fn, entries):
+        for dn, entry in entries:
+            self.add_entries('file', ldif_fn)
+            yield dn, entry
+
+    def round_trip(self, backend_location):
+        return self.timer('{} round trip'.format(backend_names.get(backend_location, backend_location)))
+
+    def summary(self):
+        summary = {'elapsed': round(time.time() - self.start_time, 3), 'timers': {}}
+
+        with self.lock:
+            for scope in self.entries:
+                summary[scope] = {}
+                for name, (count, elapsed) in self.entries[scope].items():
+                    summary[scope][name] = {
+                            'entries': count,
+                            'seconds': round(elapsed, 3),
+                            'entries_per_sec': round(count / elapsed, 1) if elapsed else None,
+                            }
+
+            for name, (calls, elapsed) in self.timers.items():
+                summary['timers'][name] = {'calls': calls, 'seconds': round(elapsed, 3)}
+
+        return summary
+
+    def format_summary(self, summary=None):
+        summary = summary or self.summary()
+        lines = ['Import summary ({} seconds)'.format(summary['elapsed'])]
+        row_format = '  {:<50} {:>10} {:>10} {:>12}'
+
+        for scope in self.entries:
+            if not summary[scope]:
+                continue
+            lines.append(row_format.format(scope, 'entries', 'seconds', 'entries/sec'))
+            for name, stats in sorted(summary[scope].items()):
+                lines.append(row_format.format(name[-50:], stats['entries'], stats['seconds'], stats['entries_per_sec'] or '-'))
+
+        if summary['timers']:
+            lines.append(row_format.format('timer', 'calls', 'seconds', 'ms/call'))
+            for name, stats in sorted(summary['timers'].items()):
+                lines.append(row_format.format(name, stats['calls'], stats['seconds'], round(stats['seconds'] * 1000 / stats['calls'], 2)))
+
+        return '\n'.join(lines)
+
+    def dump(self, fn=os.path.join(paths.LOG_DIR, 'import_stats.json')):
+        summary = self.summary()
+        if not (summary['file'] or summary['backend']):
+            return
+
+        summary_str = self.format_summary(summary)
+        base.logIt(summary_str)
+
+        with open(fn, 'w') as w:
+            json.dump(summary, w, indent=2)
+
+        return summary_str
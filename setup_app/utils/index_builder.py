@@ -0,0 +1,155 @@
+import re
+import time
+import hashlib
+import concurrent.futures
+
+import sqlalchemy
+
+from setup_app.config import Config
+from setup_app.utils import base
+
+
+class IndexBuilder:
+    """Builds MySQL and PostgreSQL indexes concurrently with online DDL.
+
+    Indexes are collected with add() and created by build() on a pool of
+    workers, each with its own autocommit connection. MySQL indexes are added
+    with ALGORITHM=INPLACE, LOCK=NONE and PostgreSQL indexes with CREATE INDEX
+    CONCURRENTLY, so tables stay writable while they are indexed. Indexes that
+    exist are skipped, invalid leftovers of failed concurrent builds are
+    dropped and built again. PostgreSQL indexes are also matched by definition,
+    former setups created them without names.
+    """
+
+    max_name_length = 63
+
+    def __init__(self, dbutils, workers=None):
+        self.dbutils = dbutils
+        self.workers = int(workers or Config.index_workers)
+        self.indexes = []
+        self.results = []
+        self.existing_definitions = set()
+
+    def get_index_name(self, name):
+        # PostgreSQL truncates longer identifiers, keep them unique
+        if len(name) > self.max_name_length:
+            name = name[:self.max_name_length - 9] + '_' + hashlib.sha256(name.encode()).hexdigest()[:8]
+        return name
+
+    def add(self, table, name, columns):
+        """Adds index name on table, columns is the SQL in parentheses of index definition"""
+        self.indexes.append((table, self.get_index_name(name), columns))
+
+    def normalize_definition(self, columns):
+        """Returns comparable form of index columns, as written to add() or as in pg_get_indexdef()"""
+        m = re.search(r' USING \w+ (.*)$', columns)
+        if m:
+            columns = m.group(1)
+        # PostgreSQL adds casts to string literals, quotes and parentheses as it likes
+        columns = columns.replace("'::text", "'")
+        return re.sub(r'[\s"()]', '', columns).lower()
+
+    def get_existing_indexes(self):
+        if Config.rdbm_type == 'mysql':
+            query = "SELECT DISTINCT TABLE_NAME, INDEX_NAME, 1, '' FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = :database"
+        else:
+            query = ('SELECT t.relname, i.relname, x.indisvalid, pg_get_indexdef(x.indexrelid) FROM pg_index x '
+                     'JOIN pg_class i ON i.oid = x.indexrelid JOIN pg_class t ON t.oid = x.indrelid '
+                     'JOIN pg_namespace n ON n.oid = t.relnamespace WHERE n.nspname = current_schema()')
+
+        with self.dbutils.engine.connect() as conn:
+            rows = conn.execute(sqlalchemy.text(query), {'database': Config.rdbm_db}).fetchall()
+
+        if Config.rdbm_type == 'pgsql':
+            self.existing_definitions = set([ (row[0], self.normalize_definition(row[3])) for row in rows if row[2] ])
+
+        return { (row[0], row[1]): bool(row[2]) for row in rows }
+
+    def get_sql(self, table, name, columns, online=True):
+        if Config.rdbm_type == 'mysql':
+            sql_cmd = 'ALTER TABLE `{}`.`{}` ADD INDEX `{}` ({})'.format(Config.rdbm_db, table, name, columns)
+            if online:
+                sql_cmd += ', ALGORITHM=INPLACE, LOCK=NONE'
+            return sql_cmd + ';'
+
+        return 'CREATE INDEX {}"{}" ON "{}" ({});'.format('CONCURRENTLY ' if online else '', name, table, columns)
+
+    def execute(self, conn, sql_cmd):
+        base.logIt("Executing {} Query: {}".format(Config.rdbm_type, sql_cmd))
+        if hasattr(conn, 'exec_driver_sql'):
+            conn.exec_driver_sql(sql_cmd)
+        else:
+            conn.execute(sql_cmd)
+
+    def build_index(self, table, name, columns):
+        start_time = time.perf_counter()
+
+        with self.dbutils.engine.connect() as conn:
+            # CREATE INDEX CONCURRENTLY can't run in a transaction
+            conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+            try:
+                self.execute(conn, self.get_sql(table, name, columns))
+            except Exception as e:
+                if Config.rdbm_type == 'mysql' and ('ALGORITHM' in str(e) or 'LOCK=NONE' in str(e)):
+                    # some index types, e.g. multi-valued ones, can't be built in place
+                    base.logIt("Index {} on {} can't be built online, building with table copy: {}".format(name, table, e))
+                    self.execute(conn, self.get_sql(table, name, columns, online=False))
+                elif Config.rdbm_type == 'pgsql' and 'partitioned table' in str(e):
+                    # indexes of partitioned tables can't be built concurrently
+                    base.logIt("Index {} on partitioned table {} is built without CONCURRENTLY".format(name, table))
+                    self.execute(conn, self.get_sql(table, name, columns, online=False))
+                else:
+                    if Config.rdbm_type == 'pgsql':
+                        # failed concurrent build leaves an invalid index
+                        self.execute(conn, 'DROP INDEX CONCURRENTLY IF EXISTS "{}";'.format(name))
+                    raise
+
+        return time.perf_counter() - start_time
+
+    def get_missing_indexes(self):
+        existing = self.get_existing_indexes()
+        indexes = []
+
+        for table, name, columns in self.indexes:
+            valid = existing.get((table, name))
+            if valid:
+                base.logIt("Index {} on {} exists, skipping".format(name, table))
+                continue
+            if (table, self.normalize_definition(columns)) in self.existing_definitions:
+                base.logIt("Index {} on {} exists with another name, skipping".format(name, table))
+                continue
+            if valid is False:
+                base.logIt("Dropping invalid index {} on {}".format(name, table))
+                with self.dbutils.engine.connect() as conn:
+                    self.execute(conn.execution_options(isolation_level='AUTOCOMMIT'), 'DROP INDEX CONCURRENTLY IF EXISTS "{}";'.format(name))
+            indexes.append((table, name, columns))
+
+        return indexes
+
+    def build(self, indexes=None):
+        if indexes is None:
+            indexes = self.get_missing_indexes() if self.indexes else []
+
+        if not indexes:
+            return []
+
+        base.logIt("Building {} indexes with {} workers".format(len(indexes), self.workers))
+        start_time = time.perf_counter()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = { executor.submit(self.build_index, *index): index for index in indexes }
+            for future in concurrent.futures.as_completed(futures):
+                table, name, columns = futures[future]
+                try:
+                    elapsed = future.result()
+                except Exception as e:
+                    base.logIt("ERROR building index {} on {}: {}".format(name, table, e), True)
+                    self.results.append((table, name, None))
+                else:
+                    base.logIt("Index {} on {} was built in {:.2f} seconds".format(name, table, elapsed))
+                    self.dbutils.import_stats.add_time('index build', elapsed)
+                    self.results.append((table, name, elapsed))
+
+        base.logIt("Built {} indexes in {:.2f} seconds".format(len([ result for result in self.results if result[2] is not None ]), time.perf_counter() - start_time))
+
+        return self.results
@@ -0,0 +1,373 @@
+import re
+import functools
+
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+
+from setup_app.utils.attributes import attribDataTypes
+
+# simple filter item; values can't contain unescaped parentheses (RFC 4515)
+filter_item_re = re.compile(r'\(([^()&|!=<>~]+)(=|>=|<=|~=)((?:[^()\\]|\\[0-9a-fA-F]{2})*)\)')
+escaped_char_re = re.compile(rb'\\([0-9a-fA-F]{2})')
+
+
+class FilterError(ValueError):
+    pass
+
+
+def unescape(value):
+    return escaped_char_re.sub(lambda m: bytes([int(m.group(1), 16)]), value.encode()).decode('utf-8')
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def extract_values(search_filter):
+    """Replaces assertion values of search_filter with ? and returns filter template
+    and unescaped values in the order they appear in filter"""
+
+    values = []
+
+    def replace_value(m):
+        attribute, operator, value = m.groups()
+        if operator == '=' and '*' in value:
+            if value == '*':
+                return m.group(0)
+            parts = value.split('*')
+            values.extend([ unescape(part) for part in parts if part ])
+            value = '*'.join([ '?' if part else '' for part in parts ])
+        else:
+            values.append(unescape(value))
+            value = '?'
+
+        return '({}{}{})'.format(attribute.strip(), operator, value)
+
+    search_filter = search_filter.strip()
+    if not search_filter.startswith('('):
+        search_filter = '(' + search_filter + ')'
+
+    return filter_item_re.sub(replace_value, search_filter), values
+
+
+@functools.lru_cache(maxsize=512)
+def parse_template(template):
+    """Parses filter template to a tree of tuples, assertion values are referenced
+    by their position in values list returned by extract_values()
+
+    ('and', [node, ...]), ('or', [node, ...]), ('not', node), ('present', attribute),
+    ('eq'|'ge'|'le', attribute, index), ('substr', attribute, initial, [any, ...], final)
+    """
+
+    position = 0
+    index = 0
+
+    def parse_node():
+        nonlocal position, index
+
+        if template[position:position+1] != '(':
+            raise FilterError("Expected ( at position {} of {}".format(position, template))
+        position += 1
+
+        operator = template[position:position+1]
+        if operator in ('&', '|'):
+            position += 1
+            children = []
+            while template[position:position+1] == '(':
+                children.append(parse_node())
+            node = ('and' if operator == '&' else 'or', children)
+
+        elif operator == '!':
+            position += 1
+            node = ('not', parse_node())
+
+        else:
+            end = template.find(')', position)
+            if end < 0:
+                raise FilterError("Unbalanced parentheses in {}".format(template))
+            m = re.match(r'^([^=<>~]+)(=|>=|<=|~=)(.*)$', template[position:end])
+            if not m:
+                raise FilterError("Invalid filter item {}".format(template[position:end]))
+            attribute, operator, value = m.groups()
+            position = end
+
+            # values were replaced by ?, others are leftovers of unbalanced parentheses
+            if value != '?' and not (operator == '=' and re.match(r'^\??(\*\?)*\*\??$', value)):
+                raise FilterError("Invalid assertion value in {}".format(template))
+
+            if operator == '=' and value == '*':
+                node = ('present', attribute)
+            elif operator == '=' and '*' in value:
+                parts = []
+                for part in value.split('*'):
+                    parts.append(index if part else None)
+                    if part:
+                        index += 1
+                node = ('substr', attribute, parts[0], [ part for part in parts[1:-1] if part is not None ], parts[-1])
+            else:
+                node = ({'>=': 'ge', '<=': 'le'}.get(operator, 'eq'), attribute, index)
+                index += 1
+
+        if template[position:position+1] != ')':
+            raise FilterError("Expected ) at position {} of {}".format(position, template))
+        position += 1
+
+        return node
+
+    tree = parse_node()
+    if position != len(template):
+        raise FilterError("Unexpected characters after position {} of {}".format(position, template))
+
+    return tree
+
+
+def substring_pattern(node, values):
+    attribute, initial, anys, final = node[1:]
+    pattern = escape_like(values[initial]) if initial is not None else ''
+    for i in anys:
+        pattern += '%' + escape_like(values[i])
+    pattern += '%'
+    if final is not None:
+        pattern += escape_like(values[final])
+    return pattern
+
+
+def split_object_class(tree, values):
+    """Returns objectClass value of top level equality assertion, which selects the
+    table to be searched, and remaining filter tree"""
+
+    if tree[0] == 'eq' and tree[1].lower() == 'objectclass':
+        return values[tree[2]], ('and', [])
+
+    if tree[0] == 'and':
+        for i, child in enumerate(tree[1]):
+            if child[0] == 'eq' and child[1].lower() == 'objectclass':
+                return values[child[2]], ('and', tree[1][:i] + tree[1][i+1:])
+
+    return None, tree
+
+
+class SearchFilter:
+
+    def __init__(self, search_filter):
+        self.search_filter = search_filter
+        self.template, self.values = extract_values(search_filter)
+        self.tree = parse_template(self.template)
+        self.object_class, self.residual_tree = split_object_class(self.tree, self.values)
+
+
+class CompiledFilter:
+    """Compiled filter template; binders convert values of a search to query parameters"""
+
+    def __init__(self, clause, binders):
+        self.clause = clause
+        self.binders = binders
+
+    def bind(self, values):
+        return { name: binder(values) for name, binder in self.binders }
+
+
+class FilterCompiler:
+    """Compiles search filters to SQLAlchemy clauses, Spanner SQL and N1QL, compiled
+    filters are cached by filter template, so only values are converted for each search"""
+
+    def __init__(self, dbutils, cache_size=512):
+        self.dbutils = dbutils
+        self.cache_size = cache_size
+        self.plans = {}
+
+    def get_plan(self, key, compile_func):
+        plan = self.plans.get(key)
+        if plan is None:
+            if len(self.plans) >= self.cache_size:
+                self.plans.pop(next(iter(self.plans)))
+            plan = compile_func()
+            self.plans[key] = plan
+        return plan
+
+    # SQLAlchemy
+
+    def sqlalchemy_filter(self, search_filter, sqlalchemy_table, dialect):
+        key = ('sql', dialect, sqlalchemy_table.name, search_filter.template)
+        plan = self.get_plan(key, lambda: self.compile_sqlalchemy(search_filter.residual_tree, sqlalchemy_table, dialect))
+        return plan.clause, plan.bind(search_filter.values)
+
+    def compile_sqlalchemy(self, tree, sqlalchemy_table, dialect):
+        binders = []
+        columns = { col.name.lower(): col for col in sqlalchemy_table.columns }
+
+        def param(binder, type_=None):
+            name = 'p{}'.format(len(binders))
+            binders.append((name, binder))
+            return sqlalchemy.bindparam(name, type_=type_)
+
+        def typed_value(attribute, i):
+            return lambda values: self.dbutils.get_rdbm_val(attribute, [values[i]])
+
+        def compile_node(node):
+            if node[0] in ('and', 'or'):
+                clauses = [ compile_node(child) for child in node[1] ]
+                if node[0] == 'and':
+                    return sqlalchemy.and_(sqlalchemy.true(), *clauses)
+                return sqlalchemy.or_(sqlalchemy.false(), *clauses)
+
+            if node[0] == 'not':
+                return sqlalchemy.not_(compile_node(node[1]))
+
+            col = columns.get(node[1].lower())
+            if col is None:
+                # undefined attribute never matches
+                return sqlalchemy.false()
+
+            multivalued = isinstance(col.type, self.dbutils.json_dialects_instance)
+
+            if node[0] == 'present':
+                if multivalued:
+                    if dialect == 'mysql':
+                        return sqlalchemy.func.json_length(col, '$.v') > 0
+                    return sqlalchemy.func.json_array_length(col.op('->')('v')) > 0
+                return col.isnot(None)
+
+            if node[0] == 'substr':
+                pattern = param(functools.partial(substring_pattern, node), sqlalchemy.String())
+                if multivalued:
+                    return sqlalchemy.cast(col, sqlalchemy.Text()).like(sqlalchemy.func.concat('%"', pattern, '"%'), escape='\\')
+                return col.like(pattern, escape='\\')
+
+            if multivalued:
+                value = param(lambda values, i=node[2]: values[i], sqlalchemy.String())
+                if node[0] != 'eq':
+                    # ordering matches if any of the values matches, compare element by element
+                    if dialect == 'mysql':
+                        elements = sqlalchemy.func.json_table(col, sqlalchemy.literal_column("'$.v[*]' COLUMNS (e TEXT PATH '$')")).alias('jt')
+                        element = sqlalchemy.literal_column('jt.e')
+                    else:
+                        elements = sqlalchemy.func.jsonb_array_elements_text(sqlalchemy.cast(col, sqlalchemy.dialects.postgresql.JSONB).op('->')('v')).alias('e')
+                        element = sqlalchemy.literal_column('e')
+                    return sqlalchemy.exists(
+                            sqlalchemy.select([sqlalchemy.literal_column('1')]).select_from(elements).where(element.op('>=' if node[0] == 'ge' else '<=')(value))
+                            )
+                if dialect == 'mysql':
+                    return sqlalchemy.func.json_contains(col, sqlalchemy.func.json_quote(value), '$.v') == 1
+                jsonb = sqlalchemy.dialects.postgresql.JSONB
+                return sqlalchemy.cast(col, jsonb).op('@>')(sqlalchemy.func.jsonb_build_object('v', sqlalchemy.func.jsonb_build_array(value)))
+
+            value = param(typed_value(node[1], node[2]))
+            if node[0] == 'ge':
+                return col >= value
+            if node[0] == 'le':
+                return col <= value
+            return col == value
+
+        return CompiledFilter(compile_node(tree), binders)
+
+    # Spanner
+
+    def spanner_filter(self, search_filter, table):
+        key = ('spanner', table, search_filter.template)
+        plan = self.get_plan(key, lambda: self.compile_spanner(search_filter.residual_tree, table))
+        return plan.clause, plan.bind(search_filter.values)
+
+    def compile_spanner(self, tree, table):
+        binders = []
+
+        def param(binder):
+            name = 'p{}'.format(len(binders))
+            binders.append((name, binder))
+            return '@' + name
+
+        def typed_value(data_type, i):
+            if data_type == 'INT64':
+                return lambda values: int(values[i])
+            if data_type == 'BOOL':
+                return lambda values: values[i].lower() in ('1', 'on', 'true', 'yes', 'ok')
+            if data_type == 'TIMESTAMP':
+                # generalized time to RFC 3339
+                return lambda values: '{}-{}-{}T{}:{}:{}Z'.format(values[i][0:4], values[i][4:6], values[i][6:8], values[i][8:10], values[i][10:12], values[i][12:14])
+            return lambda values: values[i]
+
+        def compile_node(node):
+            if node[0] in ('and', 'or'):
+                if not node[1]:
+                    return 'TRUE' if node[0] == 'and' else 'FALSE'
+                return '(' + (' AND ' if node[0] == 'and' else ' OR ').join([ compile_node(child) for child in node[1] ]) + ')'
+
+            if node[0] == 'not':
+                return '(NOT {})'.format(compile_node(node[1]))
+
+            attribute = node[1]
+            column = '`{}`'.format(attribute)
+            data_type = self.dbutils.get_attr_sql_data_type(attribute)
+            multivalued = data_type.startswith('ARRAY')
+
+            if node[0] == 'present':
+                return '(ARRAY_LENGTH({0}) > 0)'.format(column) if multivalued else '({} IS NOT NULL)'.format(column)
+
+            if node[0] == 'substr':
+                pattern = param(functools.partial(substring_pattern, node))
+                if multivalued:
+                    return 'EXISTS(SELECT 1 FROM UNNEST({}) AS v WHERE v LIKE {})'.format(column, pattern)
+                return '({} LIKE {})'.format(column, pattern)
+
+            value = param(typed_value(data_type, node[2]))
+            if data_type == 'TIMESTAMP':
+                value = 'TIMESTAMP({})'.format(value)
+
+            operator = {'ge': '>=', 'le': '<='}.get(node[0], '=')
+            if multivalued:
+                if operator == '=':
+                    return '({} IN UNNEST({}))'.format(value, column)
+                return 'EXISTS(SELECT 1 FROM UNNEST({}) AS v WHERE v {} {})'.format(column, operator, value)
+
+            return '({} {} {})'.format(column, operator, value)
+
+        return CompiledFilter(compile_node(tree), binders)
+
+    # N1QL
+
+    def n1ql_filter(self, search_filter):
+        key = ('n1ql', search_filter.template)
+        plan = self.get_plan(key, lambda: self.compile_n1ql(search_filter.tree))
+        return plan.clause, plan.bind(search_filter.values)
+
+    def compile_n1ql(self, tree):
+        binders = []
+
+        def param(binder):
+            name = 'p{}'.format(len(binders))
+            binders.append((name, binder))
+            return '$' + name
+
+        def typed_value(attribute, i):
+            data_type = attribDataTypes.getAttribDataType(attribute)
+            return lambda values: attribDataTypes.getTypedValue(data_type, values[i])
+
+        def compile_node(node):
+            if node[0] in ('and', 'or'):
+                if not node[1]:
+                    return 'TRUE' if node[0] == 'and' else 'FALSE'
+                return '(' + (' AND ' if node[0] == 'and' else ' OR ').join([ compile_node(child) for child in node[1] ]) + ')'
+
+            if node[0] == 'not':
+                return '(NOT {})'.format(compile_node(node[1]))
+
+            column = '`{}`'.format(node[1])
+            # scalar predicates can use GSI indexes, only multivalued attributes are arrays
+            multivalued = node[1] in attribDataTypes.listAttributes
+
+            if node[0] == 'present':
+                return '({} IS VALUED)'.format(column)
+
+            if node[0] == 'substr':
+                pattern = param(functools.partial(substring_pattern, node))
+                if multivalued:
+                    return '(ANY v IN TO_ARRAY({}) SATISFIES v LIKE {} END)'.format(column, pattern)
+                return '({} LIKE {})'.format(column, pattern)
+
+            value = param(typed_value(node[1], node[2]))
+            operator = {'ge': '>=', 'le': '<='}.get(node[0], '=')
+            if multivalued:
+                return '(ANY v IN TO_ARRAY({}) SATISFIES v {} {} END)'.format(column, operator, value)
+            return '({} {} {})'.format(column, operator, value)
+
+        return CompiledFilter(compile_node(tree), binders)
@@ -0,0 +1,363 @@
+import os
+import json
+import hashlib
+import glob
+
+from collections import OrderedDict
+from ldap3.utils import dn as dnutils
+
+from setup_app.config import Config
+from setup_app.static import BackendTypes
+from setup_app.utils import base
+from setup_app.utils import ldif_utils
+from setup_app.utils.attributes import attribDataTypes
+from setup_app.utils.partitions import TablePartitioner
+from setup_app.pylib.ldif4.ldif import LDIFWriter
+
+import sqlalchemy
+import sqlalchemy.dialects.mysql
+import sqlalchemy.dialects.postgresql
+
+
+class LdifCompiler:
+    """Compiles rendered ldif files into backend native bulk load artifacts.
+
+    Compilation does not need a database connection, only the schema loaded by
+    DBUtils.read_jans_schema(). Modify records that target entries of the
+    compiled set are merged into them, others are written to a residual ldif
+    file which is imported with DBUtils.import_ldif() after the artifact is loaded.
+    """
+
+    # literals are rendered by column type, others are strings
+    sql_column_types = {
+            'INT': sqlalchemy.Integer,
+            'SMALLINT': sqlalchemy.SmallInteger,
+            'BOOL': sqlalchemy.Boolean,
+            }
+
+    def __init__(self, dbutils, backend_location):
+        self.dbutils = dbutils
+        self.backend_location = backend_location
+        self.partitioner = TablePartitioner(dbutils)
+
+        if backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL, BackendTypes.SPANNER):
+            self.output_dir = os.path.join(Config.outputFolder, Config.rdbm_type)
+            self.artifact_fn = os.path.join(self.output_dir, 'jans_data.json' if backend_location == BackendTypes.SPANNER else 'jans_data.sql')
+        else:
+            self.output_dir = os.path.join(Config.outputFolder, 'couchbase')
+            self.artifact_fn = os.path.join(self.output_dir, 'jans_data.n1ql')
+
+        self.residual_fn = os.path.splitext(self.artifact_fn)[0] + '_modify.ldif'
+        self.hash_fn = self.artifact_fn + '.sha256'
+
+    def content_hash(self, ldif_files, bucket=None):
+        sha = hashlib.sha256()
+        sha.update('{}:{}:{}'.format(self.backend_location, Config.rdbm_type, bucket).encode())
+        # mappings and partitioning decide which entries go to artifact and which to residual file
+        sha.update(json.dumps([
+                Config.mappingLocations,
+                Config.rdbm_partition,
+                Config.rdbm_partition_tables,
+                Config.rdbm_partition_column,
+                ], sort_keys=True).encode())
+
+        # conversion depends on schema and type mappings as well as on ldif files
+        dependencies = [
+                os.path.join(Config.install_dir, 'schema/jans_schema.json'),
+                os.path.join(Config.install_dir, 'schema/custom_schema.json'),
+                os.path.join(Config.install_dir, 'schema/opendj_types.json'),
+                ] + sorted(glob.glob(os.path.join(Config.static_rdbm_dir, '*.json')))
+
+        for fn in list(ldif_files) + dependencies:
+            sha.update(fn.encode())
+            if os.path.exists(fn):
+                with open(fn, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1048576), b''):
+                        sha.update(chunk)
+
+        return sha.hexdigest()
+
+    def is_cached(self, content_hash):
+        if os.path.exists(self.artifact_fn) and os.path.exists(self.hash_fn):
+            with open(self.hash_fn) as f:
+                return f.read().strip() == content_hash
+
+    def compile(self, ldif_files, bucket=None):
+        content_hash = self.content_hash(ldif_files, bucket)
+
+        if self.is_cached(content_hash):
+            base.logIt("Compiled data {} is up to date".format(self.artifact_fn))
+            return self.artifact_fn
+
+        base.logIt("Compiling ldif file(s) {} to {}".format(', '.join(ldif_files), self.artifact_fn))
+
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        self.records = OrderedDict()
+        self.dn_targets = {}
+        self.residual = []
+
+        for ldif_fn in ldif_files:
+            for dn, entry in ldif_utils.myLdifParser(ldif_fn):
+                backend_location = self.dbutils.get_backend_location_for_dn(dn)
+                if backend_location != self.backend_location:
+                    self.residual.append((dn, entry))
+                elif self.backend_location == BackendTypes.COUCHBASE:
+                    self.add_couchbase_entry(dn, entry, bucket)
+                else:
+                    self.add_rdbm_entry(dn, entry)
+
+        if self.backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+            self.write_sql()
+        elif self.backend_location == BackendTypes.SPANNER:
+            self.write_spanner()
+        else:
+            self.write_n1ql()
+
+        self.write_residual()
+
+        with open(self.hash_fn, 'w') as w:
+            w.write(content_hash)
+
+        return self.artifact_fn
+
+    def add_rdbm_entry(self, dn, entry):
+        rdbm_type = 'spanner' if self.backend_location == BackendTypes.SPANNER else None
+
+        if 'changetype' in entry:
+            if not dn in self.dn_targets:
+                self.residual.append((dn, entry))
+                return
+
+            vals = self.dn_targets[dn]
+
+            if 'replace' in entry:
+                attribute = entry['replace'][0]
+                vals[attribute] = self.dbutils.get_rdbm_val(attribute, entry[attribute], rdbm_type)
+
+            elif 'add' in entry:
+                attribute = entry['add'][0]
+                cur_val = vals.get(attribute)
+                if isinstance(cur_val, dict) and 'v' in cur_val:
+                    cur_val['v'] += entry[attribute]
+                elif isinstance(cur_val, list):
+                    cur_val += entry[attribute]
+                else:
+                    vals[attribute] = self.dbutils.get_rdbm_val(attribute, entry[attribute], rdbm_type)
+            return
+
+        objectClass = self.dbutils.get_clean_objcet_class(entry)
+        if not objectClass or objectClass.lower() == 'organizationalunit':
+            return
+
+        dn_parsed = dnutils.parse_dn(dn)
+        vals = OrderedDict()
+        vals['doc_id'] = dn_parsed[0][1]
+        vals['dn'] = dn
+        vals['rev_parent_dn'] = self.dbutils.get_rev_parent_dn(dn)
+        vals['objectClass'] = objectClass
+
+        for lkey in entry:
+            if lkey.lower() == 'objectclass':
+                continue
+            vals[lkey] = self.dbutils.get_rdbm_val(lkey, entry[lkey], rdbm_type)
+
+        table = self.dbutils.get_objectclass_table(objectClass) if rdbm_type == 'spanner' else objectClass
+        if not self.partitioner.check_row(table, dn, vals):
+            return
+        rows = self.records.setdefault(table, OrderedDict())
+        if dn in rows:
+            base.logIt("DN {} is duplicated in compiled data, skipping".format(dn))
+            return
+
+        rows[dn] = vals
+        self.dn_targets[dn] = vals
+
+    def add_couchbase_entry(self, dn, entry, bucket=None):
+        if len(entry) < 3:
+            return
+
+        key, document = ldif_utils.get_document_from_entry(dn, entry)
+        cur_bucket = bucket if bucket else self.dbutils.get_bucket_for_dn(dn)
+
+        if 'changetype' in document:
+            if not key in self.dn_targets:
+                self.residual.append((dn, entry))
+                return
+
+            target = self.dn_targets[key]
+
+            if 'replace' in document:
+                attribute = document['replace']
+                target[attribute] = document[attribute]
+
+            elif 'add' in document:
+                attribute = document['add']
+                data = document[attribute]
+                if attribute in target:
+                    if not isinstance(target[attribute], list):
+                        target[attribute] = [target[attribute]]
+                    target[attribute] += data if isinstance(data, list) else [data]
+                else:
+                    if attribute in attribDataTypes.listAttributes and not isinstance(data, list):
+                        data = [data]
+                    target[attribute] = data
+            return
+
+        for k in document:
+            try:
+                kdata = json.loads(document[k])
+                if isinstance(kdata, dict):
+                    document[k] = kdata
+            except:
+                pass
+
+        self.records.setdefault(cur_bucket, OrderedDict())[key] = document
+        self.dn_targets[key] = document
+
+    def get_sql_dialect(self):
+        # named paramstyle, format and pyformat ones double percent signs of literals
+        if self.backend_location == BackendTypes.MYSQL:
+            return sqlalchemy.dialects.mysql.dialect(paramstyle='named')
+        dialect = sqlalchemy.dialects.postgresql.dialect(paramstyle='named')
+        # dialect is not connected, servers have standard_conforming_strings on since 9.1
+        dialect._backslash_escapes = False
+        return dialect
+
+    def get_sql_column(self, col):
+        if col in ('doc_id', 'dn', 'rev_parent_dn', 'objectClass'):
+            return sqlalchemy.column(col, sqlalchemy.String)
+        return sqlalchemy.column(col, self.sql_column_types.get(self.dbutils.get_attr_sql_data_type(col), sqlalchemy.String))
+
+    def write_sql(self):
+        dialect = self.get_sql_dialect()
+        batch_size = int(Config.rdbm_import_batch_size)
+
+        with open(self.artifact_fn, 'w') as w:
+            for table, rows in self.records.items():
+                # multi-row insert needs the same columns for each row
+                columns = []
+                for vals in rows.values():
+                    for col in vals:
+                        if not col in columns:
+                            columns.append(col)
+
+                json_columns = [ col for col in columns if not col in ('doc_id', 'dn', 'rev_parent_dn', 'objectClass') and self.dbutils.get_attr_sql_data_type(col) == 'JSON' ]
+                sql_table = sqlalchemy.table(table, *[ self.get_sql_column(col) for col in columns ])
+                row_list = list(rows.values())
+
+                for i in range(0, len(row_list), batch_size):
+                    values = []
+                    for vals in row_list[i:i+batch_size]:
+                        row = {}
+                        for col in columns:
+                            val = vals.get(col, {'v': []} if col in json_columns else None)
+                            if val is None:
+                                # literal binds can't render None of typed columns
+                                row[col] = sqlalchemy.null()
+                            else:
+                                row[col] = json.dumps(val) if isinstance(val, (dict, list)) else val
+                        values.append(row)
+
+                    if self.backend_location == BackendTypes.MYSQL:
+                        statement = sqlalchemy.dialects.mysql.insert(sql_table).values(values).prefix_with('IGNORE')
+                    else:
+                        statement = sqlalchemy.dialects.postgresql.insert(sql_table).values(values).on_conflict_do_nothing()
+
+                    sql_cmd = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True})) + ';'
+                    # length header lets the loader split statements whose literals contain newlines
+                    w.write('-- {}\n{}\n'.format(len(sql_cmd), sql_cmd))
+
+                base.logIt("Compiled {} rows for table {}".format(len(row_list), table))
+
+    def write_spanner(self):
+        max_mutations = int(Config.spanner_max_mutations)
+        groups = []
+
+        for table, rows in self.records.items():
+            # rows are grouped by column set, spanner mutations need identical columns
+            column_groups = OrderedDict()
+            for vals in rows.values():
+                column_groups.setdefault(tuple(vals.keys()), []).append(list(vals.values()))
+
+            for columns, values in column_groups.items():
+                rows_per_group = max(1, max_mutations // len(columns))
+                for i in range(0, len(values), rows_per_group):
+                    groups.append({'table': table, 'columns': list(columns), 'values': values[i:i+rows_per_group]})
+
+        with open(self.artifact_fn, 'w') as w:
+            json.dump(groups, w)
+
+    def write_n1ql(self):
+        max_statement_size = int(Config.cb_upsert_max_statement_size)
+
+        with open(self.artifact_fn, 'w') as w:
+            for bucket, documents in self.records.items():
+                values = []
+                size = 0
+                for key, document in documents.items():
+                    value = '({}, {})'.format(json.dumps(key), json.dumps(document))
+                    if values and size + len(value) > max_statement_size:
+                        w.write('UPSERT INTO `{}` (KEY, VALUE) VALUES {}\n'.format(bucket, ', VALUES '.join(values)))
+                        values, size = [], 0
+                    values.append(value)
+                    size += len(value) + 9
+
+                if values:
+                    w.write('UPSERT INTO `{}` (KEY, VALUE) VALUES {}\n'.format(bucket, ', VALUES '.join(values)))
+
+                base.logIt("Compiled {} documents for bucket {}".format(len(documents), bucket))
+
+    def write_residual(self):
+        if os.path.exists(self.residual_fn):
+            os.remove(self.residual_fn)
+
+        if self.residual:
+            base.logIt("{} records can't be compiled, writing them to {}".format(len(self.residual), self.residual_fn))
+            with open(self.residual_fn, 'wb') as w:
+                ldif_writer = LDIFWriter(w, cols=1000)
+                for dn, entry in self.residual:
+                    ldif_writer.unparse(dn, entry)
+
+    def iter_sql_statements(self):
+        with open(self.artifact_fn) as f:
+            while True:
+                header = f.readline()
+                if not header:
+                    break
+                sql_cmd = f.read(int(header[3:]))
+                f.readline()
+                yield sql_cmd
+
+    def load(self):
+        base.logIt("Loading compiled data {}".format(self.artifact_fn))
+
+        if self.backend_location in (BackendTypes.MYSQL, BackendTypes.PGSQL):
+            for sql_cmd in self.iter_sql_statements():
+                # statements have literals only, driver must not apply percent formatting
+                connection = self.dbutils.session.connection().execution_options(no_parameters=True)
+                if hasattr(connection, 'exec_driver_sql'):
+                    connection.exec_driver_sql(sql_cmd)
+                else:
+                    connection.execute(sql_cmd)
+                self.dbutils.session.commit()
+
+        elif self.backend_location == BackendTypes.SPANNER:
+            with open(self.artifact_fn) as f:
+                groups = json.load(f)
+            writer = self.dbutils.spanner.get_bulk_writer()
+            for group in groups:
+                writer.insert(table=group['table'], columns=group['columns'], values=group['values'])
+            writer.flush()
+
+        else:
+            with open(self.artifact_fn) as f:
+                for n1ql in f:
+                    if n1ql.strip():
+                        self.dbutils.cbm.exec_query(n1ql.strip(), False)
+
+        self.dbutils.entry_cache.invalidate()
+
+        if os.path.exists(self.residual_fn):
+            self.dbutils.import_ldif([self.residual_fn])
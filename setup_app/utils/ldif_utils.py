@@ -16,7 +16,8 @@ class myLdifParser(LDIFParser):
         self.ldif_file = ldif_file
         self.entries = []
 
-    def parse(self):
+    def __iter__(self):
+        # yields decoded entries one by one, nothing is kept in memory
         with open(self.ldif_file, 'rb') as f:
             parser = LDIFParser(f)
             for dn, entry in parser.parse():
@@ -24,7 +25,11 @@ class myLdifParser(LDIFParser):
                     for i, v in enumerate(entry[e][:]):
                         if isinstance(v, bytes):
                             entry[e][i] = v.decode('utf-8')
-                self.entries.append((dn, entry))
+                yield dn, entry
+
+    def parse(self):
+        for dn, entry in self:
+            self.entries.append((dn, entry))
 
 
 def get_key_from(dn):
@@ -52,22 +57,21 @@ def get_document_from_entry(dn, entry):
         key = get_key_from(dn)
         document['dn'] = dn
         for k in document:
-            if len(document[k]) == 1:
-                if not k in attribDataTypes.listAttributes:
-                    document[k] = document[k][0]
+            attrib_info = attribDataTypes.getAttribInfo(k)
 
-        for k in document:
-            dtype = attribDataTypes.getAttribDataType(k)
-            if dtype != 'string':
+            if len(document[k]) == 1 and not attrib_info.multivalued:
+                document[k] = document[k][0]
+
+            if attrib_info.converter:
                 if type(document[k]) == type([]):
                     for i in range(len(document[k])):
-                        document[k][i] = attribDataTypes.getTypedValue(dtype, document[k][i])
+                        document[k][i] = attrib_info.converter(document[k][i])
                         if document[k][i] == 'true':
                             document[k][i] = True
                         elif document[k][i] == 'false':
                             document[k][i] = False
                 else:
-                    document[k] = attribDataTypes.getTypedValue(dtype, document[k])
+                    document[k] = attrib_info.converter(document[k])
 
             if k == 'objectClass':
                 document[k].remove('top')
@@ -85,27 +89,21 @@ def get_document_from_entry(dn, entry):
         return key, document
 
 def get_documents_from_ldif(ldif_file):
-    parser = myLdifParser(ldif_file)
-    parser.parse()
-    documents = []
-
-    for dn, entry in parser.entries:
+    for dn, entry in myLdifParser(ldif_file):
         key, document = get_document_from_entry(dn, entry)
 
-        documents.append((key, document))
-
-    return documents
+        yield key, document
 
 
 def schema2json(schema_file, out_dir=None):
 
-    ldif_parser = myLdifParser(schema_file)
-    ldif_parser.parse()
+    # schema files keep all definitions in the first entry
+    dn, schema_entry = next(iter(myLdifParser(schema_file)))
 
     jans_schema = OrderedDict((('attributeTypes',[]), ('objectClasses',[])))
 
-    if 'attributeTypes' in ldif_parser.entries[0][1]:
-        for attr_str in ldif_parser.entries[0][1]['attributeTypes']:
+    if 'attributeTypes' in schema_entry:
+        for attr_str in schema_entry['attributeTypes']:
             attr_type = AttributeType(attr_str)
 
             attr_dict = {
@@ -123,8 +121,8 @@ def schema2json(schema_file, out_dir=None):
 
             jans_schema['attributeTypes'].append(attr_dict)
 
-    if 'objectClasses' in ldif_parser.entries[0][1]:
-        for objcls_str in ldif_parser.entries[0][1]['objectClasses']:
+    if 'objectClasses' in schema_entry:
+        for objcls_str in schema_entry['objectClasses']:
             objcls_type = ObjectClass(objcls_str)
             jans_schema['objectClasses'].append({
                       "kind": "AUXILIARY",
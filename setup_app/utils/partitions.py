@@ -0,0 +1,189 @@
+import re
+import datetime
+
+import sqlalchemy
+
+from setup_app.config import Config
+from setup_app.utils import base
+
+
+class TablePartitioner:
+    """Range partitioning of high churn tables, e.g. tokens, sessions and cache.
+
+    MySQL and PostgreSQL tables listed in Config.rdbm_partition_tables are
+    created partitioned by day ranges of Config.rdbm_partition_column, which
+    becomes part of the primary key. roll_forward() creates partitions for the
+    coming days and drops the ones that ended Config.rdbm_partition_keep_days
+    ago, so expired rows are removed a whole partition at a time instead of
+    with row by row DELETEs. Spanner has no table partitioning, its tables get
+    a row deletion policy on the column instead.
+
+    Rows of partitioned MySQL and PostgreSQL tables must have the partition
+    column, see check_row(). doc_id is unique only together with it, the
+    database can't enforce unique doc_id across partitions.
+    """
+
+    date_format = '%Y%m%d'
+
+    def __init__(self, dbutils):
+        self.dbutils = dbutils
+
+    @property
+    def column(self):
+        return Config.rdbm_partition_column
+
+    @property
+    def days(self):
+        return max(1, int(Config.rdbm_partition_days))
+
+    def is_partitioned(self, table, columns):
+        return bool(Config.rdbm_partition) and table in Config.rdbm_partition_tables and self.column in columns
+
+    def check_row(self, table, dn, vals):
+        """Returns False for rows that can't be written to partitioned table, partition column is in primary key"""
+        if Config.rdbm_type == 'spanner' or not Config.rdbm_partition or not table in Config.rdbm_partition_tables:
+            return True
+
+        if vals.get(self.column) is None:
+            base.logIt("ERROR {} has no {}, it can't be added to partitioned table {}".format(dn, self.column, table), True)
+            return False
+
+        return True
+
+    def get_start(self, day):
+        # partitions start on multiples of days since epoch, bounds of runs match
+        ordinal = day.toordinal()
+        return datetime.date.fromordinal(ordinal - (ordinal - datetime.date(1970, 1, 1).toordinal()) % self.days)
+
+    def get_ranges(self, after=None):
+        """Returns start, end dates of partitions from today up to Config.rdbm_partition_ahead days"""
+        today = datetime.datetime.utcnow().date()
+        start = self.get_start(today)
+        last = today + datetime.timedelta(days=int(Config.rdbm_partition_ahead))
+        ranges = []
+
+        while start <= last:
+            end = start + datetime.timedelta(days=self.days)
+            if after is None or start > after:
+                ranges.append((start, end))
+            start = end
+
+        return ranges
+
+    def get_partition_name(self, table, start):
+        name = 'p' + start.strftime(self.date_format)
+        # PostgreSQL partitions are tables, their names are unique per schema
+        return '{}_{}'.format(table, name) if Config.rdbm_type == 'pgsql' else name
+
+    def get_partition_start(self, name):
+        m = re.search(r'p(\d{8})$', name)
+        if m:
+            return datetime.datetime.strptime(m.group(1), self.date_format).date()
+
+    def get_mysql_partitions_sql(self, ranges):
+        partitions = [ "PARTITION {} VALUES LESS THAN ('{}')".format(self.get_partition_name(None, start), end.isoformat()) for start, end in ranges ]
+        partitions.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+        return ', '.join(partitions)
+
+    def get_table_clause(self, table):
+        """Returns partitioning clause appended to CREATE TABLE statement of table"""
+        if Config.rdbm_type == 'spanner':
+            return 'ROW DELETION POLICY (OLDER_THAN(`{}`, INTERVAL {} DAY))'.format(self.column, int(Config.rdbm_partition_keep_days))
+
+        if Config.rdbm_type == 'mysql':
+            return 'PARTITION BY RANGE COLUMNS(`{}`) ({})'.format(self.column, self.get_mysql_partitions_sql(self.get_ranges()))
+
+        return 'PARTITION BY RANGE ("{}")'.format(self.column)
+
+    def get_partitions_ddl(self, table):
+        """Returns statements creating partitions of a new table, MySQL partitions are in table clause"""
+        if Config.rdbm_type != 'pgsql':
+            return []
+
+        ddl = [ 'CREATE TABLE "{0}_default" PARTITION OF "{0}" DEFAULT;'.format(table) ]
+        for start, end in self.get_ranges():
+            ddl.append(self.get_pgsql_create_partition_sql(table, start, end))
+
+        return ddl
+
+    def get_pgsql_create_partition_sql(self, table, start, end):
+        return 'CREATE TABLE IF NOT EXISTS "{}" PARTITION OF "{}" FOR VALUES FROM (\'{}\') TO (\'{}\');'.format(
+                self.get_partition_name(table, start),
+                table,
+                start.isoformat(),
+                end.isoformat()
+                )
+
+    def get_partitions(self):
+        """Returns partitioned tables of Config.rdbm_partition_tables as table: {partition name: start date}"""
+        if Config.rdbm_type == 'mysql':
+            query = 'SELECT TABLE_NAME, PARTITION_NAME FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = :database AND PARTITION_NAME IS NOT NULL'
+        else:
+            query = ("SELECT p.relname, c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                     "JOIN pg_class p ON p.oid = i.inhparent JOIN pg_namespace n ON n.oid = p.relnamespace "
+                     "WHERE n.nspname = current_schema() AND p.relkind = 'p'")
+
+        with self.dbutils.engine.connect() as conn:
+            rows = conn.execute(sqlalchemy.text(query), {'database': Config.rdbm_db}).fetchall()
+
+        partitions = {}
+        for table, name in rows:
+            if table in Config.rdbm_partition_tables:
+                partitions.setdefault(table, {})[name] = self.get_partition_start(name)
+
+        return partitions
+
+    def get_roll_forward_ddl(self, table, partitions):
+        ddl = []
+        starts = [ start for start in partitions.values() if start ]
+        ranges = self.get_ranges(max(starts) if starts else None)
+        expire_before = datetime.datetime.utcnow().date() - datetime.timedelta(days=int(Config.rdbm_partition_keep_days))
+        expired = sorted([ name for name, start in partitions.items() if start and start + datetime.timedelta(days=self.days) <= expire_before ])
+
+        if Config.rdbm_type == 'mysql':
+            if ranges:
+                ddl.append('ALTER TABLE `{}` REORGANIZE PARTITION pmax INTO ({});'.format(table, self.get_mysql_partitions_sql(ranges)))
+            if expired:
+                ddl.append('ALTER TABLE `{}` DROP PARTITION {};'.format(table, ', '.join(expired)))
+        else:
+            if ranges:
+                # new ranges can't be created while default partition has rows of them,
+                # the default partition is detached and its rows are moved to new partitions
+                default = '{}_default'.format(table)
+                has_default = default in partitions
+                where_clause = '"{}" >= \'{}\' AND "{}" < \'{}\''.format(self.column, ranges[0][0].isoformat(), self.column, ranges[-1][1].isoformat())
+                if has_default:
+                    ddl.append('ALTER TABLE "{}" DETACH PARTITION "{}";'.format(table, default))
+                for start, end in ranges:
+                    ddl.append(self.get_pgsql_create_partition_sql(table, start, end))
+                if has_default:
+                    ddl.append('INSERT INTO "{}" SELECT * FROM "{}" WHERE {};'.format(table, default, where_clause))
+                    ddl.append('DELETE FROM "{}" WHERE {};'.format(default, where_clause))
+                    ddl.append('ALTER TABLE "{}" ATTACH PARTITION "{}" DEFAULT;'.format(table, default))
+            for name in expired:
+                ddl.append('DROP TABLE IF EXISTS "{}";'.format(name))
+
+        return ddl
+
+    def roll_forward(self):
+        """Creates partitions of the coming days and drops expired ones, returns executed statements"""
+        if Config.rdbm_type == 'spanner':
+            base.logIt("Spanner tables expire rows with row deletion policy, nothing to roll")
+            return []
+
+        executed = []
+        for table, partitions in sorted(self.get_partitions().items()):
+            # statements of a table run in one transaction, PostgreSQL rolls back a
+            # failed detach, move and attach of default partition together
+            with self.dbutils.engine.begin() as conn:
+                for sql_cmd in self.get_roll_forward_ddl(table, partitions):
+                    base.logIt("Executing {} Query: {}".format(Config.rdbm_type, sql_cmd))
+                    if hasattr(conn, 'exec_driver_sql'):
+                        conn.exec_driver_sql(sql_cmd)
+                    else:
+                        conn.execute(sql_cmd)
+                    executed.append(sql_cmd)
+
+        base.logIt("Rolled partitions forward with {} statements".format(len(executed)))
+
+        return executed
@@ -0,0 +1,106 @@
+import re
+
+from collections import OrderedDict
+
+from setup_app.config import Config
+
+
+class SchemaPlan:
+    """Changes needed to bring the database to the schema, see SchemaDiff"""
+
+    def __init__(self):
+        self.tables = OrderedDict()
+        self.columns = OrderedDict()
+        self.indexes = []
+        self.type_changes = []
+        self.skipped = []
+        self.ddl = []
+
+    def is_empty(self):
+        return not (self.tables or self.columns or self.indexes)
+
+    def format(self):
+        lines = ['Migration plan for {} database {}'.format(Config.rdbm_type, Config.rdbm_db)]
+
+        if self.is_empty():
+            lines.append('  Database is up to date with the schema')
+
+        if self.tables:
+            lines.append('New tables ({}):'.format(len(self.tables)))
+            for table, columns in self.tables.items():
+                lines.append('  {} ({} columns)'.format(table, len(columns)))
+
+        if self.columns:
+            lines.append('New columns ({}):'.format(sum([ len(columns) for columns in self.columns.values() ])))
+            for table, columns in self.columns.items():
+                lines.append('  {}: {}'.format(table, ', '.join([ '{} {}'.format(column, data_type) for column, data_type in columns.items() ])))
+
+        if self.indexes:
+            lines.append('New indexes ({}):'.format(len(self.indexes)))
+            for table, name in self.indexes:
+                lines.append('  {}: {}'.format(table, name))
+
+        if self.type_changes:
+            lines.append('Column types differing from schema, not changed ({}):'.format(len(self.type_changes)))
+            for table, column, live_type, schema_type in self.type_changes:
+                lines.append('  {}.{}: database {}, schema {}'.format(table, column, live_type, schema_type))
+
+        if self.skipped:
+            lines.append('Skipped ({}):'.format(len(self.skipped)))
+            for message in self.skipped:
+                lines.append('  ' + message)
+
+        if self.ddl:
+            lines.append('Statements:')
+            for sql_cmd in self.ddl:
+                lines.append('  ' + sql_cmd)
+
+        return '\n'.join(lines)
+
+
+class SchemaDiff:
+    """Compares tables required by schema files with the live TableCatalog.
+
+    Only missing tables and columns get into the plan. Columns that exist with
+    a different type are reported but never altered, type changes on big
+    tables need a planned migration.
+    """
+
+    type_aliases = {
+        'INTEGER': 'INT',
+        'BOOLEAN': 'BOOL',
+        'TIMESTAMP WITHOUT TIME ZONE': 'TIMESTAMP',
+        'CHARACTER VARYING': 'VARCHAR',
+        }
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def normalize_type(self, data_type):
+        data_type = data_type.upper().strip()
+        # integer display widths of MySQL < 8.0.19
+        data_type = re.sub(r'^(TINYINT|SMALLINT|INT|BIGINT)\(\d+\)', r'\1', data_type)
+        return self.type_aliases.get(data_type, data_type)
+
+    def compare(self, schema_tables):
+        """schema_tables is OrderedDict of table: OrderedDict of column: data type"""
+
+        plan = SchemaPlan()
+
+        for table, columns in schema_tables.items():
+            if not self.catalog.table_exists(table):
+                if 'doc_id' in columns:
+                    plan.tables[table] = columns
+                else:
+                    plan.skipped.append('columns {} of missing table {}'.format(', '.join(columns), table))
+                continue
+
+            live_types = self.catalog.get_column_types(table)
+
+            for column, data_type in columns.items():
+                if not self.catalog.column_exists(table, column):
+                    plan.columns.setdefault(table, OrderedDict())[column] = data_type
+                elif column in live_types and self.normalize_type(live_types[column]) != self.normalize_type(data_type):
+                    plan.type_changes.append((table, column, live_types[column], data_type))
+
+        return plan
@@ -0,0 +1,168 @@
+import os
+import json
+import hashlib
+
+from setup_app.utils import base
+
+DEFAULT_SYNTAX = '1.3.6.1.4.1.1466.115.121.1.15'
+SQL_DIALECTS = ('mysql', 'pgsql', 'spanner')
+
+
+class SchemaIndex:
+    """Compiled lookup tables of jans schema files and RDBM type mappings.
+
+    Source files are parsed once and the compiled index is written to cache_fn
+    together with size, mtime and sha256 of each source. Later runs load the
+    cache when sizes and mtimes match, or when only mtimes differ but contents
+    hash the same. Nothing is read before the first lookup.
+    """
+
+    version = 1
+
+    def __init__(self, schema_files, static_rdbm_dir, cache_fn):
+        self.schema_files = list(schema_files)
+        self.static_rdbm_dir = static_rdbm_dir
+        self.cache_fn = cache_fn
+        self.index = None
+
+    @property
+    def source_files(self):
+        return self.schema_files + [ os.path.join(self.static_rdbm_dir, fn) for fn in ('ldap_sql_data_type_mapping.json', 'sql_data_types.json', 'opendj_attributes_syntax.json') ]
+
+    def file_hash(self, fn):
+        sha = hashlib.sha256()
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def file_stat(self, fn):
+        stat = os.stat(fn)
+        return {'fn': fn, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def is_valid(self, sources):
+        if len(sources) != len(self.source_files):
+            return False
+
+        valid = True
+        for source, fn in zip(sources, self.source_files):
+            if source['fn'] != fn or not os.path.exists(fn):
+                return False
+            stat = self.file_stat(fn)
+            if (stat['size'], stat['mtime']) != (source['size'], source['mtime']):
+                # touched but maybe not changed
+                if stat['size'] != source['size'] or self.file_hash(fn) != source['sha256']:
+                    return False
+                source['mtime'] = stat['mtime']
+                valid = None
+
+        # None: contents are same, mtimes are refreshed in cache
+        return valid
+
+    def load(self):
+        if self.index is not None:
+            return self.index
+
+        if os.path.exists(self.cache_fn):
+            try:
+                with open(self.cache_fn) as f:
+                    cache = json.load(f)
+                if cache.get('version') == self.version:
+                    valid = self.is_valid(cache['sources'])
+                    if valid is not False:
+                        base.logIt("Loading schema index from {}".format(self.cache_fn))
+                        self.index = cache['index']
+                        if valid is None:
+                            self.write(cache['sources'])
+                        return self.index
+            except Exception as e:
+                base.logIt("Can't load schema index {}: {}".format(self.cache_fn, e))
+
+        self.index = self.compile()
+        sources = []
+        for fn in self.source_files:
+            source = self.file_stat(fn)
+            source['sha256'] = self.file_hash(fn)
+            sources.append(source)
+        self.write(sources)
+
+        return self.index
+
+    def write(self, sources):
+        try:
+            cache_dir = os.path.dirname(self.cache_fn)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            with open(self.cache_fn, 'w') as w:
+                json.dump({'version': self.version, 'sources': sources, 'index': self.index}, w)
+        except Exception as e:
+            base.logIt("Can't write schema index {}: {}".format(self.cache_fn, e))
+
+    def compile(self):
+        base.logIt("Compiling schema index from {}".format(', '.join(self.source_files)))
+
+        jans_attributes = []
+        objectclass_tables = {}
+
+        for schema_fn in self.schema_files:
+            schema = base.readJsonFile(schema_fn)
+            jans_attributes += schema['attributeTypes']
+
+            # RDBM tables are named after the first name of objectClass
+            for obj in schema['objectClasses']:
+                if not obj.get('sql', {}).get('ignore'):
+                    for name in obj['names']:
+                        objectclass_tables[name.lower()] = obj['names'][0]
+
+        ldap_sql_data_type_mapping = base.readJsonFile(os.path.join(self.static_rdbm_dir, 'ldap_sql_data_type_mapping.json'))
+        sql_data_types = base.readJsonFile(os.path.join(self.static_rdbm_dir, 'sql_data_types.json'))
+        opendj_attributes_syntax = base.readJsonFile(os.path.join(self.static_rdbm_dir, 'opendj_attributes_syntax.json'))
+
+        # jans schema overrides opendj syntaxes, the first definition of a name wins
+        attr_syntax = dict(opendj_attributes_syntax)
+        multivalued = []
+        jans_syntax = {}
+        for jans_attr in jans_attributes:
+            for name in jans_attr['names']:
+                if name in jans_syntax:
+                    continue
+                jans_syntax[name] = 'JSON' if jans_attr.get('multivalued') else jans_attr['syntax']
+                if jans_attr.get('multivalued'):
+                    multivalued.append(name)
+        attr_syntax.update(jans_syntax)
+
+        sql_types = {}
+        for name in set(attr_syntax).union(sql_data_types):
+            data_type = sql_data_types.get(name) or ldap_sql_data_type_mapping.get(attr_syntax[name])
+            if data_type:
+                sql_types[name] = { dialect: (data_type.get(dialect) or data_type['mysql'])['type'] for dialect in SQL_DIALECTS }
+
+        return {
+            'jans_attributes': jans_attributes,
+            'objectclass_tables': objectclass_tables,
+            'attr_syntax': attr_syntax,
+            'multivalued': multivalued,
+            'sql_types': sql_types,
+            'ldap_sql_data_type_mapping': ldap_sql_data_type_mapping,
+            'sql_data_types': sql_data_types,
+            'opendj_attributes_syntax': opendj_attributes_syntax,
+            }
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def get_attr_syntax(self, attrname):
+        return self['attr_syntax'].get(attrname, DEFAULT_SYNTAX)
+
+    def get_sql_data_type(self, attrname, rdbm_type):
+        sql_type = self['sql_types'].get(attrname)
+        if sql_type:
+            return sql_type[rdbm_type]
+
+        data_type = self['ldap_sql_data_type_mapping'][self.get_attr_syntax(attrname)]
+        return (data_type.get(rdbm_type) or data_type['mysql'])['type']
+
+    def is_multivalued(self, attrname):
+        if not hasattr(self, 'multivalued_set'):
+            self.multivalued_set = frozenset(self['multivalued'])
+        return attrname in self.multivalued_set
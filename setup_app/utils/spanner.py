@@ -1,12 +1,15 @@
 import os
 import json
 import sys
+import concurrent.futures
+from collections import deque
 
 sys.path.insert(0, '/opt/dist/app/gcs')
 sys.path.insert(0, '/opt/dist/app/gcs/google')
 
 from google.cloud import spanner
 from google.cloud.spanner_v1 import session
+from google.cloud.spanner_v1.pool import BurstyPool
 from google.auth.credentials import AnonymousCredentials
 
 from setup_app import paths
@@ -31,7 +34,9 @@ class Spanner:
             self.client = spanner.Client()
 
         self.instance = self.client.instance(Config.spanner_instance)
-        self.database = self.instance.database(Config.spanner_database)
+        # sessions are created on demand and returned to the pool for reuse
+        self.pool = BurstyPool(target_size=int(Config.spanner_pool_size))
+        self.database = self.instance.database(Config.spanner_database, pool=self.pool)
 
     def get_session(self):
         ses = session.Session(self.database)
@@ -44,13 +49,22 @@ class Spanner:
         tr.begin()
         return tr
 
-    def exec_sql(self, cmd):
-        base.logIt("Executing SQL query: {}".format(cmd))
-        ses = self.get_session()
+    def get_param_type(self, value):
+        if isinstance(value, bool):
+            return spanner.param_types.BOOL
+        if isinstance(value, int):
+            return spanner.param_types.INT64
+        if isinstance(value, list):
+            return spanner.param_types.Array(spanner.param_types.STRING)
+        return spanner.param_types.STRING
+
+    def exec_sql(self, cmd, params=None):
+        base.logIt("Executing SQL query: {} {}".format(cmd, params or ''))
         data = {'fields': [], 'rows':[]}
-        with ses.transaction() as tr:
+        param_types = { param: self.get_param_type(params[param]) for param in params } if params else None
+        with self.database.snapshot() as snapshot:
             try:
-                result = tr.execute_sql(cmd)
+                result = snapshot.execute_sql(cmd, params=params, param_types=param_types)
                 data['rows'] = list(result)
                 for f in result.fields:
                     data['fields'].append({'name': f.name, 'type': f.type_.code.name})
@@ -59,29 +73,179 @@ class Spanner:
 
         return data
 
+    def iter_sql(self, cmd, params=None):
+        """Yields (fields, row) of a streamed query result, rows are not loaded into memory at once"""
+        base.logIt("Executing streamed SQL query: {} {}".format(cmd, params or ''))
+        param_types = { param: self.get_param_type(params[param]) for param in params } if params else None
+        fields = None
+        with self.database.snapshot() as snapshot:
+            result = snapshot.execute_sql(cmd, params=params, param_types=param_types)
+            for row in result:
+                # metadata is available after the first partial result set
+                if fields is None:
+                    fields = [ {'name': f.name, 'type': f.type_.code.name} for f in result.fields ]
+                yield fields, row
 
     def insert_data(self, table, columns, values):
-        ses = self.get_session()
-        with ses.transaction() as tr:
-            tr.insert(table, columns=columns, values=values)
+        with self.database.batch() as batch:
+            batch.insert(table, columns=columns, values=values)
 
     def update_data(self, table, columns, values):
-        ses = self.get_session()
-        with ses.transaction() as tr:
-            tr.update(table, columns=columns, values=values)
+        with self.database.batch() as batch:
+            batch.update(table, columns=columns, values=values)
+
+    def get_bulk_writer(self, on_commit=None, executor=None):
+        return SpannerBulkWriter(self.database, int(Config.spanner_max_mutations), int(Config.import_workers), self.get_index_columns(), on_commit=on_commit, executor=executor)
+
+    def get_index_columns(self, refresh=False):
+        """Returns columns of secondary indexes as table: [[column, ...], ...], cached like get_tables()"""
+        if refresh or getattr(self, 'index_columns', None) is None:
+            self.index_columns = {}
+            data = self.exec_sql("SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME FROM information_schema.index_columns WHERE TABLE_SCHEMA = '' AND INDEX_TYPE = 'INDEX' ORDER BY TABLE_NAME, INDEX_NAME, ORDINAL_POSITION")
+            indexes = {}
+            for table, index, column in data['rows']:
+                indexes.setdefault((table, index), []).append(column)
+            for (table, index), columns in indexes.items():
+                self.index_columns.setdefault(table, []).append(columns)
+        return self.index_columns
 
     def create_table(self, cmd):
         operation = self.database.update_ddl([cmd])
         operation.result()
-
-    def get_tables(self):
-        tables = []
-        for tbl in self.database.list_tables():
-            tables.append(tbl.table_id)
-        return list(tables)
+        if cmd.upper().startswith('CREATE TABLE'):
+            self.tables = None
+        self.index_columns = None
+
+    def update_ddl(self, statements):
+        """Applies DDL statements in batches, each batch is one schema change operation"""
+        batch_size = int(Config.spanner_ddl_batch_size)
+        for i in range(0, len(statements), batch_size):
+            batch = statements[i:i+batch_size]
+            base.logIt("Applying {} DDL statements to spanner".format(len(batch)))
+            try:
+                self.database.update_ddl(batch).result()
+            except Exception as e:
+                # statements before the failing one are applied, retrying them fails harmlessly
+                base.logIt("Applying DDL batch failed, retrying one by one: {}".format(e))
+                for cmd in batch:
+                    try:
+                        self.database.update_ddl([cmd]).result()
+                    except Exception as e:
+                        base.logIt("ERROR applying DDL {}: {}".format(cmd, e), True)
+
+        self.tables = None
+        self.index_columns = None
+
+    def get_tables(self, refresh=False):
+        # table list is cached for the run, DDL through create_table() resets it
+        if refresh or not getattr(self, 'tables', None):
+            self.tables = []
+            for tbl in self.database.list_tables():
+                self.tables.append(tbl.table_id)
+        return list(self.tables)
 
     def get_databases(self):
         databases = []
         for db in self.instance.list_databases():
             databases.append(os.path.split(db.name)[1])
         return databases
+
+
+class SpannerBulkWriter:
+    """Groups mutations up to Spanner's per-commit mutation limit and commits groups concurrently.
+
+    Spanner counts writes to secondary indexes against the limit as well, the
+    index columns of each table are given with index_columns. At most
+    max_pending groups are queued or committing, submit() waits on the oldest
+    one before queuing more. on_commit is called with (table, columns, values)
+    of each committed mutation, from worker threads. Writers of parallel import
+    workers share the executor given by caller.
+    """
+
+    def __init__(self, database, max_mutations=20000, workers=4, index_columns=None, max_pending=None, on_commit=None, executor=None):
+        self.database = database
+        self.on_commit = on_commit
+        self.max_mutations = max_mutations
+        self.index_columns = index_columns or {}
+        self.own_executor = executor is None
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending or workers * 2
+        self.mutations = []
+        self.mutation_count = 0
+        self.futures = deque()
+        self.row_count = 0
+        self.commit_count = 0
+
+    def insert(self, table, columns, values):
+        self.add('insert', table, columns, values)
+
+    def update(self, table, columns, values):
+        self.add('update', table, columns, values)
+
+    def get_row_mutations(self, operation, table, columns):
+        # every written column counts as one mutation, each affected index entry
+        # as its columns and the primary key, updates delete and insert the entry
+        count = len(columns)
+        for index_columns in self.index_columns.get(table, []):
+            if operation == 'insert':
+                count += len(index_columns) + 1
+            elif set(index_columns).intersection(columns):
+                count += 2 * (len(index_columns) + 1)
+        return count
+
+    def add(self, operation, table, columns, values):
+        row_mutations = self.get_row_mutations(operation, table, columns)
+        # rows of a large call are split, so a group stays below the limit
+        chunk_size = max(1, self.max_mutations // row_mutations)
+
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i+chunk_size]
+            count = row_mutations * len(chunk)
+            if self.mutations and self.mutation_count + count > self.max_mutations:
+                self.submit()
+
+            self.mutations.append((operation, table, columns, chunk))
+            self.mutation_count += count
+            self.row_count += len(chunk)
+
+    def submit(self):
+        if not self.mutations:
+            return
+        while len(self.futures) >= self.max_pending:
+            self.futures.popleft().result()
+        base.logIt("Committing {} mutations to spanner".format(self.mutation_count))
+        self.futures.append(self.executor.submit(self.commit, self.mutations))
+        self.commit_count += 1
+        self.mutations = []
+        self.mutation_count = 0
+
+    def commit(self, mutations):
+        try:
+            with self.database.batch() as batch:
+                for operation, table, columns, values in mutations:
+                    getattr(batch, operation)(table=table, columns=columns, values=values)
+        except Exception as e:
+            # a single failing row rejects the whole group, retry one by one
+            base.logIt("Committing mutation group failed, retrying one by one: {}".format(e))
+            committed = []
+            for mutation in mutations:
+                operation, table, columns, values = mutation
+                try:
+                    with self.database.batch() as batch:
+                        getattr(batch, operation)(table=table, columns=columns, values=values)
+                    committed.append(mutation)
+                except Exception as e:
+                    base.logIt("ERROR {} {} {}: {}".format(operation, table, values[0][0], e), True)
+            mutations = committed
+
+        if self.on_commit:
+            for operation, table, columns, values in mutations:
+                self.on_commit(table, columns, values)
+
+    def flush(self):
+        self.submit()
+        while self.futures:
+            self.futures.popleft().result()
+        if self.own_executor:
+            self.executor.shutdown()
+        base.logIt("Wrote {} rows to spanner with {} commits".format(self.row_count, self.commit_count))
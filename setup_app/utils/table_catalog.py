@@ -0,0 +1,105 @@
+import hashlib
+import threading
+
+import sqlalchemy
+
+from setup_app.config import Config
+
+
+class TableCatalog:
+    """Run scoped catalog of RDBM tables and their columns.
+
+    Table and column names are loaded with a single information_schema query
+    on first use and answered from memory afterwards. DDL applied through
+    RDBMInstaller is recorded with add_table() and add_columns(). Versions of
+    tables, which TableReflector uses to validate its cache, are queried again
+    after a change.
+    """
+
+    def __init__(self, dbutils):
+        self.dbutils = dbutils
+        self.lock = threading.RLock()
+        self.tables = None
+        self.versions = None
+        self.column_types = {}
+
+    def fetch_rows(self):
+        if Config.rdbm_type == 'spanner':
+            query = "SELECT TABLE_NAME, COLUMN_NAME, SPANNER_TYPE, IS_NULLABLE FROM information_schema.columns WHERE TABLE_SCHEMA = '' ORDER BY TABLE_NAME, ORDINAL_POSITION"
+            return self.dbutils.spanner.exec_sql(query)['rows']
+
+        # the third column is the column type, see get_column_type()
+        if Config.rdbm_type == 'mysql':
+            query = 'SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = :database ORDER BY TABLE_NAME, ORDINAL_POSITION'
+        else:
+            query = 'SELECT table_name, column_name, data_type, is_nullable, character_maximum_length FROM information_schema.columns WHERE table_catalog = :database AND table_schema = current_schema() ORDER BY table_name, ordinal_position'
+
+        with self.dbutils.engine.connect() as conn:
+            return conn.execute(sqlalchemy.text(query), {'database': Config.rdbm_db}).fetchall()
+
+    def load(self, refresh=False):
+        with self.lock:
+            if self.tables is None or refresh:
+                columns = {}
+                for row in self.fetch_rows():
+                    columns.setdefault(row[0], []).append(tuple(row[1:]))
+
+                self.tables = { table: [ column[0] for column in table_columns ] for table, table_columns in columns.items() }
+                self.column_types = { table: { column[0]: self.get_column_type(column) for column in table_columns } for table, table_columns in columns.items() }
+                self.versions = { table: hashlib.sha256(repr(table_columns).encode()).hexdigest()[:16] for table, table_columns in columns.items() }
+
+            return self.tables
+
+    def get_column_type(self, column):
+        # column is (name, type, ...) row of fetch_rows() without table name
+        if Config.rdbm_type == 'pgsql' and column[1] == 'character varying' and column[3]:
+            return 'VARCHAR({})'.format(column[3])
+        return str(column[1]).upper()
+
+    def invalidate(self):
+        with self.lock:
+            self.tables = None
+            self.versions = None
+            self.column_types = {}
+
+    def get_tables(self):
+        return list(self.load())
+
+    def table_exists(self, table):
+        return table in self.load()
+
+    def get_columns(self, table):
+        return list(self.load().get(table, []))
+
+    def column_exists(self, table, column):
+        return column in self.load().get(table, [])
+
+    def get_column_types(self, table):
+        self.load()
+        return dict(self.column_types.get(table, {}))
+
+    def get_versions(self):
+        with self.lock:
+            self.load()
+            if self.versions is None:
+                # tables were altered since they were loaded
+                self.load(refresh=True)
+            return dict(self.versions)
+
+    def add_table(self, table, columns):
+        """Records a created table, columns is a list of names or a dict of name: type"""
+        with self.lock:
+            self.load()[table] = list(columns)
+            self.column_types[table] = dict(columns) if isinstance(columns, dict) else {}
+            self.versions = None
+
+    def add_columns(self, table, columns):
+        """Records added columns, columns is a list of names or a dict of name: type"""
+        with self.lock:
+            table_columns = self.load().setdefault(table, [])
+            for column in columns:
+                if not column in table_columns:
+                    table_columns.append(column)
+            if isinstance(columns, dict):
+                self.column_types.setdefault(table, {}).update(columns)
+            self.versions = None
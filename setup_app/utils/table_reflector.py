@@ -0,0 +1,150 @@
+import os
+import atexit
+import pickle
+import threading
+import weakref
+
+import sqlalchemy
+import sqlalchemy.ext.declarative
+
+from setup_app.utils import base
+
+
+# reflectors of the run, their caches are written once at exit
+reflectors = weakref.WeakSet()
+
+
+@atexit.register
+def save_caches():
+    for reflector in list(reflectors):
+        reflector.save_cache()
+
+
+def copy_table(table, metadata):
+    if hasattr(table, 'to_metadata'):
+        return table.to_metadata(metadata)
+    return table.tometadata(metadata)
+
+
+class ReflectedClasses:
+    """Mapping of table name to ORM class, same usage as automap's Base.classes"""
+
+    def __init__(self, reflector):
+        self.reflector = reflector
+
+    def __getitem__(self, name):
+        return self.reflector.get_class(name)
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __iter__(self):
+        for name in self.keys():
+            try:
+                yield self.reflector.get_class(name)
+            except KeyError:
+                continue
+
+    def keys(self):
+        return [ name for name in sorted(self.reflector.get_schema_versions()) if not name in self.reflector.unmapped ]
+
+
+class TableReflector:
+    """Reflects tables and maps them to ORM classes on first use.
+
+    Instead of reflecting the whole database, a table is reflected when one of
+    its classes is requested. Reflected definitions are pickled to cache_fn
+    together with the version of each table from TableCatalog, so later runs
+    reuse definitions of unchanged tables without reflection queries.
+    """
+
+    version = 1
+
+    def __init__(self, engine, metadata, cache_fn, catalog):
+        self.engine = engine
+        self.metadata = metadata
+        self.cache_fn = cache_fn
+        self.catalog = catalog
+        self.lock = threading.RLock()
+        self.declarative_base = sqlalchemy.ext.declarative.declarative_base(metadata=metadata)
+        self.mapped = {}
+        self.unmapped = set()
+        self.schema_versions = None
+        self.cache = None
+        self.cache_changed = False
+        self.classes = ReflectedClasses(self)
+        reflectors.add(self)
+
+    def get_schema_versions(self):
+        with self.lock:
+            if self.schema_versions is None:
+                self.schema_versions = self.catalog.get_versions()
+            return self.schema_versions
+
+    def load_cache(self):
+        self.cache = {'version': self.version, 'sqlalchemy': sqlalchemy.__version__, 'tables': {}, 'metadata': sqlalchemy.MetaData()}
+
+        if not os.path.exists(self.cache_fn):
+            return
+
+        try:
+            with open(self.cache_fn, 'rb') as f:
+                cache = pickle.load(f)
+            if cache.get('version') == self.version and cache.get('sqlalchemy') == sqlalchemy.__version__:
+                self.cache = cache
+        except Exception as e:
+            base.logIt("Can't load table definitions cache {}: {}".format(self.cache_fn, e))
+
+    def save_cache(self):
+        with self.lock:
+            if not self.cache_changed:
+                return
+            try:
+                with open(self.cache_fn, 'wb') as w:
+                    pickle.dump(self.cache, w)
+                self.cache_changed = False
+            except Exception as e:
+                base.logIt("Can't write table definitions cache {}: {}".format(self.cache_fn, e))
+
+    def get_table(self, name, schema_version):
+        if self.cache is None:
+            self.load_cache()
+
+        cache_metadata = self.cache['metadata']
+
+        if self.cache['tables'].get(name) == schema_version and name in cache_metadata.tables:
+            return copy_table(cache_metadata.tables[name], self.metadata)
+
+        base.logIt("Reflecting table {}".format(name))
+        self.metadata.reflect(self.engine, only=[name])
+        table = self.metadata.tables[name]
+
+        if name in cache_metadata.tables:
+            cache_metadata.remove(cache_metadata.tables[name])
+        copy_table(table, cache_metadata)
+        self.cache['tables'][name] = schema_version
+        self.cache_changed = True
+
+        return table
+
+    def get_class(self, name):
+        with self.lock:
+            if name in self.mapped:
+                return self.mapped[name]
+
+            schema_versions = self.get_schema_versions()
+            if name in self.unmapped or not name in schema_versions:
+                raise KeyError(name)
+
+            table = self.metadata.tables.get(name)
+            if table is None:
+                table = self.get_table(name, schema_versions[name])
+
+            if not table.primary_key.columns:
+                # automap skipped these as well, ORM can't map tables without primary key
+                self.unmapped.add(name)
+                raise KeyError(name)
+
+            self.mapped[name] = type(str(name), (self.declarative_base,), {'__table__': table})
+
+            return self.mapped[name]
@@ -25,12 +25,6 @@ parser.add_argument("--type", choices=["csv", "html", "text"], default="text", h
 
 parser.add_argument("dir", help="Path to log dir")
 
-args = parser.parse_args()
-
-if not args.dir:
-    args.print_help()
-    sys.exit()
-
 def sort_result(result):
 
     descending = False
@@ -208,12 +202,8 @@ def http_log():
     print_result(result, 'path', "HTTP REQUEST LOG ANALYSES")
 
 
-def durations():
-
-    fn = os.path.join(args.dir,'oxauth_persistence_duration.log')
-    if not os.path.exists(fn):
-        print("File {0} does not exists".format(fn))
-        return
+def read_durations(fn, included_operations, min_duration=0):
+    """Parses persistence duration log fn, returns durations, operations and buckets of expressions"""
 
     rdict = {}
     operations = {}
@@ -225,10 +215,7 @@ def durations():
         operation = ls[1].split('operation: ')[1]
         bucket = ls[3].strip()[8:]
 
-        if not bucket in buckets:
-            buckets[bucket] = []
-
-        if not operation in args.operation:
+        if not operation in included_operations:
             continue
 
         ds = ls[2].strip()[12:-1]
@@ -238,7 +225,7 @@ def durations():
         else:
             d = float(ds)
 
-        if d > args.min:
+        if d > min_duration:
             if len(ls)>6:
                 p = ls[5].strip()
             else:
@@ -250,7 +237,19 @@ def durations():
                 rdict[p] = [d]
 
             operations[p] = operation
+            buckets[p] = bucket
 
+    return rdict, operations, buckets
+
+
+def durations():
+
+    fn = os.path.join(args.dir,'oxauth_persistence_duration.log')
+    if not os.path.exists(fn):
+        print("File {0} does not exists".format(fn))
+        return
+
+    rdict, operations, buckets = read_durations(fn, args.operation, args.min)
 
     if args.groupby == 'bucket':
         print("Grouped by", args.groupby)
@@ -275,15 +274,23 @@ def durations():
     print_result(result, "expression", "DURATIONS LOG ANALYSES")
 
 
-if args.type == 'html':
-    print('<!DOCTYPE html>\n<html>\n<head>')
-    print('<style>table, th, td {padding-right:10px; padding-left:10px; border: 1px solid black; border-collapse: collapse;} * {font-family: Arial, Helvetica, sans-serif;}</style>')
-    print('</head>\n<body>\n')
+if __name__ == '__main__':
 
-if args.log in ('duration', 'all'):
-    durations()
-if args.log in ('http', 'all'):
-    http_log()
+    args = parser.parse_args()
 
-if args.type == 'html':
-    print('\n</body>\n</html>')
+    if not args.dir:
+        args.print_help()
+        sys.exit()
+
+    if args.type == 'html':
+        print('<!DOCTYPE html>\n<html>\n<head>')
+        print('<style>table, th, td {padding-right:10px; padding-left:10px; border: 1px solid black; border-collapse: collapse;} * {font-family: Arial, Helvetica, sans-serif;}</style>')
+        print('</head>\n<body>\n')
+
+    if args.log in ('duration', 'all'):
+        durations()
+    if args.log in ('http', 'all'):
+        http_log()
+
+    if args.type == 'html':
+        print('\n</body>\n</html>')
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+import pytest
+
+from setup_app import paths
+
+log_paths = ('LOG_FILE', 'LOG_ERROR_FILE', 'LOG_OS_CHANGES_FILE')
+saved_log_paths = {}
+
+
+def pytest_configure(config):
+    # modules log while they are imported, logs of the run go to a temporary directory
+    log_dir = tempfile.mkdtemp(prefix='jans_setup_logs_')
+    for name in log_paths:
+        saved_log_paths[name] = getattr(paths, name)
+        setattr(paths, name, os.path.join(log_dir, os.path.basename(saved_log_paths[name])))
+
+
+def pytest_unconfigure(config):
+    for name, path in saved_log_paths.items():
+        setattr(paths, name, path)
+
+
+@pytest.fixture(autouse=True)
+def output_folder(tmp_path, monkeypatch):
+    """Caches and compiled artifacts of a test are written to its tmp_path"""
+    # base is imported first like test modules do, config is imported by it
+    from setup_app.utils import base
+    from setup_app.config import Config
+    monkeypatch.setattr(Config, 'outputFolder', str(tmp_path), raising=False)
+    return tmp_path
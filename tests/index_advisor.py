@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import argparse
+
+from collections import OrderedDict
+
+from analyzer import read_durations
+
+install_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+backends = ['mysql', 'pgsql', 'spanner', 'couchbase']
+
+parser = argparse.ArgumentParser(description="Proposes indexes for attributes of slow expressions in persistence duration log")
+parser.add_argument("--backend", choices=backends + ['all'], default='all', help="Backend to propose indexes for")
+parser.add_argument("--min", type=float, default=0, help="Duration below this time will be omitted")
+parser.add_argument("--baseline", type=float, help="Expected duration of an indexed search, default is median of indexed expressions")
+parser.add_argument("--top", type=int, default=20, help="Number of proposals per backend")
+parser.add_argument("--operation", choices=['add', 'lookup','search','bind', 'modify'], default=['search', 'lookup'], nargs='+', help="Database operations to include")
+parser.add_argument("--bucket-prefix", default='jans', help="Prefix of couchbase buckets")
+parser.add_argument("--install-dir", default=install_dir, help="Directory containing schema and static directories")
+parser.add_argument("-o", "--output", help="Directory to write proposed index files")
+
+parser.add_argument("dir", help="Path to log dir")
+
+# LDAP filter items: (attr=v), (attr>=v), (attr~=v) and N1QL/SQL predicates: `attr` = v, attr IN [..], LOWER(attr) LIKE ..
+ldap_item_re = re.compile(r'\(\s*([A-Za-z][\w-]*)\s*[<>~]?=')
+sql_item_re = re.compile(r'`?([A-Za-z][\w-]*)`?\s*\)?\s*(?:[<>!]?=|<>|<|>|\bLIKE\b|\bIN\b|\bIS\b)', re.IGNORECASE)
+objectclass_re = re.compile(r'objectClass`?\s*=\s*["\']?([\w-]+)', re.IGNORECASE)
+
+
+def read_schema():
+    """Returns attribute names, object class tables and multivalued attributes of schema files"""
+
+    attributes = {}
+    tables = {}
+    table_attributes = {}
+    multivalued = set()
+
+    for schema_fn in ('jans_schema.json', 'custom_schema.json'):
+        schema_fp = os.path.join(args.install_dir, 'schema', schema_fn)
+        if not os.path.exists(schema_fp):
+            continue
+        with open(schema_fp) as f:
+            schema = json.load(f)
+
+        for attr in schema['attributeTypes']:
+            for name in attr['names']:
+                attributes[name.lower()] = attr['names'][0]
+                if attr.get('multivalued'):
+                    multivalued.add(attr['names'][0])
+
+        for obj in schema['objectClasses']:
+            for name in obj['names']:
+                tables[name.lower()] = obj['names'][0]
+            table_attributes.setdefault(obj['names'][0], set()).update(obj['may'])
+
+    attributes['objectclass'] = 'objectClass'
+
+    return attributes, tables, table_attributes, multivalued
+
+
+def read_index_files():
+    index_files = {}
+
+    for backend in backends:
+        if backend == 'couchbase':
+            index_fp = os.path.join(args.install_dir, 'static/couchbase/index.json')
+        else:
+            index_fp = os.path.join(args.install_dir, 'static/rdbm/{}_index.json'.format(backend))
+        with open(index_fp) as f:
+            index_files[backend] = json.load(f)
+
+    return index_files
+
+
+def parse_expression(expression):
+    """Returns object class and attributes used in filter of expression"""
+
+    objectclass = None
+    m = objectclass_re.search(expression)
+    if m:
+        objectclass = schema_tables.get(m.group(1).lower())
+
+    attrs = []
+    for item_re in (ldap_item_re, sql_item_re):
+        for name in item_re.findall(expression):
+            attr = schema_attributes.get(name.lower())
+            if attr and not attr in attrs:
+                attrs.append(attr)
+
+    return objectclass, attrs
+
+
+def get_table(objectclass, attr):
+    if objectclass:
+        return objectclass
+    # attribute of a single table is searched on that table, others on all
+    attr_tables = [ table for table, attrs in schema_table_attributes.items() if attr in attrs ]
+    return attr_tables[0] if len(attr_tables) == 1 else '__common__'
+
+
+def get_bucket_key(bucket):
+    for key in index_files['couchbase']:
+        if key.replace('!bucket_prefix!', args.bucket_prefix) == bucket:
+            return key
+    return '!bucket_prefix!'
+
+
+def is_indexed_in(items, attr):
+    # items are field names or index expressions, e.g. lower(`uid`), CAST(address->'$.v' ..)
+    for item in items:
+        if item == attr or re.search(r'\b{}\b'.format(re.escape(attr)), item):
+            return True
+
+
+def is_indexed(backend, table, attr):
+    if attr in ('objectClass', 'doc_id', 'dn') and backend != 'couchbase':
+        # tables are per object class, doc_id is primary key
+        return True
+
+    index_file = index_files[backend]
+
+    if backend == 'couchbase':
+        bucket_index = index_file.get(table, {})
+        # only the leading key of an index serves the lookup
+        leading_keys = [ attributes[0] for attributes in bucket_index.get('attributes', []) ]
+        leading_keys += [ static[0][0] for static in bucket_index.get('static', []) ]
+        return is_indexed_in(leading_keys, attr)
+
+    items = index_file['__common__']['fields'] + index_file.get(table, {}).get('fields', []) + index_file.get(table, {}).get('custom', [])
+
+    return is_indexed_in(items, attr)
+
+
+def can_index(backend, attr):
+    # PostgreSQL and Spanner index files have no indexes of multivalued (JSON and ARRAY) columns
+    return not (backend in ('pgsql', 'spanner') and attr in schema_multivalued)
+
+
+def get_expressions():
+    fn = os.path.join(args.dir, 'oxauth_persistence_duration.log')
+    if not os.path.exists(fn):
+        print("File {0} does not exists".format(fn))
+        sys.exit(1)
+
+    rdict, operations, buckets = read_durations(fn, args.operation, args.min)
+
+    expressions = []
+    for expression, data in rdict.items():
+        objectclass, attrs = parse_expression(expression)
+        if attrs:
+            expressions.append({
+                    'expression': expression,
+                    'objectclass': objectclass,
+                    'bucket': buckets[expression],
+                    'attrs': attrs,
+                    'count': len(data),
+                    't_sum': sum(data),
+                    't_avg': sum(data)/len(data),
+                    })
+
+    return expressions
+
+
+def get_baseline(expressions):
+    if args.baseline is not None:
+        return args.baseline
+
+    # expressions whose attributes are indexed on every backend show duration of an indexed search
+    indexed = sorted([ expr['t_avg'] for expr in expressions if all([ is_indexed('mysql', get_table(expr['objectclass'], attr), attr) for attr in expr['attrs'] ]) ])
+
+    return indexed[len(indexed)//2] if indexed else 0
+
+
+def propose(backend, expressions, baseline):
+    """Returns proposals of backend as list of (saving, count, table, attr, expression count) ranked by saving"""
+
+    proposals = {}
+
+    for expr in expressions:
+        if backend == 'couchbase':
+            tables = { attr: get_bucket_key(expr['bucket']) for attr in expr['attrs'] }
+        else:
+            tables = { attr: get_table(expr['objectclass'], attr) for attr in expr['attrs'] }
+
+        # objectClass matches too many entries to be worth indexing
+        attrs = [ attr for attr in expr['attrs'] if attr != 'objectClass' ]
+        if any([ is_indexed(backend, tables[attr], attr) for attr in attrs ]):
+            # expression can use an existing index
+            continue
+
+        missing = [ attr for attr in attrs if can_index(backend, attr) ]
+
+        # each attribute of expression is credited, savings of attributes used together overlap
+        saving = max(0, expr['t_avg'] - baseline) * expr['count']
+        for attr in missing:
+            key = (tables[attr], attr)
+            proposal = proposals.setdefault(key, [0, 0, 0])
+            proposal[0] += saving
+            proposal[1] += expr['count']
+            proposal[2] += 1
+
+    ranked = [ (saving, count, table, attr, n) for (table, attr), (saving, count, n) in proposals.items() if saving > 0 ]
+    ranked.sort(key=lambda proposal: proposal[0], reverse=True)
+
+    return ranked[:args.top]
+
+
+def get_index_entries(backend, proposals):
+    """Returns proposals in format of backend's index file"""
+
+    entries = OrderedDict()
+
+    for saving, count, table, attr, n in proposals:
+        if backend == 'couchbase':
+            entries.setdefault(table, OrderedDict([('attributes', []), ('static', [])]))['attributes'].append([attr])
+        elif table == '__common__':
+            entries.setdefault(table, OrderedDict([('JSON', []), ('fields', [])]))['fields'].append(attr)
+        else:
+            entries.setdefault(table, OrderedDict([('fields', []), ('custom', [])]))['fields'].append(attr)
+
+    return entries
+
+
+def print_proposals(backend, proposals, entries):
+    heading = "PROPOSED {} INDEXES".format(backend.upper())
+    print(heading, ':')
+    print('-'*(len(heading)+1))
+
+    if not proposals:
+        print("No index is proposed\n")
+        return
+
+    print('#'.rjust(3), 'saving'.rjust(10), 'count'.rjust(8), 'exprs'.rjust(6), '    table.attribute')
+    for ln, (saving, count, table, attr, n) in enumerate(proposals):
+        print(str(ln+1).rjust(3), '{:0.3f}'.format(saving).rjust(10), str(count).rjust(8), str(n).rjust(6), '   ', '{}.{}'.format(table, attr))
+
+    print()
+    print(json.dumps(entries, indent=2))
+    print()
+
+
+if __name__ == '__main__':
+
+    args = parser.parse_args()
+
+    schema_attributes, schema_tables, schema_table_attributes, schema_multivalued = read_schema()
+    index_files = read_index_files()
+
+    expressions = get_expressions()
+    baseline = get_baseline(expressions)
+    print("Analysed {} expressions, baseline duration of indexed expressions {:0.3f}\n".format(len(expressions), baseline))
+
+    for backend in backends:
+        if args.backend not in (backend, 'all'):
+            continue
+
+        proposals = propose(backend, expressions, baseline)
+        entries = get_index_entries(backend, proposals)
+        print_proposals(backend, proposals, entries)
+
+        if args.output and entries:
+            if not os.path.exists(args.output):
+                os.makedirs(args.output)
+            output_fn = os.path.join(args.output, 'index.json' if backend == 'couchbase' else '{}_index.json'.format(backend))
+            with open(output_fn, 'w') as w:
+                json.dump(entries, w, indent=2)
+            print("Proposed indexes were written to", output_fn, '\n')
@@ -0,0 +1,131 @@
+import concurrent.futures
+import threading
+
+from setup_app.utils.cbm import BulkUpserter
+from setup_app.utils.spanner import SpannerBulkWriter
+
+
+class Result:
+    ok = True
+    text = ''
+
+
+class CouchbaseRecorder:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statements = []
+
+    def exec_query(self, n1ql, log=True):
+        with self.lock:
+            self.statements.append(n1ql)
+        return Result()
+
+
+class SpannerBatch:
+
+    def __init__(self, database):
+        self.database = database
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        with self.database.lock:
+            self.database.commits.append(self.rows)
+
+    def insert(self, table, columns, values):
+        if any(row[0] in self.database.failing for row in values):
+            raise ValueError('row rejected')
+        self.rows += len(values)
+
+    update = insert
+
+
+class SpannerRecorder:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commits = []
+        self.failing = set()
+
+    def batch(self):
+        return SpannerBatch(self)
+
+
+def test_upserter_bounds_pending_statements():
+    cbm = CouchbaseRecorder()
+    upserter = BulkUpserter(cbm, max_statement_size=100, workers=2)
+    max_futures = 0
+
+    for i in range(50):
+        upserter.upsert('jans', 'key_{}'.format(i), {'i': i, 'v': 'x' * 40})
+        max_futures = max(max_futures, len(upserter.futures))
+
+    upserter.flush()
+
+    assert upserter.max_pending == 4
+    assert max_futures <= upserter.max_pending
+    assert len(upserter.futures) == 0
+    assert len(cbm.statements) == upserter.statement_count == 50
+    assert upserter.document_count == 50
+
+
+def test_writers_keep_shared_executor():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        upserter = BulkUpserter(CouchbaseRecorder(), max_statement_size=100, workers=2, executor=executor)
+        upserter.upsert('jans', 'key_1', {'i': 1})
+        upserter.flush()
+        upserter.close()
+
+        database = SpannerRecorder()
+        writer = SpannerBulkWriter(database, max_mutations=100, workers=2, executor=executor)
+        writer.insert('jansClnt', ['doc_id', 'dn'], [['1', 'inum=1,ou=clients,o=jans']])
+        writer.flush()
+
+        # executor of parallel import is still usable after workers' writers are done
+        assert executor.submit(lambda: True).result()
+        assert database.commits == [1]
+
+
+def test_spanner_writer_counts_index_mutations():
+    writer = SpannerBulkWriter(SpannerRecorder(), max_mutations=100, index_columns={'jansToken': [['tknCde'], ['exp', 'del']]})
+
+    # 4 columns, 2 for tknCde index entry, 3 for exp index entry
+    assert writer.get_row_mutations('insert', 'jansToken', ['doc_id', 'tknCde', 'exp', 'del']) == 9
+    # only index on exp is affected, its entry is deleted and inserted
+    assert writer.get_row_mutations('update', 'jansToken', ['doc_id', 'exp']) == 8
+    assert writer.get_row_mutations('insert', 'jansClnt', ['doc_id', 'dn']) == 2
+
+
+def test_spanner_writer_groups_below_limit():
+    database = SpannerRecorder()
+    writer = SpannerBulkWriter(database, max_mutations=100, workers=2, index_columns={'jansToken': [['tknCde']]})
+    columns = ['doc_id', 'tknCde', 'exp', 'del']
+    max_futures = 0
+
+    # 6 mutations per row, 16 rows fit in a group
+    writer.insert('jansToken', columns, [ [str(i), str(i), None, False] for i in range(40) ])
+    for i in range(40, 100):
+        writer.insert('jansToken', columns, [[str(i), str(i), None, False]])
+        max_futures = max(max_futures, len(writer.futures))
+    writer.flush()
+
+    assert max(database.commits) == 16
+    assert sum(database.commits) == writer.row_count == 100
+    assert max_futures <= writer.max_pending
+
+
+def test_spanner_writer_reports_committed_rows():
+    database = SpannerRecorder()
+    database.failing.add('2')
+    committed = []
+    writer = SpannerBulkWriter(database, max_mutations=100, on_commit=lambda table, columns, values: committed.extend(row[0] for row in values))
+
+    for i in range(4):
+        writer.insert('jansClnt', ['doc_id', 'dn'], [[str(i), 'inum={},ou=clients,o=jans'.format(i)]])
+    writer.flush()
+
+    # group is rejected because of row 2, rows committed one by one are reported
+    assert sorted(committed) == ['0', '1', '3']
@@ -0,0 +1,70 @@
+import time
+
+from setup_app.utils.entry_cache import EntryCache
+
+
+def test_lru_eviction():
+    cache = EntryCache(max_size=2, ttl=60)
+    cache.put(('dn', 'o=a'), {'o': ['a']})
+    cache.put(('dn', 'o=b'), {'o': ['b']})
+    # o=a becomes most recently used, o=b is evicted
+    assert cache.get(('dn', 'o=a')) == {'o': ['a']}
+    cache.put(('dn', 'o=c'), {'o': ['c']})
+
+    assert cache.get(('dn', 'o=b')) is None
+    assert cache.get(('dn', 'o=a')) == {'o': ['a']}
+    assert cache.get(('dn', 'o=c')) == {'o': ['c']}
+    assert cache.stats() == {'size': 2, 'hits': 3, 'misses': 1, 'invalidations': 0}
+
+
+def test_ttl_expiry(monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    cache = EntryCache(max_size=10, ttl=5)
+    cache.put(('dn', 'o=a'), {'o': ['a']})
+
+    monkeypatch.setattr(time, 'time', lambda: now + 4)
+    assert cache.get(('dn', 'o=a')) == {'o': ['a']}
+
+    monkeypatch.setattr(time, 'time', lambda: now + 6)
+    assert cache.get(('dn', 'o=a')) is None
+    assert cache.stats()['size'] == 0
+
+
+def test_values_are_copied():
+    cache = EntryCache()
+    entry = {'o': ['a']}
+    cache.put(('dn', 'o=a'), entry)
+    entry['o'].append('b')
+
+    result = cache.get(('dn', 'o=a'))
+    result['o'].append('c')
+
+    assert cache.get(('dn', 'o=a')) == {'o': ['a']}
+
+
+def test_invalidate_dn():
+    cache = EntryCache()
+    dn = 'inum=1,ou=clients,o=jans'
+    cache.put(('dn', dn), {'inum': ['1']})
+    cache.put(('dn', 'inum=2,ou=clients,o=jans'), {'inum': ['2']})
+    cache.put(('search', 'ou=clients,o=jans', '(objectClass=*)'), [{'inum': ['1']}])
+    cache.put(('search', 'ou=people,o=jans', '(objectClass=*)'), [{'uid': ['admin']}])
+
+    cache.invalidate('INUM=1,ou=clients,o=jans')
+
+    assert cache.get(('dn', dn)) is None
+    assert cache.get(('search', 'ou=clients,o=jans', '(objectClass=*)')) is None
+    assert cache.get(('dn', 'inum=2,ou=clients,o=jans')) == {'inum': ['2']}
+    assert cache.get(('search', 'ou=people,o=jans', '(objectClass=*)')) == [{'uid': ['admin']}]
+
+    cache.invalidate()
+    assert cache.stats()['size'] == 0
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_disabled_cache():
+    cache = EntryCache(max_size=0)
+    cache.put(('dn', 'o=a'), {'o': ['a']})
+
+    assert cache.get(('dn', 'o=a')) is None
@@ -0,0 +1,143 @@
+import sqlalchemy
+import sqlalchemy.dialects.mysql
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+from setup_app.static import BackendTypes
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import DBUtils, dbUtils
+from setup_app.utils.entry_cache import EntryCache
+
+
+def add(dn):
+    return dn, {'objectClass': ['top', 'jansClnt'], 'inum': [dn.split(',')[0].split('=')[1]]}
+
+
+def modify(dn):
+    return dn, {'changetype': ['modify'], 'replace': ['displayName'], 'displayName': ['x']}
+
+
+def write_ldif(path, entries):
+    with open(path, 'w') as w:
+        for dn, entry in entries:
+            w.write('dn: {}\n'.format(dn))
+            if 'changetype' in entry:
+                w.write('changetype: modify\nreplace: displayName\ndisplayName: x\n\n')
+                continue
+            for attr, values in entry.items():
+                for value in values:
+                    w.write('{}: {}\n'.format(attr, value))
+            w.write('\n')
+    return str(path)
+
+
+def run_parallel(tmp_path, monkeypatch, entries, chunk_size=2):
+    events = []
+    monkeypatch.setattr(Config, 'parallel_import', True)
+    monkeypatch.setattr(Config, 'import_chunk_size', chunk_size)
+    monkeypatch.setattr(dbUtils, 'session', None)
+
+    def import_group_worker(group, entries, bucket=None, force=None, write_executor=None):
+        assert write_executor is not None
+        events.append(('start', [ dn for dn, _ in entries ]))
+        events.append(('end', [ dn for dn, _ in entries ]))
+
+    monkeypatch.setattr(dbUtils, 'import_group_worker', import_group_worker)
+    monkeypatch.setattr(dbUtils, 'import_entries', lambda entries, bucket=None, force=None: events.append(('modify', [ dn for dn, _ in entries ])))
+    dbUtils.import_ldif_parallel([write_ldif(tmp_path / 'test.ldif', entries)], force=BackendTypes.LDAP, workers=2)
+
+    return events
+
+
+def test_modifications_keep_file_order(tmp_path, monkeypatch):
+    entries = [
+            add('ou=clients,o=jans'),
+            add('inum=1,ou=clients,o=jans'),
+            modify('inum=1,ou=clients,o=jans'),
+            modify('ou=clients,o=jans'),
+            add('inum=2,ou=clients,o=jans'),
+            modify('inum=2,ou=clients,o=jans'),
+            ]
+
+    events = run_parallel(tmp_path, monkeypatch, entries)
+    kinds = [ kind for kind, _ in events ]
+
+    assert events[kinds.index('modify')] == ('modify', ['inum=1,ou=clients,o=jans', 'ou=clients,o=jans'])
+    assert events[-1] == ('modify', ['inum=2,ou=clients,o=jans'])
+    # additions before a modify record are written before it, the ones after it later
+    assert kinds.index('modify') > max(i for i, (kind, dns) in enumerate(events) if kind == 'end' and 'inum=1,ou=clients,o=jans' in dns)
+    assert kinds.index('modify') < min(i for i, (kind, dns) in enumerate(events) if kind == 'start' and 'inum=2,ou=clients,o=jans' in dns)
+
+
+def test_parents_imported_before_children_in_chunks(tmp_path, monkeypatch):
+    entries = [ add('inum={},ou=clients,o=jans'.format(i)) for i in range(5) ]
+    entries.insert(0, add('ou=clients,o=jans'))
+    entries.insert(3, add('ou=scopes,o=jans'))
+
+    events = run_parallel(tmp_path, monkeypatch, entries)
+    starts = [ dns for kind, dns in events if kind == 'start' ]
+    chunk_start = lambda dn: next(i for i, (kind, dns) in enumerate(events) if kind == 'start' and dn in dns)
+
+    assert all(len(dns) <= 2 for dns in starts)
+    assert sorted(dn for dns in starts for dn in dns) == sorted(dn for dn, _ in entries)
+    # entries of a depth are only started after buffered entries of lower depths are done
+    assert events.index(('end', ['ou=clients,o=jans'])) < chunk_start('inum=0,ou=clients,o=jans')
+    assert events.index(('end', ['ou=scopes,o=jans'])) < chunk_start('inum=2,ou=clients,o=jans')
+
+
+def test_parallel_import_is_opt_in():
+    assert Config.parallel_import is False
+
+
+def test_bulk_rows_grouped_by_columns(monkeypatch):
+    monkeypatch.setattr(Config, 'rdbm_type', 'mysql')
+    table = sqlalchemy.Table(
+            'jansClnt',
+            sqlalchemy.MetaData(),
+            sqlalchemy.Column('doc_id', sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column('dn', sqlalchemy.String(128)),
+            sqlalchemy.Column('jansTrustedClnt', sqlalchemy.SmallInteger, server_default='0'),
+            sqlalchemy.Column('jansGrantTyp', sqlalchemy.dialects.mysql.JSON),
+            )
+    rows = [
+            {'doc_id': '1', 'dn': 'inum=1,ou=clients,o=jans', 'jansTrustedClnt': 1},
+            {'doc_id': '2', 'dn': 'inum=2,ou=clients,o=jans'},
+            {'doc_id': '3', 'dn': 'inum=3,ou=clients,o=jans', 'jansTrustedClnt': 0},
+            {'doc_id': '4', 'dn': 'inum=4,ou=clients,o=jans'},
+            ]
+
+    groups = dbUtils.get_rdbm_insert_groups(table, rows, {'inum=4,ou=clients,o=jans'})
+
+    assert [ [ row['doc_id'] for row in group ] for group in groups ] == [['1', '3'], ['2']]
+    # absent column is omitted so its default applies, absent json column is empty list
+    assert groups[1][0] == {'doc_id': '2', 'dn': 'inum=2,ou=clients,o=jans', 'jansGrantTyp': {'v': []}}
+
+
+def test_import_entries_resolve_location_once(monkeypatch):
+    calls = []
+    imported = []
+    monkeypatch.setattr(dbUtils, 'get_backend_location_for_dn', lambda dn: calls.append(dn) or BackendTypes.COUCHBASE)
+    monkeypatch.setattr(dbUtils, 'get_bucket_for_dn', lambda dn: calls.append(dn) or 'jans_clients')
+    monkeypatch.setattr(dbUtils, 'import_entry', lambda dn, entry, bucket=None, force=None, location=None: imported.append((dn, location)))
+    monkeypatch.setattr(dbUtils, 'entry_cache', EntryCache(), raising=False)
+
+    dbUtils.import_entries([add('inum=1,ou=clients,o=jans')])
+
+    assert calls == ['inum=1,ou=clients,o=jans', 'inum=1,ou=clients,o=jans']
+    assert imported == [('inum=1,ou=clients,o=jans', (BackendTypes.COUCHBASE, 'jans_clients'))]
+
+
+def test_import_state_per_instance():
+    other = DBUtils()
+    worker = dbUtils.get_import_worker(BackendTypes.COUCHBASE)
+
+    assert other.rdbm_bulk_rows is not dbUtils.rdbm_bulk_rows
+    assert other.dn_index is not dbUtils.dn_index
+    assert other.import_stats is not dbUtils.import_stats
+    # import workers collect their own bulk rows but share dn index and stats
+    assert worker.rdbm_bulk_rows is not dbUtils.rdbm_bulk_rows
+    assert worker.dn_index is dbUtils.dn_index
+    assert worker.import_stats is dbUtils.import_stats
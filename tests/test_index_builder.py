@@ -0,0 +1,37 @@
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.index_builder import IndexBuilder
+
+
+def test_normalize_pgsql_definitions():
+    builder = IndexBuilder(dbUtils, workers=1)
+
+    assert builder.normalize_definition('CREATE INDEX "jansClnt_expr_idx" ON public."jansClnt" USING btree ((("jansGrantTyp" ->> \'v\'::text)))') == \
+            builder.normalize_definition('(("jansGrantTyp"->>\'v\'))')
+    assert builder.normalize_definition('CREATE INDEX "jansPerson_rev_parent_dn_idx" ON public."jansPerson" USING btree (rev_parent_dn varchar_pattern_ops)') == \
+            builder.normalize_definition('"rev_parent_dn" varchar_pattern_ops')
+    assert builder.normalize_definition('CREATE INDEX "jansPerson_uid_idx" ON public."jansPerson" USING btree (uid)') != \
+            builder.normalize_definition('"mail"')
+
+
+def test_unnamed_pgsql_indexes_are_found(monkeypatch):
+    monkeypatch.setattr(Config, 'rdbm_type', 'pgsql')
+    builder = IndexBuilder(dbUtils, workers=1)
+
+    def get_existing_indexes():
+        builder.existing_definitions = set([
+            ('jansClnt', builder.normalize_definition('CREATE INDEX "jansClnt_expr_idx" ON public."jansClnt" USING btree ((("jansGrantTyp" ->> \'v\'::text)))')),
+            ])
+        return {('jansClnt', 'jansClnt_expr_idx'): True, ('jansClnt', 'jansClnt_dn_idx'): True}
+
+    monkeypatch.setattr(builder, 'get_existing_indexes', get_existing_indexes)
+    builder.add('jansClnt', 'jansClnt_dn_idx', '"dn"')
+    builder.add('jansClnt', 'jansClnt_jansGrantTyp_json_1', '(("jansGrantTyp"->>\'v\'))')
+    builder.add('jansClnt', 'jansClnt_displayName_idx', '"displayName"')
+
+    assert builder.get_missing_indexes() == [('jansClnt', 'jansClnt_displayName_idx', '"displayName"')]
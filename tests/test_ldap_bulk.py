@@ -0,0 +1,54 @@
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+
+
+class AsyncConnection:
+    """Server of async requests, an add fails with noSuchObject if parent was not processed yet"""
+
+    def __init__(self):
+        self.requests = {}
+        self.entries = set(['o=jans'])
+        self.events = []
+
+    def add(self, dn, attributes=None):
+        message_id = len(self.requests) + 1
+        self.requests[message_id] = dn
+        self.events.append(('add', dn))
+        return message_id
+
+    def get_response(self, message_id):
+        dn = self.requests[message_id]
+        self.events.append(('response', dn))
+        if dn.lower().split(',', 1)[1] not in self.entries:
+            return [], {'result': 32, 'description': 'noSuchObject', 'message': ''}
+        self.entries.add(dn.lower())
+        return [], {'result': 0, 'description': 'success', 'message': ''}
+
+    def unbind(self):
+        pass
+
+
+def test_parent_collected_before_child(monkeypatch):
+    conn = AsyncConnection()
+    monkeypatch.setattr(dbUtils, 'get_ldap_connection', lambda client_strategy=None: conn)
+    monkeypatch.setattr(dbUtils, 'ldap_bulk_conn', None)
+    monkeypatch.setattr(Config, 'ldap_bulk_window', 64)
+
+    dbUtils.ldap_bulk_add('ou=clients,o=jans', {'ou': ['clients']})
+    dbUtils.ldap_bulk_add('ou=people,o=jans', {'ou': ['people']})
+    # parent and child are in the same window
+    dbUtils.ldap_bulk_add('inum=1,ou=clients,o=jans', {'inum': ['1']})
+    dbUtils.ldap_bulk_add('inum=2,OU=Clients,o=jans', {'inum': ['2']})
+    result = dbUtils.ldap_bulk_result
+    dbUtils.ldap_bulk_flush()
+
+    assert conn.events.index(('response', 'ou=clients,o=jans')) < conn.events.index(('add', 'inum=1,ou=clients,o=jans'))
+    # siblings stay in the window together
+    assert conn.events.index(('add', 'inum=2,OU=Clients,o=jans')) < conn.events.index(('response', 'inum=1,ou=clients,o=jans'))
+    assert result['failed'] == []
+    assert result['added'] == 4
@@ -0,0 +1,187 @@
+import pytest
+import sqlalchemy
+import sqlalchemy.dialects.mysql
+import sqlalchemy.dialects.postgresql
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils import ldap_filter
+
+
+def compile_sql(clause, dialect):
+    return str(clause.compile(dialect=dialect))
+
+
+def get_table(rdbm_type):
+    json_type = sqlalchemy.dialects.mysql.JSON if rdbm_type == 'mysql' else sqlalchemy.dialects.postgresql.JSON
+    return sqlalchemy.Table(
+            'jansClnt',
+            sqlalchemy.MetaData(),
+            sqlalchemy.Column('doc_id', sqlalchemy.String(64), primary_key=True),
+            sqlalchemy.Column('displayName', sqlalchemy.String(64)),
+            sqlalchemy.Column('jansDefMaxAge', sqlalchemy.Integer),
+            sqlalchemy.Column('jansGrantTyp', json_type),
+            )
+
+
+def setup_rdbm(monkeypatch, rdbm_type):
+    monkeypatch.setattr(Config, 'rdbm_type', rdbm_type)
+    dbUtils.read_jans_schema()
+    monkeypatch.setattr(dbUtils, 'filter_compiler', ldap_filter.FilterCompiler(dbUtils), raising=False)
+
+
+@pytest.fixture
+def n1ql(monkeypatch):
+    setup_rdbm(monkeypatch, Config.rdbm_type)
+    return dbUtils.filter_compiler.n1ql_filter
+
+
+def test_extract_values():
+    template, values = ldap_filter.extract_values('(&(objectClass=jansClnt)(displayName=a\\28b\\29*c)(jansDefMaxAge>=10))')
+
+    assert template == '(&(objectClass=?)(displayName=?*?)(jansDefMaxAge>=?))'
+    assert values == ['jansClnt', 'a(b)', 'c', '10']
+
+
+def test_filter_without_parentheses():
+    template, values = ldap_filter.extract_values('uid=admin')
+
+    assert template == '(uid=?)'
+    assert values == ['admin']
+
+
+def test_parse_template():
+    tree = ldap_filter.parse_template('(&(objectClass=?)(|(uid=?*?)(mail=*))(!(jansStatus<=?)))')
+
+    assert tree == ('and', [
+            ('eq', 'objectClass', 0),
+            ('or', [('substr', 'uid', 1, [], 2), ('present', 'mail')]),
+            ('not', ('le', 'jansStatus', 3)),
+            ])
+
+
+def test_parse_template_substring():
+    assert ldap_filter.parse_template('(cn=*?*?*)') == ('substr', 'cn', None, [0, 1], None)
+
+
+def test_search_filter_object_class():
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(displayName=test))')
+
+    assert search_filter.object_class == 'jansClnt'
+    assert search_filter.residual_tree == ('and', [('eq', 'displayName', 1)])
+
+
+@pytest.mark.parametrize('search_filter', ['(cn=a(b)', '(&(cn=a)', '(cn=a))', '(cn=a)(sn=b)', '(cn)'])
+def test_invalid_filter(search_filter):
+    with pytest.raises(ldap_filter.FilterError):
+        ldap_filter.SearchFilter(search_filter)
+
+
+def test_template_cache_keeps_values():
+    first = ldap_filter.SearchFilter('(uid=admin)')
+    second = ldap_filter.SearchFilter('(uid=user)')
+
+    assert first.template == second.template
+    assert first.values == ['admin']
+    assert second.values == ['user']
+
+
+@pytest.mark.parametrize('rdbm_type', ['mysql', 'pgsql'])
+def test_sqlalchemy_filter(rdbm_type, monkeypatch):
+    setup_rdbm(monkeypatch, rdbm_type)
+    dialect = sqlalchemy.dialects.mysql.dialect() if rdbm_type == 'mysql' else sqlalchemy.dialects.postgresql.dialect()
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(displayName=test*)(jansDefMaxAge>=10))')
+
+    clause, params = dbUtils.filter_compiler.sqlalchemy_filter(search_filter, get_table(rdbm_type), rdbm_type)
+    sql = compile_sql(clause, dialect)
+
+    assert 'LIKE' in sql and 'ESCAPE' in sql
+    assert '>=' in sql
+    assert sorted(params.values(), key=str) == [10, 'test%']
+
+
+@pytest.mark.parametrize('rdbm_type', ['mysql', 'pgsql'])
+def test_sqlalchemy_filter_multivalued(rdbm_type, monkeypatch):
+    setup_rdbm(monkeypatch, rdbm_type)
+    dialect = sqlalchemy.dialects.mysql.dialect() if rdbm_type == 'mysql' else sqlalchemy.dialects.postgresql.dialect()
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(jansGrantTyp=refresh_token))')
+
+    clause, params = dbUtils.filter_compiler.sqlalchemy_filter(search_filter, get_table(rdbm_type), rdbm_type)
+    sql = compile_sql(clause, dialect)
+
+    if rdbm_type == 'mysql':
+        assert 'json_contains' in sql
+    else:
+        assert '@>' in sql
+    assert list(params.values()) == ['refresh_token']
+
+
+def test_sqlalchemy_filter_undefined_attribute(monkeypatch):
+    setup_rdbm(monkeypatch, 'mysql')
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(undefinedAttr=x))')
+
+    clause, params = dbUtils.filter_compiler.sqlalchemy_filter(search_filter, get_table('mysql'), 'mysql')
+
+    assert 'false' in compile_sql(clause, sqlalchemy.dialects.mysql.dialect()).lower()
+
+
+def test_spanner_filter(monkeypatch):
+    setup_rdbm(monkeypatch, 'spanner')
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(displayName=test)(jansDefMaxAge<=5)(jansGrantTyp=implicit)(exp>=20300101000000Z))')
+
+    clause, params = dbUtils.filter_compiler.spanner_filter(search_filter, 'jansClnt')
+
+    assert clause == '((`displayName` = @p0) AND (`jansDefMaxAge` <= @p1) AND (@p2 IN UNNEST(`jansGrantTyp`)) AND (`exp` >= TIMESTAMP(@p3)))'
+    assert params == {'p0': 'test', 'p1': 5, 'p2': 'implicit', 'p3': '2030-01-01T00:00:00Z'}
+
+
+def test_n1ql_filter_scalar(n1ql):
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansPerson)(uid=admin)(mail=*@example.com))')
+
+    clause, params = n1ql(search_filter)
+
+    # scalar predicates are served by GSI indexes of static/couchbase/index.json
+    assert clause == '((`objectClass` = $p0) AND (`uid` = $p1) AND (`mail` LIKE $p2))'
+    assert params == {'p0': 'jansPerson', 'p1': 'admin', 'p2': '%@example.com'}
+
+
+def test_n1ql_filter_multivalued(n1ql):
+    search_filter = ldap_filter.SearchFilter('(|(member=inum=1,ou=people,o=jans)(jansScope=inum=F0C4*))')
+
+    clause, params = n1ql(search_filter)
+
+    assert clause == '((ANY v IN TO_ARRAY(`member`) SATISFIES v = $p0 END) OR (ANY v IN TO_ARRAY(`jansScope`) SATISFIES v LIKE $p1 END))'
+    assert params == {'p0': 'inum=1,ou=people,o=jans', 'p1': 'inum=F0C4%'}
+
+
+def test_n1ql_filter_present_and_not(n1ql):
+    clause, params = n1ql(ldap_filter.SearchFilter('(&(uid=*)(!(jansStatus=inactive)))'))
+
+    assert clause == '((`uid` IS VALUED) AND (NOT (`jansStatus` = $p0)))'
+    assert params == {'p0': 'inactive'}
+
+
+@pytest.mark.parametrize('rdbm_type', ['mysql', 'pgsql'])
+def test_sqlalchemy_filter_multivalued_ordering(rdbm_type, monkeypatch):
+    setup_rdbm(monkeypatch, rdbm_type)
+    dialect = sqlalchemy.dialects.mysql.dialect() if rdbm_type == 'mysql' else sqlalchemy.dialects.postgresql.dialect()
+    search_filter = ldap_filter.SearchFilter('(&(objectClass=jansClnt)(jansGrantTyp>=b))')
+
+    clause, params = dbUtils.filter_compiler.sqlalchemy_filter(search_filter, get_table(rdbm_type), rdbm_type)
+    sql = compile_sql(clause, dialect)
+
+    # text of whole document {"v": ["a"]} sorts after "b", each element is compared instead
+    assert 'AS TEXT)' not in sql.upper()
+    assert 'EXISTS (SELECT 1' in sql
+    if rdbm_type == 'mysql':
+        assert "json_table(`jansClnt`.`jansGrantTyp`, '$.v[*]' COLUMNS (e TEXT PATH '$')) AS jt" in sql
+        assert 'jt.e >= ' in sql
+    else:
+        assert 'jsonb_array_elements_text(CAST("jansClnt"."jansGrantTyp" AS JSONB) -> ' in sql
+        assert 'e >= ' in sql
+    assert list(params.values()) == ['b']
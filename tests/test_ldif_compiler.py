@@ -0,0 +1,100 @@
+import os
+import tempfile
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+from setup_app.static import BackendTypes
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.ldif_compiler import LdifCompiler
+
+
+ldif_data = """dn: inum=1001,ou=clients,o=jans
+objectClass: top
+objectClass: jansClnt
+inum: 1001
+displayName: O'Reilly Client
+jansDefMaxAge: 10
+jansTrustedClnt: true
+exp: 20301231235959.000Z
+jansGrantTyp: authorization_code
+jansGrantTyp: refresh_token
+
+dn: inum=1002,ou=clients,o=jans
+objectClass: top
+objectClass: jansClnt
+inum: 1002
+displayName: 50% off Client
+
+dn: inum=1002,ou=clients,o=jans
+changetype: modify
+replace: jansTrustedClnt
+jansTrustedClnt: false
+"""
+
+
+def compile_ldif(monkeypatch, rdbm_type, backend_location):
+    output_dir = tempfile.mkdtemp()
+    ldif_fn = os.path.join(output_dir, 'clients.ldif')
+    with open(ldif_fn, 'w') as w:
+        w.write(ldif_data)
+
+    monkeypatch.setattr(Config, 'outputFolder', output_dir)
+    monkeypatch.setattr(Config, 'rdbm_type', rdbm_type)
+    monkeypatch.setattr(Config, 'mappingLocations', { group: 'rdbm' for group in Config.mappingLocations })
+    dbUtils.read_jans_schema()
+
+    compiler = LdifCompiler(dbUtils, backend_location)
+    compiler.compile([ldif_fn])
+
+    return list(compiler.iter_sql_statements())
+
+
+def test_compile_mysql_literals(monkeypatch):
+    statements = compile_ldif(monkeypatch, 'mysql', BackendTypes.MYSQL)
+
+    assert len(statements) == 1
+    sql_cmd = statements[0]
+
+    assert sql_cmd.startswith('INSERT IGNORE INTO `jansClnt`')
+    assert "'1001'" in sql_cmd and "'1002'" in sql_cmd
+    assert "'O''Reilly Client'" in sql_cmd
+    assert "'2030-12-31 23:59:59.00'" in sql_cmd
+    assert '{"v": ["authorization_code", "refresh_token"]}' in sql_cmd
+    # typed literals of first row, NULL of absent int column of second row
+    assert "'1001', 'inum=1001,ou=clients,o=jans'" in sql_cmd
+    assert ', 10, 1, ' in sql_cmd
+    assert 'NULL' in sql_cmd
+    # merged modify record
+    assert "'50% off Client', NULL, 0" in sql_cmd
+    assert '%%' not in sql_cmd
+
+
+def test_compile_pgsql_literals(monkeypatch):
+    statements = compile_ldif(monkeypatch, 'pgsql', BackendTypes.PGSQL)
+
+    assert len(statements) == 1
+    sql_cmd = statements[0]
+
+    assert sql_cmd.startswith('INSERT INTO "jansClnt"')
+    assert sql_cmd.endswith('ON CONFLICT DO NOTHING;')
+    assert "'O''Reilly Client'" in sql_cmd
+    assert "'2030-12-31 23:59:59.00'" in sql_cmd
+    assert ', 10, 1, ' in sql_cmd
+    assert "'50% off Client'" in sql_cmd
+    assert '%%' not in sql_cmd
+
+
+def test_content_hash_depends_on_mappings_and_partitions(monkeypatch):
+    compiler = LdifCompiler(dbUtils, BackendTypes.MYSQL)
+    content_hash = compiler.content_hash([])
+
+    monkeypatch.setattr(Config, 'mappingLocations', dict(Config.mappingLocations, user='rdbm' if Config.mappingLocations['user'] == 'ldap' else 'ldap'))
+    mapping_hash = compiler.content_hash([])
+    monkeypatch.setattr(Config, 'rdbm_partition', not Config.rdbm_partition)
+    partition_hash = compiler.content_hash([])
+
+    assert len(set([content_hash, mapping_hash, partition_hash])) == 3
@@ -0,0 +1,113 @@
+import datetime
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.partitions import TablePartitioner
+
+
+def get_partitioner(monkeypatch, rdbm_type, days=1, ahead=2, keep_days=3):
+    monkeypatch.setattr(Config, 'rdbm_type', rdbm_type)
+    monkeypatch.setattr(Config, 'rdbm_partition', True)
+    monkeypatch.setattr(Config, 'rdbm_partition_days', days)
+    monkeypatch.setattr(Config, 'rdbm_partition_ahead', ahead)
+    monkeypatch.setattr(Config, 'rdbm_partition_keep_days', keep_days)
+    return TablePartitioner(dbUtils)
+
+
+def test_ranges_aligned_to_epoch(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'mysql', days=7, ahead=14)
+    ranges = partitioner.get_ranges()
+    today = datetime.datetime.utcnow().date()
+    epoch = datetime.date(1970, 1, 1)
+
+    assert ranges[0][0] <= today < ranges[0][1]
+    assert ranges[-1][0] <= today + datetime.timedelta(days=14) < ranges[-1][1]
+    for start, end in ranges:
+        assert (start - epoch).days % 7 == 0
+        assert (end - start).days == 7
+
+
+def test_mysql_table_clause(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'mysql')
+    clause = partitioner.get_table_clause('jansToken')
+
+    assert clause.startswith('PARTITION BY RANGE COLUMNS(`exp`)')
+    assert clause.endswith('PARTITION pmax VALUES LESS THAN (MAXVALUE))')
+    assert clause.count('VALUES LESS THAN') == len(partitioner.get_ranges()) + 1
+
+
+def test_pgsql_partitions_ddl(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'pgsql')
+    ddl = partitioner.get_partitions_ddl('jansToken')
+    start = partitioner.get_ranges()[0][0]
+
+    assert partitioner.get_table_clause('jansToken') == 'PARTITION BY RANGE ("exp")'
+    assert ddl[0] == 'CREATE TABLE "jansToken_default" PARTITION OF "jansToken" DEFAULT;'
+    assert 'CREATE TABLE IF NOT EXISTS "jansToken_p{}" PARTITION OF "jansToken" FOR VALUES FROM (\'{}\')'.format(
+                start.strftime('%Y%m%d'), start.isoformat()) in ddl[1]
+    assert len(ddl) == len(partitioner.get_ranges()) + 1
+
+
+def test_pgsql_roll_forward_moves_default_rows(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'pgsql')
+    today = datetime.datetime.utcnow().date()
+    expired = today - datetime.timedelta(days=10)
+    partitions = {
+        'jansToken_default': None,
+        'jansToken_p' + expired.strftime('%Y%m%d'): expired,
+        'jansToken_p' + today.strftime('%Y%m%d'): today,
+        }
+
+    ddl = partitioner.get_roll_forward_ddl('jansToken', partitions)
+    kinds = [ sql_cmd.split()[0] for sql_cmd in ddl ]
+
+    assert ddl[0] == 'ALTER TABLE "jansToken" DETACH PARTITION "jansToken_default";'
+    assert kinds == ['ALTER', 'CREATE', 'CREATE', 'INSERT', 'DELETE', 'ALTER', 'DROP']
+    assert ddl[3].startswith('INSERT INTO "jansToken" SELECT * FROM "jansToken_default" WHERE "exp" >= \'{}\''.format(
+                (today + datetime.timedelta(days=1)).isoformat()))
+    assert ddl[5] == 'ALTER TABLE "jansToken" ATTACH PARTITION "jansToken_default" DEFAULT;'
+    assert ddl[6] == 'DROP TABLE IF EXISTS "jansToken_p{}";'.format(expired.strftime('%Y%m%d'))
+
+
+def test_pgsql_roll_forward_up_to_date(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'pgsql')
+    last = partitioner.get_ranges()[-1][0]
+
+    ddl = partitioner.get_roll_forward_ddl('jansToken', {'jansToken_default': None, 'jansToken_p' + last.strftime('%Y%m%d'): last})
+
+    assert ddl == []
+
+
+def test_mysql_roll_forward(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'mysql')
+    today = datetime.datetime.utcnow().date()
+    expired = today - datetime.timedelta(days=10)
+    partitions = {
+        'p' + expired.strftime('%Y%m%d'): expired,
+        'p' + today.strftime('%Y%m%d'): today,
+        'pmax': None,
+        }
+
+    ddl = partitioner.get_roll_forward_ddl('jansToken', partitions)
+
+    assert len(ddl) == 2
+    assert ddl[0].startswith('ALTER TABLE `jansToken` REORGANIZE PARTITION pmax INTO (')
+    assert ddl[0].endswith('PARTITION pmax VALUES LESS THAN (MAXVALUE));')
+    assert ddl[1] == 'ALTER TABLE `jansToken` DROP PARTITION p{};'.format(expired.strftime('%Y%m%d'))
+
+
+def test_check_row(monkeypatch):
+    partitioner = get_partitioner(monkeypatch, 'mysql')
+    dn = 'tknCde=1,ou=tokens,o=jans'
+
+    assert partitioner.check_row('jansToken', dn, {'tknCde': ['1']}) is False
+    assert partitioner.check_row('jansToken', dn, {'tknCde': ['1'], 'exp': ['20301231235959.000Z']}) is True
+    assert partitioner.check_row('jansClnt', dn, {'inum': ['1']}) is True
+
+    monkeypatch.setattr(Config, 'rdbm_partition', False)
+    assert partitioner.check_row('jansToken', dn, {'tknCde': ['1']}) is True
@@ -0,0 +1,59 @@
+import ldap3
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.table_catalog import TableCatalog
+
+
+def compile_clause(clause):
+    dialect = sqlalchemy.dialects.postgresql.dialect(paramstyle='named')
+    dialect._backslash_escapes = False
+    return str(clause.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+
+def get_table(*columns):
+    return sqlalchemy.table('jansClnt', *[ sqlalchemy.column(column, sqlalchemy.String) for column in columns ])
+
+
+def set_catalog(monkeypatch, tables):
+    catalog = TableCatalog(dbUtils)
+    catalog.tables = tables
+    monkeypatch.setattr(dbUtils, 'table_catalog', catalog, raising=False)
+
+
+def test_rdbm_level_scope():
+    sql = compile_clause(dbUtils.get_rdbm_scope_clause(get_table('dn', 'rev_parent_dn'), 'ou=clients,o=jans', ldap3.LEVEL))
+
+    assert sql == "\"jansClnt\".rev_parent_dn = 'o=jans,ou=clients' OR \"jansClnt\".rev_parent_dn IS NULL AND \"jansClnt\".dn LIKE '%,ou=clients,o=jans' ESCAPE '\\'"
+
+
+def test_rdbm_scope_without_column():
+    sql = compile_clause(dbUtils.get_rdbm_scope_clause(get_table('dn'), 'ou=clients,o=jans', ldap3.LEVEL))
+
+    assert sql == "\"jansClnt\".dn LIKE '%ou=clients,o=jans'"
+
+
+def test_spanner_level_scope(monkeypatch):
+    set_catalog(monkeypatch, {'jansClnt': ['doc_id', 'dn', 'rev_parent_dn']})
+    params = {}
+
+    clause = dbUtils.get_spanner_scope_clause('ou=clients,o=jans', ldap3.LEVEL, params, 'jansClnt')
+
+    assert clause == '(rev_parent_dn = @rev_base OR (rev_parent_dn IS NULL AND ENDS_WITH(dn, @search_base_suffix)))'
+    assert params == {'rev_base': 'o=jans,ou=clients', 'search_base_suffix': ',ou=clients,o=jans'}
+
+
+def test_spanner_scope_without_column(monkeypatch):
+    set_catalog(monkeypatch, {'jansClnt': ['doc_id', 'dn']})
+
+    for search_scope in (ldap3.LEVEL, ldap3.SUBTREE):
+        params = {}
+        assert dbUtils.get_spanner_scope_clause('ou=clients,o=jans', search_scope, params, 'jansClnt') == 'dn LIKE @search_base'
+        assert params == {'search_base': '%ou=clients,o=jans'}
@@ -0,0 +1,90 @@
+import os
+import atexit
+import pickle
+
+import sqlalchemy
+import sqlalchemy.dialects.postgresql
+
+from setup_app import paths
+from setup_app.utils import base
+from setup_app.config import Config
+
+Config.init(paths.INSTALL_DIR)
+
+from setup_app.utils.db_utils import dbUtils
+from setup_app.utils.table_catalog import TableCatalog
+from setup_app.utils import table_reflector
+
+
+def test_catalog_tables_without_reflection(monkeypatch):
+    catalog = TableCatalog(dbUtils)
+    catalog.tables = {
+        'jansClnt': ['doc_id', 'objectClass', 'dn', 'rev_parent_dn'],
+        'jansPerson': ['doc_id', 'objectClass', 'dn'],
+        'jansStatEntry': ['id', 'dat'],
+        }
+    monkeypatch.setattr(dbUtils, 'table_catalog', catalog, raising=False)
+
+    assert [ table.name for table in dbUtils.get_catalog_tables('doc_id', 'dn') ] == ['jansClnt', 'jansPerson']
+
+    tables = dbUtils.get_catalog_tables('doc_id', 'dn', 'rev_parent_dn')
+    assert [ table.name for table in tables ] == ['jansClnt']
+
+    sql = str(sqlalchemy.select([tables[0].columns.doc_id]).where(tables[0].columns.rev_parent_dn == None).compile(dialect=sqlalchemy.dialects.postgresql.dialect()))
+    assert sql == 'SELECT "jansClnt".doc_id \nFROM "jansClnt" \nWHERE "jansClnt".rev_parent_dn IS NULL'
+
+
+class VersionCatalog:
+
+    def __init__(self, versions):
+        self.versions = versions
+
+    def get_versions(self):
+        return dict(self.versions)
+
+
+def test_cache_saved_once_at_exit(tmpdir, monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, 'register', registered.append)
+
+    cache_fn = str(tmpdir.join('tables.pickle'))
+    engine = sqlalchemy.create_engine('sqlite:///' + str(tmpdir.join('jans.db')))
+    engine.execute('CREATE TABLE "jansClnt" (doc_id VARCHAR(64) PRIMARY KEY, dn VARCHAR(128))')
+
+    reflectors = [ table_reflector.TableReflector(engine, sqlalchemy.MetaData(), cache_fn, VersionCatalog({'jansClnt': 'v1'})) for i in range(3) ]
+    reflectors[0].classes['jansClnt']
+
+    assert registered == []
+    assert all(reflector in table_reflector.reflectors for reflector in reflectors)
+    assert not os.path.exists(cache_fn)
+
+    table_reflector.save_caches()
+    with open(cache_fn, 'rb') as f:
+        cache = pickle.load(f)
+
+    assert cache['tables'] == {'jansClnt': 'v1'}
+    assert list(cache['metadata'].tables['jansClnt'].columns.keys()) == ['doc_id', 'dn']
+
+    # nothing changed since, cache is not written again
+    os.utime(cache_fn, (0, 0))
+    table_reflector.save_caches()
+    assert os.stat(cache_fn).st_mtime == 0
+
+    # unchanged table is mapped from cache without reflection
+    cached = table_reflector.TableReflector(None, sqlalchemy.MetaData(), cache_fn, VersionCatalog({'jansClnt': 'v1'}))
+    assert list(cached.classes['jansClnt'].__table__.columns.keys()) == ['doc_id', 'dn']
+    assert cached.cache_changed is False
+
+    # changed column hash of catalog reflects table again
+    engine.execute('ALTER TABLE "jansClnt" ADD COLUMN "displayName" VARCHAR(64)')
+    altered = table_reflector.TableReflector(engine, sqlalchemy.MetaData(), cache_fn, VersionCatalog({'jansClnt': 'v2'}))
+    assert list(altered.classes['jansClnt'].__table__.columns.keys()) == ['doc_id', 'dn', 'displayName']
+    assert altered.cache_changed is True
+
+    table_reflector.save_caches()
+    with open(cache_fn, 'rb') as f:
+        cache = pickle.load(f)
+
+    assert os.stat(cache_fn).st_mtime > 0
+    assert cache['tables'] == {'jansClnt': 'v2'}
+    assert 'displayName' in cache['metadata'].tables['jansClnt'].columns